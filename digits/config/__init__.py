@@ -7,8 +7,12 @@ option_list = {}
 from . import (  # noqa
     caffe,
     gpu_list,
+    image_cache,
+    inference_workers,
+    job_loading,
     jobs_dir,
     log_file,
+    net_cache,
     torch,
     server_name,
     store_option,
@@ -0,0 +1,54 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+
+from . import option_list
+
+
+def load_image_cache_dir():
+    """
+    Return the configured image cache directory or None (no cache)
+    Throws an exception if the directory is invalid
+    """
+    if 'DIGITS_MODE_TEST' in os.environ or 'DIGITS_IMAGE_CACHE_DIR' not in os.environ:
+        return None
+
+    value = os.environ['DIGITS_IMAGE_CACHE_DIR']
+    try:
+        value = os.path.abspath(value)
+        if os.path.exists(value):
+            if not os.path.isdir(value):
+                raise IOError('No such directory: "%s"' % value)
+            if not os.access(value, os.W_OK):
+                raise IOError('Permission denied: "%s"' % value)
+        if not os.path.exists(value):
+            os.makedirs(value)
+    except (IOError, OSError):
+        print '"%s" is not a valid value for image_cache_dir.' % value
+        print 'Set the envvar DIGITS_IMAGE_CACHE_DIR to fix your configuration.'
+        raise
+    return value
+
+
+def load_image_cache_size():
+    """
+    Return the configured image cache size cap (in MB) or None (default)
+    """
+    if 'DIGITS_IMAGE_CACHE_SIZE' not in os.environ:
+        return None
+    try:
+        value = int(os.environ['DIGITS_IMAGE_CACHE_SIZE'])
+        if value <= 0:
+            raise ValueError('must be positive')
+    except ValueError:
+        print '"%s" is not a valid value for image_cache_size.' % os.environ['DIGITS_IMAGE_CACHE_SIZE']
+        print 'Set the envvar DIGITS_IMAGE_CACHE_SIZE to fix your configuration.'
+        raise
+    return value
+
+
+option_list['image_cache'] = {
+    'dir': load_image_cache_dir(),
+    'size': load_image_cache_size(),
+}
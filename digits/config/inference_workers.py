@@ -0,0 +1,38 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+
+from . import option_list
+
+
+def load_int(name, default):
+    """
+    Return the integer value of an envvar, or default if it isn't set
+    """
+    if name not in os.environ:
+        return default
+    try:
+        return int(os.environ[name])
+    except ValueError:
+        print '"%s" is not a valid value for %s.' % (os.environ[name], name)
+        raise
+
+
+if 'DIGITS_MODE_TEST' in os.environ:
+    enabled = False
+else:
+    enabled = os.environ.get('DIGITS_INFERENCE_WORKERS', '').strip().lower() in ['1', 'true', 'yes', 'on']
+
+option_list['inference_workers'] = {
+    'enabled': enabled,
+    # in seconds
+    'idle_timeout': load_int('DIGITS_INFERENCE_WORKER_IDLE_TIMEOUT', 600),
+    # in MB
+    'memory_budget': load_int('DIGITS_INFERENCE_WORKER_MEMORY', 4096),
+    'gpu': load_int('DIGITS_INFERENCE_WORKER_GPU', None),
+    'max_batch_size': load_int('DIGITS_INFERENCE_MAX_BATCH_SIZE', 16),
+    # in milliseconds
+    'max_batch_wait': load_int('DIGITS_INFERENCE_MAX_BATCH_WAIT', 10),
+    'max_request_size': load_int('DIGITS_INFERENCE_MAX_REQUEST_SIZE', 256),
+}
@@ -0,0 +1,34 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+
+from . import option_list
+
+
+def load_job_loading_threads():
+    """
+    Return the number of threads reading job files at startup
+    """
+    if 'DIGITS_JOB_LOADING_THREADS' not in os.environ:
+        return 8
+    try:
+        value = int(os.environ['DIGITS_JOB_LOADING_THREADS'])
+        if value <= 0:
+            raise ValueError('must be positive')
+    except ValueError:
+        print '"%s" is not a valid value for job_loading_threads.' % os.environ['DIGITS_JOB_LOADING_THREADS']
+        print 'Set the envvar DIGITS_JOB_LOADING_THREADS to fix your configuration.'
+        raise
+    return value
+
+
+if 'DIGITS_MODE_TEST' in os.environ:
+    lazy = False
+else:
+    lazy = os.environ.get('DIGITS_LAZY_JOB_LOADING', '').strip().lower() in ['1', 'true', 'yes', 'on']
+
+option_list['job_loading'] = {
+    'lazy': lazy,
+    'threads': load_job_loading_threads(),
+}
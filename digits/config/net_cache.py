@@ -0,0 +1,28 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+
+from . import option_list
+
+
+def load_net_cache_size():
+    """
+    Return the configured size cap for loaded Caffe nets (in MB)
+    """
+    if 'DIGITS_NET_CACHE_SIZE' not in os.environ:
+        return 2048
+    try:
+        value = int(os.environ['DIGITS_NET_CACHE_SIZE'])
+        if value <= 0:
+            raise ValueError('must be positive')
+    except ValueError:
+        print '"%s" is not a valid value for net_cache_size.' % os.environ['DIGITS_NET_CACHE_SIZE']
+        print 'Set the envvar DIGITS_NET_CACHE_SIZE to fix your configuration.'
+        raise
+    return value
+
+
+option_list['net_cache'] = {
+    'size': load_net_cache_size(),
+}
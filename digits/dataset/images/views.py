@@ -25,7 +25,6 @@ def resize_example():
     """
     try:
         example_image_path = os.path.join(os.path.dirname(digits.__file__), 'static', 'images', 'mona_lisa.jpg')
-        image = utils.image.load_image(example_image_path)
 
         width = int(flask.request.form['width'])
         height = int(flask.request.form['height'])
@@ -34,6 +33,8 @@ def resize_example():
         backend = flask.request.form['backend']
         encoding = flask.request.form['encoding']
 
+        # decode the same way create_db does
+        image = utils.image.load_image(example_image_path, size_hint=(height, width))
         image = utils.image.resize_image(image, height, width,
                                          channels=channels,
                                          resize_mode=resize_mode,
@@ -62,6 +62,7 @@ class CreateDbTask(Task):
 
         self.entries_count = None
         self.entries_error = None
+        self.write_throughput = None
         self.distribution = None
         self.create_db_log_file = "create_%s.log" % db_name
 
@@ -100,6 +101,9 @@ class CreateDbTask(Task):
         if not hasattr(self, 'compression') or self.compression is None:
             self.compression = 'none'
 
+        if not hasattr(self, 'write_throughput'):
+            self.write_throughput = None
+
         if not hasattr(self, 'entries_error'):
             self.entries_error = 0
             for key in self.distribution.keys():
@@ -175,6 +179,11 @@ class CreateDbTask(Task):
             args.append('--hdf5_dset_limit=%d' % 2**31)
         if self.delete_files:
             args.append('--delete_files')
+        image_cache = digits.config.config_value('image_cache')
+        if image_cache['dir']:
+            args.append('--image_cache_dir=%s' % image_cache['dir'])
+            if image_cache['size']:
+                args.append('--image_cache_size=%d' % image_cache['size'])
 
         return args
 
@@ -225,6 +234,13 @@ class CreateDbTask(Task):
             self.logger.debug(message)
             return True
 
+        # write throughput (MB/s)
+        match = re.match(r'Committed .* \(([\d\.]+) MB/s\)', message)
+        if match:
+            self.write_throughput = float(match.group(1))
+            self.logger.debug(message)
+            return True
+
         if level == 'warning':
             self.logger.warning('%s: %s' % (self.name(), message))
             return True
@@ -0,0 +1,156 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import deque, OrderedDict
+import logging
+import Queue
+import threading
+import time
+
+import numpy as np
+
+from .errors import InferenceWorkerError
+
+logger = logging.getLogger('digits.inference.batcher')
+
+# How many recent requests/batches the statistics are computed over
+STATS_WINDOW = 1000
+
+
+class _Request(object):
+    """
+    One image waiting to be batched
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RequestBatcher(object):
+    """
+    Coalesces concurrent single-image requests into batches
+
+    The first request of a batch waits at most max_wait seconds for others
+    to join it. The batch is then passed to infer() in one call and each
+    caller gets back its own slice of the results
+    """
+
+    def __init__(self, infer, max_batch_size=16, max_wait=0.01):
+        """
+        Arguments:
+        infer -- a function taking a list of images and returning
+            (inputs, outputs) like InferenceJob.get_data()
+
+        Keyword arguments:
+        max_batch_size -- the most images to run in one batch
+        max_wait -- how long to wait for a batch to fill up, in seconds
+        """
+        if max_batch_size < 1:
+            raise ValueError('invalid max_batch_size')
+        self._infer = infer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.batch_sizes = deque(maxlen=STATS_WINDOW)
+        self.requests = 0
+
+    def infer_one(self, image):
+        """
+        Run inference on one image as part of a batch
+        Returns (inputs, outputs) like InferenceJob.get_data()
+        Raises InferenceWorkerError
+        """
+        start = time.time()
+        request = _Request(image)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._batch_thread)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(request)
+        request.done.wait()
+
+        self.latencies.append(time.time() - start)
+        self.requests += 1
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self):
+        """
+        Returns a dict of statistics over the recent requests:
+        requests -- total number of requests
+        latency_p50, latency_p99 -- request latency percentiles in seconds
+        batch_size -- average batch size
+        """
+        latencies = list(self.latencies)
+        batch_sizes = list(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'latency_p50': float(np.percentile(latencies, 50)) if latencies else None,
+            'latency_p99': float(np.percentile(latencies, 99)) if latencies else None,
+            'batch_size': float(np.mean(batch_sizes)) if batch_sizes else None,
+        }
+
+    def stop(self):
+        """
+        Stop the batching thread once the queued requests are done
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread = None
+
+    def _batch_thread(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                if request is None:
+                    # finish this batch first
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        self.batch_sizes.append(len(batch))
+        try:
+            inputs, outputs = self._infer([r.image for r in batch])
+        except Exception as e:
+            if not isinstance(e, InferenceWorkerError):
+                logger.exception('Batch inference failed')
+                e = InferenceWorkerError('%s: %s' % (type(e).__name__, e))
+            for r in batch:
+                r.error = e
+                r.done.set()
+            return
+
+        # fan the results back out (inputs['ids'] are indices into the batch)
+        for position, index in enumerate(inputs['ids']):
+            r = batch[index]
+            r.result = (
+                {'ids': [0], 'data': None if inputs['data'] is None else [inputs['data'][position]]},
+                OrderedDict((name, data[position:position + 1]) for name, data in outputs.items()),
+            )
+        for r in batch:
+            if r.result is None:
+                r.error = InferenceWorkerError('Unable to load image "%s"' % r.image)
+            r.done.set()
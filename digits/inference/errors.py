@@ -21,3 +21,17 @@ class InferenceError(Error):
     @override
     def __str__(self):
         return repr(self.message)
+
+
+@subclass
+class InferenceWorkerError(Error):
+    """
+    Errors that occur while talking to an inference worker
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    @override
+    def __str__(self):
+        return repr(self.message)
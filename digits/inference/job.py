@@ -13,13 +13,21 @@ class InferenceJob(Job):
     A Job that exercises the forward pass of a neural network
     """
 
-    def __init__(self, model, images, epoch, layers, resize=True, **kwargs):
+    def __init__(self, model, images, epoch, layers, resize=True, chunk_size=None, inputs='all',
+                 chunk_results=False, **kwargs):
         """
         Arguments:
         model   -- job object associated with model to perform inference on
         images  -- list of image paths to perform inference on
         epoch   -- epoch of model snapshot to use
         layers  -- layers to import ('all' or 'none')
+
+        Keyword arguments:
+        chunk_size -- load and infer this many images at a time (default: tools/inference.py's)
+        inputs -- input images to return from get_data() ('all', 'lazy' or 'none')
+            with 'lazy', read them with get_input_data() before deleting the job
+        chunk_results -- make the results for each chunk available with
+            get_chunk_results() as soon as it is inferred
         """
         super(InferenceJob, self).__init__(persistent=False, **kwargs)
 
@@ -40,6 +48,9 @@ class InferenceJob(Job):
             epoch=epoch,
             layers=layers,
             resize=resize,
+            chunk_size=chunk_size,
+            inputs=inputs,
+            chunk_results=chunk_results,
         ))
 
     @override
@@ -63,3 +74,11 @@ class InferenceJob(Job):
         """Return inference data"""
         task = self.inference_task()
         return task.inference_inputs, task.inference_outputs, task.inference_layers
+
+    def get_chunk_results(self, start=0):
+        """Return [(inputs, outputs),...] for the chunks done after the first start ones"""
+        return self.inference_task().get_chunk_results(start)
+
+    def get_input_data(self, indices):
+        """Return the input images at the given positions in the inputs"""
+        return self.inference_task().get_input_data(indices)
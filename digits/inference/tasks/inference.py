@@ -4,6 +4,7 @@ from __future__ import absolute_import
 import base64
 from collections import OrderedDict
 import h5py
+import numpy as np
 import os.path
 import tempfile
 import re
@@ -21,13 +22,22 @@ class InferenceTask(Task):
     A task for inference jobs
     """
 
-    def __init__(self, model, images, epoch, layers, resize, **kwargs):
+    def __init__(self, model, images, epoch, layers, resize, chunk_size=None, inputs='all',
+                 chunk_results=False, **kwargs):
         """
         Arguments:
         model  -- trained model to perform inference on
         images -- list of images to perform inference on, or path to a database
         epoch  -- model snapshot to use
         layers -- which layers to visualize (by default only the activations of the last layer)
+
+        Keyword arguments:
+        chunk_size -- load and infer this many images at a time (default: tools/inference.py's)
+        inputs -- which input images to keep ('all', 'lazy' or 'none')
+            'lazy' inputs are saved compressed and read with get_input_data()
+            'none' only keeps the input ids
+        chunk_results -- also save the results for each chunk as soon as it
+            is inferred, to read them with get_chunk_results()
         """
         # memorize parameters
         self.model = model
@@ -35,6 +45,9 @@ class InferenceTask(Task):
         self.epoch = epoch
         self.layers = layers
         self.resize = resize
+        self.chunk_size = chunk_size
+        self.inputs = inputs
+        self.chunk_results = chunk_results
 
         self.image_list_path = None
         self.inference_log_file = "inference.log"
@@ -47,6 +60,8 @@ class InferenceTask(Task):
         self.inference_inputs = None
         self.inference_outputs = None
         self.inference_layers = []
+        # files with the results for each chunk, in order
+        self.chunk_result_files = []
 
         super(InferenceTask, self).__init__(**kwargs)
 
@@ -91,6 +106,11 @@ class InferenceTask(Task):
         match = re.match(r'Processed (\d+)\/(\d+)', message)
         if match:
             self.progress = float(match.group(1)) / int(match.group(2))
+            # path to the results for this chunk
+            match = re.search(r', results in (.*)', message)
+            if match:
+                self.chunk_result_files.append(match.group(1).strip())
+            self.emit_progress_update()
             return True
 
         # path to inference data
@@ -110,14 +130,17 @@ class InferenceTask(Task):
         outputs = OrderedDict()
         if self.inference_data_filename is not None:
             # the HDF5 database contains:
-            # - input images, in a dataset "/inputs"
+            # - input ids, in a dataset "/input_ids"
+            # - input images (unless inputs is 'none'), in a dataset "/input_data"
             # - all network outputs, in a group "/outputs/"
             # - layer activations and weights, if requested, in a group "/layers/"
             db = h5py.File(self.inference_data_filename, 'r')
 
             # collect paths and data
             input_ids = db['input_ids'][...]
-            input_data = db['input_data'][...]
+            input_data = None
+            if self.inputs == 'all':
+                input_data = db['input_data'][...]
 
             # collect outputs
             o = []
@@ -165,6 +188,38 @@ class InferenceTask(Task):
             self.inference_layers = visualizations
         self.inference_log.close()
 
+    def get_input_data(self, indices):
+        """
+        Returns the input images at the given positions in the inputs
+        (read from the inference data, which must still exist)
+        """
+        if self.inference_data_filename is None:
+            return None
+        indices = np.asarray(indices, dtype=int)
+        # HDF5 selections must be increasing
+        unique, inverse = np.unique(indices, return_inverse=True)
+        with h5py.File(self.inference_data_filename, 'r') as db:
+            data = db['input_data'][list(unique)]
+        return data[inverse]
+
+    def get_chunk_results(self, start=0):
+        """
+        Returns [(inputs, outputs),...] for the chunks done so far, after
+        the first start ones, like get_data() with inputs='none'
+        (only with chunk_results)
+        """
+        results = []
+        for path in self.chunk_result_files[start:]:
+            chunk = np.load(path)
+            try:
+                outputs = OrderedDict()
+                for output_id, output_name in enumerate(chunk['output_names'].tolist()):
+                    outputs[output_name] = chunk['output_%d' % output_id]
+                results.append(({'ids': chunk['input_ids'], 'data': None}, outputs))
+            finally:
+                chunk.close()
+        return results
+
     @override
     def offer_resources(self, resources):
         reserved_resources = {}
@@ -214,4 +269,21 @@ class InferenceTask(Task):
         if not self.resize:
             args.append('--no-resize')
 
+        if self.chunk_size:
+            args.append('--chunk_size=%d' % self.chunk_size)
+
+        if self.inputs == 'lazy':
+            args.append('--input_data=compressed')
+        elif self.inputs == 'none':
+            args.append('--input_data=none')
+
+        if self.chunk_results:
+            args.append('--chunk_results')
+
+        image_cache = digits.config.config_value('image_cache')
+        if image_cache['dir']:
+            args.append('--image_cache_dir=%s' % image_cache['dir'])
+            if image_cache['size']:
+                args.append('--image_cache_size=%d' % image_cache['size'])
+
         return args
@@ -0,0 +1,109 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import threading
+
+from nose.tools import assert_raises
+import numpy as np
+
+from . import batcher
+from .errors import InferenceWorkerError
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class FakeInfer(object):
+    """
+    Returns each image's number as its output, skipping "bad" images
+    Blocks until released, so that requests queue up behind a batch
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+
+    def __call__(self, images):
+        self.release.wait()
+        self.batches.append(list(images))
+        ids = [i for i, image in enumerate(images) if image != 'bad']
+        data = [np.array([int(images[i])]) for i in ids]
+        return {'ids': ids, 'data': data}, OrderedDict([('out', np.array([[int(images[i])] for i in ids]))])
+
+
+class TestRequestBatcher():
+
+    def run_requests(self, b, images):
+        results = [None] * len(images)
+
+        def request(i):
+            try:
+                results[i] = b.infer_one(images[i])
+            except InferenceWorkerError as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in xrange(len(images))]
+        for t in threads:
+            t.start()
+        return threads, results
+
+    def test_batches(self):
+        infer = FakeInfer()
+        b = batcher.RequestBatcher(infer, max_batch_size=4, max_wait=1)
+        threads, results = self.run_requests(b, [str(i) for i in xrange(10)])
+        infer.release.set()
+        for t in threads:
+            t.join()
+        b.stop()
+
+        assert sum(len(batch) for batch in infer.batches) == 10
+        assert max(len(batch) for batch in infer.batches) <= 4
+        # requests queued up behind the first one were batched
+        assert len(infer.batches) < 10
+        for i, (inputs, outputs) in enumerate(results):
+            assert inputs['ids'] == [0]
+            assert np.array_equal(inputs['data'][0], [i])
+            assert outputs.keys() == ['out']
+            assert np.array_equal(outputs['out'], [[i]])
+
+        stats = b.stats()
+        assert stats['requests'] == 10
+        assert stats['batch_size'] == 10.0 / len(infer.batches)
+        assert 0 <= stats['latency_p50'] <= stats['latency_p99']
+
+    def test_max_batch_size_one(self):
+        infer = FakeInfer()
+        infer.release.set()
+        b = batcher.RequestBatcher(infer, max_batch_size=1, max_wait=1)
+        threads, results = self.run_requests(b, ['1', '2', '3'])
+        for t in threads:
+            t.join()
+        b.stop()
+        assert [len(batch) for batch in infer.batches] == [1, 1, 1]
+
+    def test_bad_image(self):
+        infer = FakeInfer()
+        b = batcher.RequestBatcher(infer, max_batch_size=2, max_wait=1)
+        threads, results = self.run_requests(b, ['1', 'bad'])
+        infer.release.set()
+        for t in threads:
+            t.join()
+        b.stop()
+        assert len(infer.batches) == 1
+        assert np.array_equal(results[0][1]['out'], [[1]])
+        assert isinstance(results[1], InferenceWorkerError)
+
+    def test_error(self):
+        def infer(images):
+            raise InferenceWorkerError('worker died')
+        b = batcher.RequestBatcher(infer)
+        assert_raises(InferenceWorkerError, b.infer_one, '1')
+        b.stop()
+
+    def test_no_stats(self):
+        stats = batcher.RequestBatcher(FakeInfer()).stats()
+        assert stats['requests'] == 0
+        assert stats['latency_p50'] is None
+        assert stats['batch_size'] is None
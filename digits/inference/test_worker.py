@@ -0,0 +1,170 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import socket
+import threading
+import time
+
+import mock
+from nose.tools import assert_raises
+import numpy as np
+
+from . import worker
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestMessages():
+
+    def test_round_trip(self):
+        for obj in [
+                None,
+                {'images': ['/a.png', '/b.png'], 'resize': True},
+                OrderedDict([('prob', np.random.rand(3, 10).astype(np.float32))]),
+                'x' * (3 << 20),
+        ]:
+            yield self.check_round_trip, obj
+
+    def check_round_trip(self, obj):
+        a, b = socket.socketpair()
+        try:
+            # large messages don't fit in the socket buffer
+            t = threading.Thread(target=worker.send_message, args=(a, obj))
+            t.start()
+            received = worker.recv_message(b)
+            t.join()
+        finally:
+            a.close()
+            b.close()
+        if isinstance(obj, OrderedDict):
+            assert received.keys() == obj.keys()
+            assert np.array_equal(received['prob'], obj['prob'])
+        else:
+            assert received == obj
+
+    def test_closed(self):
+        a, b = socket.socketpair()
+        a.sendall(worker.HEADER.pack(100) + 'short')
+        a.close()
+        assert_raises(EOFError, worker.recv_message, b)
+        b.close()
+
+
+class FakeWorker(object):
+
+    def __init__(self, model_id, epoch, gpu=None):
+        self.model_id = model_id
+        self.epoch = epoch
+        self.last_used = time.time()
+        self.memory = 100
+        self.stopped = False
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def infer(self, images, resize=True, input_data=False):
+        self.last_used = time.time()
+        self.requests.append(list(images))
+        # images named "bad" can't be loaded
+        ids = [idx for idx, image in enumerate(images) if image != 'bad']
+        return {'ids': ids, 'data': [images[idx] for idx in ids] if input_data else None}, \
+            OrderedDict([('out', np.array([[images[idx]] for idx in ids]))])
+
+    def is_alive(self):
+        return not self.stopped
+
+    def memory_usage(self):
+        return self.memory
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestInferenceWorkerPool():
+
+    def setUp(self):
+        self.patcher = mock.patch.object(worker, 'InferenceWorker', FakeWorker)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def model_job(self, model_id, framework='caffe', snapshots=[('snapshot', 1.0)]):
+        job = mock.Mock()
+        job.id.return_value = model_id
+        job.train_task.return_value.framework_id = framework
+        job.train_task.return_value.snapshots = snapshots
+        return job
+
+    def test_available(self):
+        pool = worker.InferenceWorkerPool(enabled=True)
+        assert pool.available(self.model_job('a'))
+        assert not pool.available(self.model_job('a', framework='torch'))
+        assert not pool.available(self.model_job('a', snapshots=[]))
+        assert not worker.InferenceWorkerPool(enabled=False).available(self.model_job('a'))
+
+    def test_reuse(self):
+        pool = worker.InferenceWorkerPool(enabled=True)
+        job = self.model_job('a', snapshots=[('s1', 1.0), ('s2', 2.0)])
+        inputs, _ = pool.infer(job, None, ['x', 'y'])
+        assert inputs['ids'] == [0, 1]
+        pool.infer(job, 2.0, ['x'])
+        assert pool.workers.keys() == [('a', 2.0)]
+        pool.infer(job, 1.0, ['x'])
+        assert sorted(pool.workers.keys()) == [('a', 1.0), ('a', 2.0)]
+        pool.stop()
+
+    def test_max_request_size(self):
+        pool = worker.InferenceWorkerPool(enabled=True, max_request_size=2)
+        inputs, outputs = pool.infer(self.model_job('a'), None, ['x', 'bad', 'y', 'z', 'w'])
+        assert pool.workers[('a', 1.0)].requests == [['x', 'bad'], ['y', 'z'], ['w']]
+        assert inputs == {'ids': [0, 2, 3, 4], 'data': None}
+        assert outputs['out'].tolist() == [['x'], ['y'], ['z'], ['w']]
+        inputs, _ = pool.infer(self.model_job('a'), None, ['x', 'bad', 'y'], input_data=True)
+        assert inputs == {'ids': [0, 2], 'data': ['x', 'y']}
+        pool.stop()
+
+    def test_infer_one(self):
+        pool = worker.InferenceWorkerPool(enabled=True, max_batch_wait=0)
+        job = self.model_job('a', snapshots=[('s1', 1.0), ('s2', 2.0)])
+        inputs, _ = pool.infer_one(job, None, 'x')
+        assert inputs == {'ids': [0], 'data': None}
+        pool.infer_one(job, 1.0, 'y')
+        stats = pool.batching_stats('a')
+        assert sorted(stats.keys()) == [1.0, 2.0]
+        assert stats[2.0]['requests'] == 1
+        assert stats[2.0]['batch_size'] == 1
+        assert pool.batching_stats('b') == {}
+        pool.stop_model('a')
+        assert not pool.batchers
+        pool.stop()
+
+    def test_idle_eviction(self):
+        pool = worker.InferenceWorkerPool(enabled=True, idle_timeout=10)
+        pool.infer(self.model_job('a'), None, ['x'])
+        pool.infer(self.model_job('b'), None, ['x'])
+        old = pool.workers[('a', 1.0)]
+        old.last_used -= 60
+        pool.evict_idle()
+        assert pool.workers.keys() == [('b', 1.0)]
+        assert old.stopped
+        pool.stop()
+
+    def test_memory_budget(self):
+        pool = worker.InferenceWorkerPool(enabled=True, memory_budget=250)
+        for model_id in 'abc':
+            pool.infer(self.model_job(model_id), None, ['x'])
+        # the least recently used one had to go
+        assert sorted(pool.workers.keys()) == [('b', 1.0), ('c', 1.0)]
+        pool.stop()
+        assert not pool.workers
+
+    def test_stop_model(self):
+        pool = worker.InferenceWorkerPool(enabled=True)
+        pool.infer(self.model_job('a'), None, ['x'])
+        pool.infer(self.model_job('b'), None, ['x'])
+        pool.stop_model('a')
+        assert pool.workers.keys() == [('b', 1.0)]
+        pool.stop()
@@ -0,0 +1,387 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import cPickle as pickle
+import logging
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import psutil
+
+import digits
+from .batcher import RequestBatcher
+from .errors import InferenceWorkerError
+
+logger = logging.getLogger('digits.inference.worker')
+
+# Messages are pickled objects prefixed with their length
+HEADER = struct.Struct('!Q')
+
+
+def send_message(sock, obj):
+    """
+    Send a picklable object over a socket
+    """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def recv_message(sock):
+    """
+    Receive an object sent with send_message()
+    Raises EOFError if the connection is closed
+    """
+    length, = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return pickle.loads(_recv_exactly(sock, length))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+class InferenceWorker(object):
+    """
+    A tools/inference_server.py process which keeps one snapshot of a
+    model loaded and answers inference requests over a unix socket
+    """
+
+    def __init__(self, model_id, epoch, gpu=None, jobs_dir=None, start_timeout=120):
+        """
+        Arguments:
+        model_id -- the model job
+        epoch -- the snapshot epoch
+
+        Keyword arguments:
+        gpu -- which GPU to run on (CPU if None)
+        jobs_dir -- jobs directory (default: from DIGITS config)
+        start_timeout -- seconds to wait for the server to load the model
+        """
+        self.model_id = model_id
+        self.epoch = epoch
+        self.gpu = gpu
+        self.start_timeout = start_timeout
+        self.last_used = time.time()
+        self.requests = 0
+
+        self._dir = tempfile.mkdtemp(prefix='digits-inference-')
+        self.socket_path = os.path.join(self._dir, 'socket')
+        self.log_path = os.path.join(self._dir, 'server.log')
+        # requests are served one at a time
+        self._lock = threading.Lock()
+
+        args = [sys.executable,
+                os.path.join(os.path.dirname(os.path.abspath(digits.__file__)), 'tools', 'inference_server.py'),
+                model_id,
+                self.socket_path,
+                '--epoch=%s' % repr(epoch),
+                ]
+        if jobs_dir is not None:
+            args.append('--jobs_dir=%s' % jobs_dir)
+        if gpu is not None:
+            args.append('--gpu=%d' % gpu)
+
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(['.', env.get('PYTHONPATH', '')] + sys.path)
+        self._log = open(self.log_path, 'w')
+        self.p = subprocess.Popen(args,
+                                  stdout=self._log,
+                                  stderr=subprocess.STDOUT,
+                                  cwd=self._dir,
+                                  close_fds=False if platform.system() == 'Windows' else True,
+                                  env=env,
+                                  )
+        logger.info('Started inference worker for model %s (epoch %s), pid %d' % (model_id, epoch, self.p.pid))
+
+    def infer(self, images, resize=True, input_data=False):
+        """
+        Run inference on a list of image paths
+        Returns (inputs, outputs) like InferenceJob.get_data()
+        Raises InferenceWorkerError
+
+        inputs['data'] is None unless input_data is set
+        """
+        with self._lock:
+            self.last_used = time.time()
+            self.requests += 1
+            sock = self._connect()
+            try:
+                send_message(sock, {'images': images, 'resize': resize, 'input_data': input_data})
+                response = recv_message(sock)
+            except (socket.error, EOFError) as e:
+                raise InferenceWorkerError('Lost connection to inference worker: %s' % e)
+            finally:
+                sock.close()
+            self.last_used = time.time()
+
+        if 'error' in response:
+            raise InferenceWorkerError(response['error'])
+        inputs = response['inputs']
+        inputs.setdefault('data', None)
+        return inputs, response['outputs']
+
+    def is_alive(self):
+        return self.p.poll() is None
+
+    def memory_usage(self):
+        """
+        Returns the resident memory of the worker in bytes
+        """
+        try:
+            ps = psutil.Process(self.p.pid)
+            if psutil.version_info[0] >= 2:
+                return ps.memory_info().rss
+            else:
+                return ps.get_memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return 0
+
+    def stop(self):
+        """
+        Terminate the worker and clean up
+        """
+        if self.is_alive():
+            self.p.terminate()
+            for _ in xrange(20):
+                if not self.is_alive():
+                    break
+                time.sleep(0.1)
+            else:
+                self.p.kill()
+                self.p.wait()
+        self._log.close()
+        for path in self.socket_path, self.log_path:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(self._dir)
+        logger.info('Stopped inference worker for model %s (epoch %s) after %d requests' % (
+            self.model_id, self.epoch, self.requests))
+
+    def _connect(self):
+        """
+        Connect to the server, waiting for it to start if necessary
+        """
+        start = time.time()
+        while True:
+            if not self.is_alive():
+                raise InferenceWorkerError('Inference worker exited with code %s, see %s' % (
+                    self.p.returncode, self.log_path))
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except socket.error:
+                sock.close()
+                if time.time() - start > self.start_timeout:
+                    raise InferenceWorkerError('Timed out waiting for inference worker to start')
+                time.sleep(0.1)
+
+
+class InferenceWorkerPool(object):
+    """
+    Keeps one InferenceWorker per (model, snapshot epoch) which has been
+    used recently
+
+    Workers are stopped once they have been idle for idle_timeout seconds,
+    or when the workers together use more than memory_budget bytes
+    (least recently used first)
+
+    Single-image requests made with infer_one() are batched together
+    per (model, snapshot epoch) by a RequestBatcher
+
+    Requests made with infer() are split into requests of at most
+    max_request_size images, so that a worker never loads more images
+    than that at once and other requests get their turn in between
+    """
+
+    def __init__(self, enabled=False, idle_timeout=600, memory_budget=4 << 30, gpu=None,
+                 max_batch_size=16, max_batch_wait=0.01, max_request_size=256):
+        """
+        Keyword arguments:
+        enabled -- if False, available() is always False
+        idle_timeout -- seconds after which an unused worker is stopped
+        memory_budget -- total resident memory allowed for the workers, in bytes
+        gpu -- which GPU the workers run on (CPU if None)
+        max_batch_size -- the most single-image requests to batch together
+        max_batch_wait -- how long a single-image request waits for others, in seconds
+        max_request_size -- the most images to send to a worker in one request
+        """
+        self.enabled = enabled and platform.system() != 'Windows'
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        self.gpu = gpu
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.max_request_size = max_request_size
+        self.workers = {}
+        self.batchers = {}
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stopped = threading.Event()
+
+    def available(self, model_job):
+        """
+        Returns True if requests for this model can go to a worker
+        """
+        if not self.enabled or self._stopped.is_set():
+            return False
+        task = model_job.train_task()
+        return task.framework_id == 'caffe' and len(task.snapshots) > 0
+
+    def infer(self, model_job, epoch, images, resize=True, input_data=False):
+        """
+        Run inference on a list of image paths with a warm worker
+        Returns (inputs, outputs) like InferenceJob.get_data()
+        Raises InferenceWorkerError
+
+        inputs['data'] is None unless input_data is set
+        """
+        if epoch is None or epoch == -1:
+            epoch = model_job.train_task().snapshots[-1][1]
+        worker = self._get_worker(model_job.id(), epoch)
+        input_ids = []
+        data = [] if input_data else None
+        chunk_outputs = []
+        try:
+            # the worker is free for other requests between the chunks
+            for start in xrange(0, len(images), self.max_request_size):
+                inputs, outputs = worker.infer(images[start:start + self.max_request_size],
+                                               resize=resize, input_data=input_data)
+                input_ids.extend(start + idx for idx in inputs['ids'])
+                if input_data:
+                    data.extend(inputs['data'])
+                chunk_outputs.append(outputs)
+        except InferenceWorkerError:
+            if not worker.is_alive():
+                self._remove(worker)
+            raise
+        finally:
+            self.enforce_memory_budget()
+        if len(chunk_outputs) == 1:
+            outputs = chunk_outputs[0]
+        else:
+            outputs = OrderedDict((name, np.concatenate([o[name] for o in chunk_outputs]))
+                                  for name in chunk_outputs[0].keys())
+        return {'ids': input_ids, 'data': data}, outputs
+
+    def infer_one(self, model_job, epoch, image):
+        """
+        Run inference on one image path, batched with concurrent requests
+        for the same snapshot
+        Returns (inputs, outputs) like InferenceJob.get_data()
+        Raises InferenceWorkerError
+        """
+        if epoch is None or epoch == -1:
+            epoch = model_job.train_task().snapshots[-1][1]
+        with self._lock:
+            key = (model_job.id(), epoch)
+            batcher = self.batchers.get(key)
+            if batcher is None:
+                batcher = RequestBatcher(
+                    lambda images: self.infer(model_job, epoch, images),
+                    max_batch_size=self.max_batch_size,
+                    max_wait=self.max_batch_wait)
+                self.batchers[key] = batcher
+        return batcher.infer_one(image)
+
+    def batching_stats(self, model_id):
+        """
+        Returns {epoch: RequestBatcher.stats()} for a model
+        """
+        return dict((epoch, batcher.stats())
+                    for (batcher_model_id, epoch), batcher in self.batchers.items()
+                    if batcher_model_id == model_id)
+
+    def evict_idle(self):
+        """
+        Stop the workers which haven't been used for idle_timeout seconds
+        """
+        now = time.time()
+        for worker in self.workers.values():
+            if now - worker.last_used > self.idle_timeout or not worker.is_alive():
+                self._remove(worker)
+
+    def enforce_memory_budget(self):
+        """
+        Stop the least recently used workers until the rest fit in memory_budget
+        """
+        workers = sorted(self.workers.values(), key=lambda w: w.last_used)
+        usage = sum(w.memory_usage() for w in workers)
+        # always keep the most recently used one
+        for worker in workers[:-1]:
+            if usage <= self.memory_budget:
+                break
+            logger.info('Inference workers use %d MB (budget %d MB), evicting the least recently used' % (
+                usage >> 20, self.memory_budget >> 20))
+            usage -= worker.memory_usage()
+            self._remove(worker)
+
+    def stop_model(self, model_id):
+        """
+        Stop all workers for a model (e.g. when it is deleted)
+        """
+        with self._lock:
+            for key in self.batchers.keys():
+                if key[0] == model_id:
+                    self.batchers.pop(key).stop()
+        for worker in self.workers.values():
+            if worker.model_id == model_id:
+                self._remove(worker)
+
+    def stop(self):
+        """
+        Stop all workers
+        """
+        self._stopped.set()
+        with self._lock:
+            for batcher in self.batchers.values():
+                batcher.stop()
+            self.batchers = {}
+        for worker in self.workers.values():
+            self._remove(worker)
+
+    def _get_worker(self, model_id, epoch):
+        with self._lock:
+            key = (model_id, epoch)
+            worker = self.workers.get(key)
+            if worker is not None and not worker.is_alive():
+                self.workers.pop(key)
+                worker.stop()
+                worker = None
+            if worker is None:
+                worker = InferenceWorker(model_id, epoch, gpu=self.gpu)
+                self.workers[key] = worker
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_thread)
+                self._monitor.daemon = True
+                self._monitor.start()
+            return worker
+
+    def _remove(self, worker):
+        with self._lock:
+            if self.workers.get((worker.model_id, worker.epoch)) is not worker:
+                return
+            del self.workers[(worker.model_id, worker.epoch)]
+        # wait for a request in progress to finish
+        with worker._lock:
+            worker.stop()
+
+    def _monitor_thread(self):
+        while not self._stopped.wait(min(60, self.idle_timeout)):
+            self.evict_idle()
@@ -10,6 +10,7 @@ import time
 
 import flask
 
+from . import job_journal
 from .status import Status, StatusCls
 from digits.config import config_value
 from digits.utils import sizeof_fmt, filesystem as fs
@@ -23,6 +24,10 @@ class Job(StatusCls):
     Base class
     """
     SAVE_FILE = 'status.pickle'
+    # changes since the save file was written, see save_changes()
+    JOURNAL_FILE = 'status.journal'
+    # the journal is only compacted into the save file past this size
+    MIN_JOURNAL_SIZE = 1 << 20
 
     @classmethod
     def load(cls, job_id):
@@ -30,21 +35,65 @@ class Job(StatusCls):
         Loads a Job in the given job_id
         Returns the Job or throws an exception
         """
-        from digits.model.tasks import TrainTask
+        job = cls.loads(job_id, cls.read(job_id), cls.read_journal(job_id))
+        job.detect_files()
+        return job
 
-        job_dir = os.path.join(config_value('jobs_dir'), job_id)
-        filename = os.path.join(job_dir, cls.SAVE_FILE)
+    @classmethod
+    def read(cls, job_id):
+        """
+        Returns the contents of the save file for the given job_id
+        Only does file I/O, so it can run in another thread
+        """
+        filename = os.path.join(config_value('jobs_dir'), job_id, cls.SAVE_FILE)
         with open(filename, 'rb') as savefile:
-            job = pickle.load(savefile)
-            # Reset this on load
-            job._dir = job_dir
-            for task in job.tasks:
-                task.job_dir = job_dir
-                if isinstance(task, TrainTask):
-                    # can't call this until the job_dir is set
-                    task.detect_snapshots()
-                    task.detect_timeline_traces()
-            return job
+            return savefile.read()
+
+    @classmethod
+    def read_journal(cls, job_id):
+        """
+        Returns the contents of the journal for the given job_id, or None
+        Only does file I/O, so it can run in another thread
+        """
+        filename = os.path.join(config_value('jobs_dir'), job_id, cls.JOURNAL_FILE)
+        try:
+            with open(filename, 'rb') as journal:
+                return journal.read()
+        except IOError:
+            return None
+
+    @classmethod
+    def loads(cls, job_id, data, journal=None):
+        """
+        Returns the Job pickled in data, the contents of its save file
+        Call detect_files() on it before using it
+
+        Keyword arguments:
+        journal -- the contents of its journal, replayed over the save file
+        """
+        job_dir = os.path.join(config_value('jobs_dir'), job_id)
+        job = pickle.loads(data)
+        # Reset this on load
+        job._dir = job_dir
+        for task in job.tasks:
+            task.job_dir = job_dir
+        if journal:
+            job_journal.replay(job, journal)
+        job._journal_marks = job_journal.marks(job)
+        return job
+
+    def detect_files(self):
+        """
+        Look for the files which the tasks created on disk (e.g. snapshots)
+        Only does file I/O, so it can run in another thread
+        """
+        from digits.model.tasks import TrainTask
+
+        for task in self.tasks:
+            if isinstance(task, TrainTask):
+                # can't call this until the job_dir is set
+                task.detect_snapshots()
+                task.detect_timeline_traces()
 
     def __init__(self, name, username, group='', persistent=True):
         """
@@ -66,6 +115,7 @@ class Job(StatusCls):
         self._notes = None
         self.event = threading.Event()
         self.persistent = persistent
+        self.journal_generation = 0
 
         os.mkdir(self._dir)
 
@@ -79,6 +129,8 @@ class Job(StatusCls):
             del d['_dir']
         if 'event' in d:
             del d['event']
+        if '_journal_marks' in d:
+            del d['_journal_marks']
 
         return d
 
@@ -90,6 +142,8 @@ class Job(StatusCls):
             state['username'] = None
         if 'group' not in state:
             state['group'] = ''
+        if 'journal_generation' not in state:
+            state['journal_generation'] = 0
         self.__dict__ = state
         self.persistent = True
 
@@ -222,7 +276,7 @@ class Job(StatusCls):
         """
         Called when StatusCls.status.setter is used
         """
-        from digits.webapp import app, socketio
+        from digits.webapp import app, scheduler, socketio
 
         message = {
             'update': 'status',
@@ -252,6 +306,9 @@ class Job(StatusCls):
                 # release threads that are waiting for job to complete
                 self.event.set()
 
+        # let the scheduler start whatever is ready now
+        scheduler.on_job_status_update(self)
+
     def abort(self):
         """
         Abort a job and stop all running tasks
@@ -266,12 +323,50 @@ class Job(StatusCls):
         Saves the job to disk as a pickle file
         Suppresses errors, but returns False if something goes wrong
         """
+        # until the save file is written, changes can't be journaled
+        self._journal_marks = None
         try:
+            # the journal doesn't apply to the new save file
+            self.journal_generation += 1
             # use tmpfile so we don't abort during pickle dump (leading to EOFErrors)
             tmpfile_path = self.path(self.SAVE_FILE + '.tmp')
             with open(tmpfile_path, 'wb') as tmpfile:
                 pickle.dump(self, tmpfile)
             shutil.move(tmpfile_path, self.path(self.SAVE_FILE))
+            if os.path.exists(self.path(self.JOURNAL_FILE)):
+                os.remove(self.path(self.JOURNAL_FILE))
+            self._journal_marks = job_journal.marks(self)
+            return True
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print 'Caught %s while saving job %s: %s' % (type(e).__name__, self.id(), e)
+        return False
+
+    def save_changes(self):
+        """
+        Appends what changed since the job was last saved (new outputs,
+        status updates and other simple values) to its journal, so that
+        saving a running job doesn't get slower as its outputs grow
+
+        Saves the whole job instead when it can't be journaled, and when
+        the journal gets bigger than the save file (and MIN_JOURNAL_SIZE)
+        Suppresses errors, but returns False if something goes wrong
+        """
+        if getattr(self, '_journal_marks', None) is None:
+            return self.save()
+        try:
+            changes, marks = job_journal.changes(self, self._journal_marks)
+            if changes is None:
+                return self.save()
+            if not changes:
+                return True
+            # if this fails, the journal might end with a partial record
+            self._journal_marks = None
+            size = job_journal.append(self.path(self.JOURNAL_FILE), self.journal_generation, changes)
+            if size > max(os.path.getsize(self.path(self.SAVE_FILE)), self.MIN_JOURNAL_SIZE):
+                return self.save()
+            self._journal_marks = marks
             return True
         except KeyboardInterrupt:
             pass
@@ -334,15 +429,17 @@ class Job(StatusCls):
                       room='job_management'
                       )
 
-    def wait_completion(self):
+    def wait_completion(self, timeout=None):
         """
         Wait for the job to complete
+        Returns False if timeout (in seconds) expired first
         """
         # if job was loaded from disk (which is the only case
         # when the 'event' attribute should be missing) then
         # assume it has completed already (done, errored or interrupted)
         if hasattr(self, 'event'):
-            self.event.wait()
+            return self.event.wait(timeout)
+        return True
 
     def is_persistent(self):
         """
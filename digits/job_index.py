@@ -0,0 +1,438 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import json
+import os
+import re
+import sqlite3
+
+import gevent.lock
+
+from .dataset import DatasetJob
+from .job import Job
+from .log import logger
+from .model import ModelJob
+from .pretrained_model import PretrainedModelJob
+
+
+def summarize(job, get_job=None):
+    """
+    Returns (summary, output_fields) for a job, where summary is the row
+    shown in the job listings and output_fields is the set of metric
+    columns it fills in
+
+    Arguments:
+    job -- a Job
+
+    Keyword arguments:
+    get_job -- a function returning a job from its id, used to find the
+        extension of a model's dataset
+    """
+    output_fields = set()
+    d = {
+        'id': job.id(),
+        'name': job.name(),
+        'group': job.group,
+        'status': job.status_of_tasks().name,
+        'status_css': job.status_of_tasks().css,
+        'submitted': job.status_history[0][1],
+        'elapsed': job.runtime_of_tasks(),
+    }
+
+    if 'train_db_task' in dir(job):
+        d.update({
+            'backend': job.train_db_task().backend,
+        })
+
+    if 'train_task' in dir(job):
+        train_task = job.train_task()
+        d.update({
+            'framework': train_task.get_framework_id(),
+        })
+
+        for (prefix, key), (last, min_value, max_value) in train_task.output_aggregates().iteritems():
+            key = '%s (%s) ' % (key, prefix)
+            output_fields.add(key + 'last')
+            output_fields.add(key + 'min')
+            output_fields.add(key + 'max')
+            d.update({key + 'last': last})
+            d.update({key + 'min': min_value})
+            d.update({key + 'max': max_value})
+
+        data = train_task.combined_graph_data()
+        if data and 'columns' in data:
+            d.update({
+                'sparkline': data['columns'][0][1:],
+            })
+
+    if 'get_progress' in dir(job):
+        d.update({
+            'progress': int(round(100 * job.get_progress())),
+        })
+
+    if hasattr(job, 'dataset_id'):
+        d.update({
+            'dataset_id': job.dataset_id,
+        })
+
+    if hasattr(job, 'extension_id'):
+        d.update({
+            'extension': job.extension_id,
+        })
+    else:
+        if hasattr(job, 'dataset_id') and get_job is not None:
+            ds = get_job(job.dataset_id)
+            if ds and hasattr(ds, 'extension_id'):
+                d.update({
+                    'extension': ds.extension_id,
+                })
+
+    if isinstance(job, DatasetJob):
+        d.update({'type': 'dataset'})
+
+    if isinstance(job, ModelJob):
+        d.update({'type': 'model'})
+
+    if isinstance(job, PretrainedModelJob):
+        output_fields.add("has_labels")
+        output_fields.add("username")
+        d.update({
+            'type': 'pretrained_model',
+            'framework': job.framework,
+            'username': job.username,
+            'has_labels': job.has_labels_file()
+        })
+    return d, output_fields
+
+
+class JobIndex(object):
+    """
+    A summary of each job in the jobs directory, so that the server can
+    list jobs without unpickling them
+
+    The summaries are kept in an SQLite database in the jobs directory,
+    which can be sorted, filtered and paginated without looking at the
+    jobs. Each one is only valid for the save file and journal it was made
+    from (compared by mtime and size), so jobs which were saved since need
+    to be loaded again. Changes are written to disk by save()
+    """
+
+    FILENAME = 'jobs_index.sqlite'
+    # bump this when the summaries change, to rebuild the index
+    SCHEMA_VERSION = 1
+
+    # the columns jobs can be sorted by
+    SORT_COLUMNS = {
+        'name': 'name',
+        'submitted': 'submitted',
+        'updated': 'updated',
+        'status': 'status',
+        'group': 'group_name',
+        'username': 'username',
+        'type': 'type',
+    }
+
+    def __init__(self, jobs_dir, get_job=None):
+        """
+        Arguments:
+        jobs_dir -- where the jobs are
+
+        Keyword arguments:
+        get_job -- passed to summarize()
+        """
+        self.jobs_dir = jobs_dir
+        self.path = os.path.join(jobs_dir, self.FILENAME)
+        self.get_job = get_job
+        try:
+            self.db = self._open(self.path)
+        except sqlite3.DatabaseError:
+            # corrupt, start over
+            try:
+                os.remove(self.path)
+                self.db = self._open(self.path)
+            except (OSError, sqlite3.DatabaseError):
+                # not writable, keep the index in memory
+                self.db = self._open(':memory:')
+
+    def _open(self, path):
+        # don't block the server for long if another process has it locked
+        db = sqlite3.connect(path, timeout=1)
+        db.row_factory = sqlite3.Row
+        if db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            db.execute('DROP TABLE IF EXISTS jobs')
+            db.execute('PRAGMA user_version = %d' % self.SCHEMA_VERSION)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                type TEXT,
+                name TEXT,
+                status TEXT,
+                running INTEGER,
+                group_name TEXT,
+                username TEXT,
+                submitted REAL,
+                updated REAL,
+                dataset_id TEXT,
+                stat TEXT,
+                summary TEXT,
+                output_fields TEXT
+            )""")
+        db.execute('CREATE INDEX IF NOT EXISTS jobs_by_kind ON jobs (kind, running, submitted)')
+        db.commit()
+        return db
+
+    def stat(self, job_id):
+        """
+        Returns (mtime, size) of the job's save file and the size of its
+        journal, or None if the save file is missing
+        Only does file I/O, so it can run in another thread
+        """
+        try:
+            stat = os.stat(os.path.join(self.jobs_dir, job_id, Job.SAVE_FILE))
+        except OSError:
+            return None
+        try:
+            journal_size = os.path.getsize(os.path.join(self.jobs_dir, job_id, Job.JOURNAL_FILE))
+        except OSError:
+            journal_size = 0
+        return [stat.st_mtime, stat.st_size, journal_size]
+
+    def refresh(self, job_ids, stats):
+        """
+        Drops the entries for jobs which aren't in job_ids
+        Returns the job_ids whose entry is missing or out of date, and
+        those of the jobs which were running (they need to be aborted)
+
+        Arguments:
+        job_ids -- the jobs in the jobs directory
+        stats -- the result of stat() for each of them
+        """
+        entries = dict((row['id'], (row['stat'], row['running']))
+                       for row in self.db.execute('SELECT id, stat, running FROM jobs'))
+        self.db.executemany('DELETE FROM jobs WHERE id = ?',
+                            [(job_id,) for job_id in set(entries) - set(job_ids)])
+        stale = []
+        for job_id, stat in zip(job_ids, stats):
+            entry = entries.get(job_id)
+            if entry is None or stat is None or json.loads(entry[0]) != stat or entry[1]:
+                stale.append(job_id)
+        return stale
+
+    def update(self, job):
+        """
+        Summarize a job which was just loaded, saved or changed
+        Suppresses errors, but returns False if something goes wrong
+        """
+        if not job.is_persistent():
+            return False
+        try:
+            summary, output_fields = summarize(job, self.get_job)
+            self._update(job, summary, output_fields)
+            return True
+        except Exception as e:
+            logger.warning('Failed to index job %s - %s: %s' % (job.id(), type(e).__name__, e))
+            return False
+
+    def _update(self, job, summary, output_fields):
+        self.db.execute(
+            'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                job.id(),
+                summary.get('type'),
+                job.job_type(),
+                job.name(),
+                summary['status'],
+                job.status.is_running(),
+                job.group,
+                job.username,
+                job.status_history[0][1] if job.status_history else None,
+                job.status_history[-1][1] if job.status_history else None,
+                getattr(job, 'dataset_id', None),
+                json.dumps(self.stat(job.id())),
+                json.dumps(summary),
+                json.dumps(sorted(output_fields)),
+            ))
+
+    def remove(self, job_id):
+        try:
+            self.db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        except sqlite3.Error as e:
+            logger.warning('Failed to remove job %s from the index: %s' % (job_id, e))
+
+    def get(self, job_id):
+        """
+        Returns the entry of a job, or None
+        """
+        row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._entry(row)
+
+    def list(self, kind=None, running=None, sort='submitted', descending=True, offset=0, limit=None,
+             **filters):
+        """
+        Returns (total, entries) for the jobs which match, where total is
+        how many there are before offset and limit are applied
+
+        Keyword arguments:
+        kind -- only jobs of this kind ("dataset", "model" or "pretrained_model")
+        running -- if not None, only running (True) or finished (False) jobs
+        sort -- a key of SORT_COLUMNS
+        descending -- the order of the sort
+        offset -- how many jobs to skip
+        limit -- the maximum number of entries to return
+        filters -- status, group, username (exact matches) and name (a
+            case-insensitive substring)
+        """
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError('Cannot sort jobs by "%s"' % sort)
+        where = []
+        params = []
+        if kind is not None:
+            where.append('kind = ?')
+            params.append(kind)
+        if running is not None:
+            where.append('running = ?')
+            params.append(bool(running))
+        for key, column in ('status', 'status'), ('group', 'group_name'), ('username', 'username'):
+            if filters.get(key) is not None:
+                where.append('%s = ?' % column)
+                params.append(filters[key])
+        if filters.get('name'):
+            where.append("name LIKE ? ESCAPE '\\'")
+            params.append('%%%s%%' % re.sub(r'([%_\\])', r'\\\1', filters['name']))
+        where = ('WHERE ' + ' AND '.join(where)) if where else ''
+
+        total = self.db.execute('SELECT COUNT(*) FROM jobs %s' % where, params).fetchone()[0]
+        rows = self.db.execute(
+            'SELECT * FROM jobs %s ORDER BY %s %s, id %s LIMIT ? OFFSET ?' % (
+                where,
+                self.SORT_COLUMNS[sort],
+                'DESC' if descending else 'ASC',
+                'DESC' if descending else 'ASC'),
+            params + [-1 if limit is None else limit, offset])
+        return total, [self._entry(row) for row in rows]
+
+    def _entry(self, row):
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'type': row['type'],
+            'name': row['name'],
+            'status': row['status'],
+            'running': bool(row['running']),
+            'group': row['group_name'],
+            'username': row['username'],
+            'submitted': row['submitted'],
+            'updated': row['updated'],
+            'dataset_id': row['dataset_id'],
+            'stat': json.loads(row['stat']),
+            'summary': json.loads(row['summary']),
+            'output_fields': json.loads(row['output_fields']),
+        }
+
+    def save(self):
+        """
+        Write the changes to disk
+        Suppresses errors, but returns False if something goes wrong
+        """
+        try:
+            self.db.commit()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self.db.close()
+
+
+class LazyJobDict(object):
+    """
+    An ordered mapping of job_id -> Job whose jobs can be added unloaded,
+    and which loads them when they're first accessed
+
+    Jobs are loaded by calling load(job_ids), which must store each job it
+    manages to load with jobs[job_id] = job. Unloaded jobs which it doesn't
+    store are dropped. Listing the values or items loads all the unloaded
+    jobs with a single call
+    """
+
+    def __init__(self, load):
+        # job_id -> Job, or None if not loaded yet
+        self._jobs = OrderedDict()
+        self._load = load
+        # loads can yield (e.g. to a threadpool)
+        self._lock = gevent.lock.RLock()
+
+    def add_unloaded(self, job_id):
+        if job_id not in self._jobs:
+            self._jobs[job_id] = None
+
+    def is_loaded(self, job_id):
+        return self._jobs.get(job_id) is not None
+
+    def unloaded(self):
+        """
+        Returns the ids of the jobs which haven't been loaded yet
+        """
+        return [job_id for job_id, job in self._jobs.iteritems() if job is None]
+
+    def loaded(self):
+        """
+        Returns the jobs which have been loaded, without loading the others
+        """
+        return [job for job in self._jobs.itervalues() if job is not None]
+
+    def load(self, job_ids):
+        """
+        Load these jobs if they haven't been loaded yet
+        """
+        with self._lock:
+            job_ids = [job_id for job_id in job_ids if job_id in self._jobs and self._jobs[job_id] is None]
+            if not job_ids:
+                return
+            self._load(job_ids)
+            for job_id in job_ids:
+                if job_id in self._jobs and self._jobs[job_id] is None:
+                    del self._jobs[job_id]
+
+    def __getitem__(self, job_id):
+        if self._jobs[job_id] is None:
+            self.load([job_id])
+        return self._jobs[job_id]
+
+    def __setitem__(self, job_id, job):
+        self._jobs[job_id] = job
+
+    def __delitem__(self, job_id):
+        del self._jobs[job_id]
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, job_id, default=None):
+        try:
+            return self[job_id]
+        except KeyError:
+            return default
+
+    def pop(self, job_id, *args):
+        return self._jobs.pop(job_id, *args)
+
+    def keys(self):
+        return self._jobs.keys()
+
+    def values(self):
+        self.load(self.unloaded())
+        return self._jobs.values()
+
+    def items(self):
+        self.load(self.unloaded())
+        return self._jobs.items()
@@ -0,0 +1,177 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import cPickle as pickle
+
+from digits.utils.metric_series import MetricSeries
+
+# The values which are saved in the journal when they change
+SCALAR_TYPES = (type(None), bool, int, long, float, str, unicode)
+# The dicts of NetworkOutputs whose series only get appended to
+OUTPUT_ATTRIBUTES = ('train_outputs', 'val_outputs')
+
+
+def marks(job):
+    """
+    Returns what a job looks like now, for changes() to tell what changed since
+    """
+    return {
+        'tasks': len(job.tasks),
+        'job': _marks(job),
+        'task': [_marks(task) for task in job.tasks],
+    }
+
+
+def changes(job, old_marks):
+    """
+    Returns (changes, marks) where changes holds what changed in a job since
+    old_marks were taken (empty if nothing changed), and marks are the new marks
+
+    changes is None if the changes can't be journaled (e.g. tasks were added)
+    """
+    if len(job.tasks) != old_marks['tasks']:
+        return None, None
+    new_marks = marks(job)
+    record = {}
+    job_changes = _changes(job, old_marks['job'], new_marks['job'])
+    if job_changes:
+        record['job'] = job_changes
+    for index, task in enumerate(job.tasks):
+        task_changes = _changes(task, old_marks['task'][index], new_marks['task'][index])
+        if task_changes:
+            record.setdefault('task', {})[index] = task_changes
+    return record, new_marks
+
+
+def append(path, generation, record):
+    """
+    Appends a record of changes to the journal in path
+    Returns the size of the journal
+
+    Arguments:
+    path -- the journal file
+    generation -- the journal_generation of the save file the changes are based on
+    record -- returned by changes()
+    """
+    with open(path, 'ab') as outfile:
+        pickle.dump((generation, record), outfile, pickle.HIGHEST_PROTOCOL)
+        outfile.flush()
+        return outfile.tell()
+
+
+def replay(job, data):
+    """
+    Applies the records from the contents of a journal to a job
+    Records from another generation of the save file are skipped
+    Returns the number of records which were applied
+
+    Arguments:
+    job -- a job loaded from its save file
+    data -- the contents of its journal
+    """
+    from digits.model.tasks.train import NetworkOutput
+
+    applied = 0
+    for generation, record in _records(data):
+        if generation != job.journal_generation:
+            continue
+        if 'job' in record:
+            _apply(job, record['job'], NetworkOutput)
+        for index, task_changes in record.get('task', {}).iteritems():
+            _apply(job.tasks[index], task_changes, NetworkOutput)
+        applied += 1
+    return applied
+
+
+def _records(data):
+    """
+    Yields (generation, record) for each complete record in data
+    (the server might have died while it was writing the last one)
+    """
+    reader = _Reader(data)
+    while reader.offset < len(data):
+        try:
+            yield pickle.Unpickler(reader).load()
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return
+
+
+class _Reader(object):
+    """
+    A file-like object over a string, which tells how much was read
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, n):
+        chunk = self.data[self.offset:self.offset + n]
+        self.offset += len(chunk)
+        return chunk
+
+    def readline(self):
+        end = self.data.find('\n', self.offset)
+        end = len(self.data) if end < 0 else end + 1
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+
+def _marks(obj):
+    state = obj.__getstate__()
+    # keep the order of the outputs (the first one is the sparkline)
+    outputs = OrderedDict()
+    for attr in OUTPUT_ATTRIBUTES:
+        for name, output in state.get(attr, {}).iteritems():
+            data = output.data
+            outputs[(attr, name)] = (len(data), _copy(data[-1]) if len(data) else None)
+    return {
+        'scalars': dict((key, value) for key, value in state.iteritems()
+                        if isinstance(value, SCALAR_TYPES)),
+        'status_history': len(obj.status_history),
+        'outputs': outputs,
+    }
+
+
+def _changes(obj, old_marks, new_marks):
+    changes = {}
+
+    scalars = dict((key, value) for key, value in new_marks['scalars'].iteritems()
+                   if key not in old_marks['scalars'] or old_marks['scalars'][key] != value)
+    if scalars:
+        changes['scalars'] = scalars
+
+    start = old_marks['status_history']
+    if new_marks['status_history'] != start:
+        changes['status_history'] = (start, obj.status_history[start:])
+
+    outputs = []
+    for (attr, name), (length, last) in new_marks['outputs'].iteritems():
+        old_length, old_last = old_marks['outputs'].get((attr, name), (0, None))
+        if length != old_length or last != old_last:
+            # the last value can be changed after it was added
+            start = max(old_length - 1, 0)
+            output = getattr(obj, attr)[name]
+            outputs.append((attr, name, output.kind, start, list(output.data[start:])))
+    if outputs:
+        changes['outputs'] = outputs
+    return changes
+
+
+def _apply(obj, changes, output_cls):
+    obj.__dict__.update(changes.get('scalars', {}))
+    if 'status_history' in changes:
+        start, entries = changes['status_history']
+        obj.status_history[start:] = entries
+    for attr, name, kind, start, values in changes.get('outputs', []):
+        outputs = getattr(obj, attr)
+        if name not in outputs:
+            outputs[name] = output_cls(kind, MetricSeries())
+        outputs[name].data[start:] = values
+
+
+def _copy(value):
+    # outputs with several values for an epoch are lists which grow
+    return list(value) if isinstance(value, list) else value
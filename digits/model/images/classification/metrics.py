@@ -0,0 +1,67 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import numpy as np
+
+
+def top_k(scores, k, axis=1):
+    """
+    Returns the indices of the k highest scores along an axis, highest first
+    Same as (-scores).argsort(axis=axis)[:k] (along that axis), but only
+    the top k are sorted
+
+    Arguments:
+    scores -- a 2D np.ndarray
+    k -- how many indices to return (fewer if there aren't enough scores)
+
+    Keyword arguments:
+    axis -- 1 for the top classes of each image, 0 for the top images of each class
+    """
+    scores = np.asarray(scores)
+    if axis == 0:
+        return top_k(scores.T, k, axis=1).T
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(n), (len(scores), 1))
+    rows = np.arange(len(scores))[:, np.newaxis]
+    order = np.argsort(-scores[rows, indices], axis=1)
+    return indices[rows, order]
+
+
+def classification_statistics(indices, ground_truths, n_labels):
+    """
+    Returns (top1_accuracy, topk_accuracy, confusion_matrix, per_class_accuracy)
+    The accuracies are percentages, or None if there is no ground truth
+
+    Arguments:
+    indices -- the top k classes of each image, e.g. from top_k()
+    ground_truths -- the class of each image, or None if unknown
+    n_labels -- how many classes there are
+    """
+    indices = np.asarray(indices)
+    ground_truths = np.array([-1 if x is None else x for x in ground_truths], dtype=np.int64)
+    valid = (ground_truths >= 0) & (ground_truths < n_labels)
+    n_ground_truth = np.count_nonzero(valid)
+
+    top1 = indices[:, 0]
+    counted = valid & (top1 >= 0) & (top1 < n_labels)
+    confusion_matrix = np.zeros((n_labels, n_labels), dtype=np.dtype(int))
+    np.add.at(confusion_matrix, (ground_truths[counted], top1[counted]), 1)
+
+    if not n_ground_truth:
+        return None, None, confusion_matrix, None
+
+    n_top1_accurate = np.count_nonzero(valid & (top1 == ground_truths))
+    n_topk_accurate = np.count_nonzero(valid & (indices == ground_truths[:, np.newaxis]).any(axis=1))
+    top1_accuracy = round(100.0 * n_top1_accurate / n_ground_truth, 2)
+    topk_accuracy = round(100.0 * n_topk_accurate / n_ground_truth, 2)
+
+    n_examples = confusion_matrix.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = 100.0 * confusion_matrix.diagonal() / n_examples
+    per_class_accuracy = [round(ratio, 2) if n > 0 else None
+                          for ratio, n in zip(ratios.tolist(), n_examples.tolist())]
+    return top1_accuracy, topk_accuracy, confusion_matrix, per_class_accuracy
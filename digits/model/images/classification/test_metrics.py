@@ -0,0 +1,45 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import numpy as np
+
+from . import metrics
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestTopK():
+
+    def test_top_k(self):
+        for k in 1, 3, 7, 10:
+            for axis in 0, 1:
+                yield self.check_top_k, k, axis
+
+    def check_top_k(self, k, axis):
+        scores = np.random.permutation(42).reshape(6, 7).astype(np.float32)
+        expected = (-scores).argsort(axis=axis)
+        expected = expected[:k] if axis == 0 else expected[:, :k]
+        assert np.array_equal(metrics.top_k(scores, k, axis=axis), expected)
+
+
+class TestClassificationStatistics():
+
+    def test_statistics(self):
+        indices = np.array([[0, 1], [1, 0], [2, 1], [1, 2], [0, 3]])
+        ground_truths = [0, 0, 1, None, 5]
+        top1, top2, confusion_matrix, per_class = metrics.classification_statistics(indices, ground_truths, 3)
+        # image 4 has an invalid ground truth
+        assert top1 == round(100.0 / 3, 2)
+        assert top2 == 100.0
+        assert np.array_equal(confusion_matrix, [[1, 1, 0], [0, 0, 1], [0, 0, 0]])
+        assert per_class == [50.0, 0.0, None]
+
+    def test_no_ground_truth(self):
+        top1, top2, confusion_matrix, per_class = metrics.classification_statistics(
+            np.array([[0, 1], [1, 0]]), [None, None], 2)
+        assert top1 is None
+        assert top2 is None
+        assert per_class is None
+        assert not confusion_matrix.any()
@@ -637,6 +637,23 @@ class BaseTestCreated(BaseViewsTestWithModel):
                 break
         assert found, 'model not found in list'
 
+    def test_completed_jobs_json(self):
+        rv = self.app.get('/completed_jobs.json?name=test_model&sort=name&order=asc')
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        models = content['running'] + content['models']
+        assert self.model_id in [m['id'] for m in models], 'model not found in list'
+        assert content['totals']['models'] == len(content['models']), 'wrong total'
+        assert content['datasets'] == [], 'datasets should be filtered out'
+
+        rv = self.app.get('/completed_jobs.json?limit=1')
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        content = json.loads(rv.data)
+        assert len(content['models']) <= 1, 'limit ignored'
+
+        rv = self.app.get('/completed_jobs.json?sort=bogus')
+        assert rv.status_code == 400, 'invalid sort accepted'
+
     def test_model_json(self):
         rv = self.app.get('/models/%s.json' % self.model_id)
         assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
@@ -794,6 +811,93 @@ class BaseTestCreated(BaseViewsTestWithModel):
             prediction = data['classifications'][image_path][0][0]
             assert prediction == category, 'image misclassified- predicted %s - expected %s' % (prediction, category)
 
+    def test_classify_many_json_worker(self):
+        textfile_images = ''
+        for label_id, images in enumerate(self.imageset_paths.itervalues()):
+            for image in images:
+                textfile_images += '%s %d\n' % (os.path.join(self.imageset_folder, image), label_id)
+
+        workers = digits.webapp.scheduler.inference_workers
+        enabled = workers.enabled
+        workers.enabled = True
+        try:
+            results = []
+            for _ in xrange(2):
+                rv = self.app.post(
+                    '/models/images/classification/classify_many.json?job_id=%s' % self.model_id,
+                    data={'image_list': (StringIO(textfile_images), 'images.txt')}
+                )
+                assert rv.status_code == 200, 'POST failed with %s' % rv.status_code
+                results.append(json.loads(rv.data)['classifications'])
+            assert results[0] == results[1], 'results differ between requests'
+            if self.FRAMEWORK == 'caffe':
+                # the second request was served by the same worker
+                assert len([w for w in workers.workers.values() if w.model_id == self.model_id]) == 1
+                assert [w for w in workers.workers.values() if w.model_id == self.model_id][0].requests == 2
+        finally:
+            workers.stop_model(self.model_id)
+            workers.enabled = enabled
+
+    def test_classify_many_json_stream(self):
+        textfile_images = ''
+        for label_id, images in enumerate(self.imageset_paths.itervalues()):
+            for image in images:
+                textfile_images += '%s %d\n' % (os.path.join(self.imageset_folder, image), label_id)
+
+        rv = self.app.post(
+            '/models/images/classification/classify_many.json?job_id=%s' % self.model_id,
+            data={'image_list': (StringIO(textfile_images), 'images.txt')}
+        )
+        assert rv.status_code == 200, 'POST failed with %s' % rv.status_code
+        expected = json.loads(rv.data)['classifications']
+
+        rv = self.app.post(
+            '/models/images/classification/classify_many.json?job_id=%s' % self.model_id,
+            data={
+                'image_list': (StringIO(textfile_images), 'images.txt'),
+                'stream': 'y',
+                'chunk_size': '3',
+            }
+        )
+        assert rv.status_code == 200, 'POST failed with %s' % rv.status_code
+        lines = [json.loads(line) for line in rv.data.splitlines()]
+        assert lines[-1] == {'progress': 1.0, 'done': True}, lines[-1]
+        classifications = {}
+        for line in lines[:-1]:
+            assert 0 <= line['progress'] <= 1
+            classifications.update(line.get('classifications', {}))
+        assert classifications == expected, 'streamed results differ'
+
+    def test_classify_one_json_worker(self):
+        category = self.imageset_paths.keys()[-1]
+        image_path = os.path.join(self.imageset_folder, self.imageset_paths[category][-1])
+
+        workers = digits.webapp.scheduler.inference_workers
+        enabled = workers.enabled
+        workers.enabled = True
+        try:
+            for _ in xrange(2):
+                rv = self.app.post(
+                    '/models/images/classification/classify_one.json?job_id=%s' % self.model_id,
+                    data={'image_path': image_path}
+                )
+                assert rv.status_code == 200, 'POST failed with %s' % rv.status_code
+                data = json.loads(rv.data)
+                assert data['predictions'][0][0] == category, 'image misclassified'
+
+            rv = self.app.get('/models/images/classification/classify_one/stats.json?job_id=%s' % self.model_id)
+            assert rv.status_code == 200, 'GET failed with %s' % rv.status_code
+            snapshots = json.loads(rv.data)['snapshots']
+            if self.FRAMEWORK == 'caffe':
+                assert len(snapshots) == 1
+                assert snapshots[0]['requests'] == 2
+                assert snapshots[0]['batch_size'] == 1
+            else:
+                assert snapshots == []
+        finally:
+            workers.stop_model(self.model_id)
+            workers.enabled = enabled
+
     def test_top_n(self):
         textfile_images = ''
         label_id = 0
@@ -1,21 +1,24 @@
 # Copyright (c) 2014-2017, NVIDIA CORPORATION.  All rights reserved.
 from __future__ import absolute_import
 
+import json
 import os
 import re
 import tempfile
 
 import flask
-import numpy as np
 import werkzeug.exceptions
 
 from .forms import ImageClassificationModelForm
 from .job import ImageClassificationModelJob
+from .metrics import classification_statistics, top_k
 from digits import frameworks
 from digits import utils
 from digits.config import config_value
 from digits.dataset import ImageClassificationDatasetJob
 from digits.inference import ImageInferenceJob
+from digits.inference.errors import InferenceWorkerError
+from digits.log import logger
 from digits.pretrained_model.job import PretrainedModelJob
 from digits.status import Status
 from digits.utils import filesystem as fs
@@ -376,6 +379,127 @@ def large_graph():
     return flask.render_template('models/large_graph.html', job=job)
 
 
+def infer_with_worker(model_job, images, epoch):
+    """
+    Run inference with a long-lived inference worker, if one can be used
+    Returns (inputs, outputs) like InferenceJob.get_data(),
+    or None if an inference job is needed instead
+    """
+    if not scheduler.inference_workers.available(model_job):
+        return None
+    try:
+        if len(images) == 1:
+            # batched with concurrent requests for the same snapshot
+            return scheduler.inference_workers.infer_one(model_job, epoch, images[0])
+        return scheduler.inference_workers.infer(model_job, epoch, images)
+    except InferenceWorkerError as e:
+        logger.warning('Inference worker failed, falling back to an inference job: %s' % e,
+                       job_id=model_job.id())
+        return None
+
+
+def format_classifications(scores, indices, labels):
+    """
+    Returns [[(label, confidence),...],...] for the top indices of each row of scores
+    """
+    classifications = []
+    for image_index, index_list in enumerate(indices):
+        result = []
+        for i in index_list:
+            # `i` is a category in labels and also an index into scores
+            # ignore prediction if we don't have a label for the corresponding class
+            # the user might have set the final fully-connected layer's num_output to
+            # too high a value
+            if i < len(labels):
+                result.append((labels[i], round(100.0 * scores[image_index, i], 2)))
+        classifications.append(result)
+    return classifications
+
+
+def stream_classifications(model_job, paths, epoch, chunk_size, username):
+    """
+    Generate the top 5 classifications of the images as newline-delimited JSON
+
+    Each line is {progress, classifications: {filename: [[category,confidence],...],...}}
+    for the images done since the previous line, the last one is {progress, done}
+    or {error}
+    """
+    labels = model_job.train_task().get_labels()
+    total = len(paths)
+
+    def line(processed, chunk_paths=None, scores=None):
+        data = {'progress': float(processed) / total}
+        if scores is not None:
+            data['classifications'] = dict(zip(
+                chunk_paths, format_classifications(scores, top_k(scores, 5), labels)))
+        return json.dumps(data) + '\n'
+
+    processed = 0
+
+    # a warm worker returns partial results after each chunk
+    while processed < len(paths) and scheduler.inference_workers.available(model_job):
+        chunk = paths[processed:processed + chunk_size]
+        result = infer_with_worker(model_job, chunk, epoch)
+        if result is None:
+            break
+        inputs, outputs = result
+        processed += len(chunk)
+        yield line(processed, [chunk[idx] for idx in inputs['ids']], outputs.values()[-1])
+
+    if processed < len(paths):
+        # an inference job saves the results for each chunk as it goes
+        remaining = paths[processed:]
+        inference_job = ImageInferenceJob(
+            username=username,
+            name="Classify Many Images",
+            model=model_job,
+            images=remaining,
+            epoch=epoch,
+            layers='none',
+            chunk_size=chunk_size,
+            inputs='none',
+            chunk_results=True,
+        )
+        scheduler.add_job(inference_job)
+        try:
+            reported = 0
+            done = False
+            while not done:
+                done = inference_job.wait_completion(timeout=1)
+                progress = processed + inference_job.get_progress() * len(remaining)
+                chunks = inference_job.get_chunk_results(reported)
+                reported += len(chunks)
+                for inputs, outputs in chunks:
+                    yield line(progress, [remaining[idx] for idx in inputs['ids']], outputs.values()[-1])
+                if not chunks and not done:
+                    yield line(progress)
+            if inference_job.status == 'E' or not reported:
+                yield json.dumps({'error': 'Inference failed'}) + '\n'
+                return
+        finally:
+            scheduler.delete_job(inference_job)
+
+    yield json.dumps({'progress': 1.0, 'done': True}) + '\n'
+
+
+@blueprint.route('/classify_one/stats.json', methods=['GET'])
+def classify_one_stats():
+    """
+    Return statistics about the batching of classify_one.json requests
+
+    Returns JSON:
+        {snapshots: [{epoch, requests, latency_p50, latency_p99, batch_size},...]}
+    """
+    model_job = job_from_request()
+    stats = scheduler.inference_workers.batching_stats(model_job.id())
+    snapshots = []
+    for epoch in sorted(stats):
+        snapshot = {'epoch': epoch}
+        snapshot.update(stats[epoch])
+        snapshots.append(snapshot)
+    return flask.jsonify({'snapshots': snapshots})
+
+
 @blueprint.route('/classify_one.json', methods=['POST'])
 @blueprint.route('/classify_one', methods=['POST', 'GET'])
 def classify_one():
@@ -406,38 +530,49 @@ def classify_one():
     if 'show_visualizations' in flask.request.form and flask.request.form['show_visualizations']:
         layers = 'all'
 
-    # create inference job
-    inference_job = ImageInferenceJob(
-        username=utils.auth.get_username(),
-        name="Classify One Image",
-        model=model_job,
-        images=[image_path],
-        epoch=epoch,
-        layers=layers
-    )
+    # API requests skip the inference job if a worker has the model loaded
+    result = None
+    if request_wants_json() and layers == 'none':
+        result = infer_with_worker(model_job, [image_path], epoch)
 
-    # schedule tasks
-    scheduler.add_job(inference_job)
+    if result is not None:
+        inputs, outputs = result
+        visualizations = []
+        status_code = 200
+    else:
+        # create inference job
+        inference_job = ImageInferenceJob(
+            username=utils.auth.get_username(),
+            name="Classify One Image",
+            model=model_job,
+            images=[image_path],
+            epoch=epoch,
+            layers=layers
+        )
 
-    # wait for job to complete
-    inference_job.wait_completion()
+        # schedule tasks
+        scheduler.add_job(inference_job)
 
-    # retrieve inference data
-    inputs, outputs, visualizations = inference_job.get_data()
+        # wait for job to complete
+        inference_job.wait_completion()
+
+        # retrieve inference data
+        inputs, outputs, visualizations = inference_job.get_data()
 
-    # set return status code
-    status_code = 500 if inference_job.status == 'E' else 200
+        # set return status code
+        status_code = 500 if inference_job.status == 'E' else 200
 
-    # delete job
-    scheduler.delete_job(inference_job)
+        # delete job
+        scheduler.delete_job(inference_job)
 
     if remove_image_path:
         os.remove(image_path)
 
     image = None
     predictions = []
-    if inputs is not None and len(inputs['data']) == 1:
-        image = utils.image.embed_image_html(inputs['data'][0])
+    if inputs is not None and len(inputs['ids']) == 1:
+        if inputs['data'] is not None:
+            image = utils.image.embed_image_html(inputs['data'][0])
         # convert to class probabilities for viewing
         last_output_name, last_output_data = outputs.items()[-1]
 
@@ -475,6 +610,7 @@ def classify_many():
     Classify many images and return the top 5 classifications for each
 
     Returns JSON when requested: {classifications: {filename: [[category,confidence],...],...}}
+    or newline-delimited JSON with partial results if stream is set (see stream_classifications)
     """
     model_job = job_from_request()
 
@@ -500,30 +636,51 @@ def classify_many():
 
     paths, ground_truths = read_image_list(image_list, image_folder, num_test_images)
 
-    # create inference job
-    inference_job = ImageInferenceJob(
-        username=utils.auth.get_username(),
-        name="Classify Many Images",
-        model=model_job,
-        images=paths,
-        epoch=epoch,
-        layers='none'
-    )
+    if request_wants_json() and 'stream' in flask.request.form and flask.request.form['stream']:
+        if 'chunk_size' in flask.request.form and flask.request.form['chunk_size'].strip():
+            chunk_size = int(flask.request.form['chunk_size'])
+            if chunk_size < 1:
+                raise werkzeug.exceptions.BadRequest('chunk_size must be positive')
+        else:
+            chunk_size = 1000
+        return flask.Response(
+            stream_classifications(model_job, paths, epoch, chunk_size, utils.auth.get_username()),
+            mimetype='application/x-ndjson')
 
-    # schedule tasks
-    scheduler.add_job(inference_job)
+    # API requests skip the inference job if a worker has the model loaded
+    result = None
+    if request_wants_json():
+        result = infer_with_worker(model_job, paths, epoch)
 
-    # wait for job to complete
-    inference_job.wait_completion()
+    if result is not None:
+        inputs, outputs = result
+        status_code = 200
+    else:
+        # create inference job
+        inference_job = ImageInferenceJob(
+            username=utils.auth.get_username(),
+            name="Classify Many Images",
+            model=model_job,
+            images=paths,
+            epoch=epoch,
+            layers='none',
+            inputs='none',
+        )
 
-    # retrieve inference data
-    inputs, outputs, _ = inference_job.get_data()
+        # schedule tasks
+        scheduler.add_job(inference_job)
 
-    # set return status code
-    status_code = 500 if inference_job.status == 'E' else 200
+        # wait for job to complete
+        inference_job.wait_completion()
 
-    # delete job
-    scheduler.delete_job(inference_job)
+        # retrieve inference data
+        inputs, outputs, _ = inference_job.get_data()
+
+        # set return status code
+        status_code = 500 if inference_job.status == 'E' else 200
+
+        # delete job
+        scheduler.delete_job(inference_job)
 
     if outputs is not None and len(outputs) < 1:
         # an error occurred
@@ -552,7 +709,7 @@ def classify_many():
 
         scores = last_output_data
         # take top 5
-        indices = (-scores).argsort()[:, :5]
+        indices = top_k(scores, 5)
 
         labels = model_job.train_task().get_labels()
         n_labels = len(labels)
@@ -560,46 +717,11 @@ def classify_many():
         # remove invalid ground truth
         ground_truths = [x if x is not None and (0 <= x < n_labels) else None for x in ground_truths]
 
-        # how many pieces of ground truth to we have?
-        n_ground_truth = len([1 for x in ground_truths if x is not None])
-        show_ground_truth = n_ground_truth > 0
-
         # compute classifications and statistics
-        classifications = []
-        n_top1_accurate = 0
-        n_top5_accurate = 0
-        confusion_matrix = np.zeros((n_labels, n_labels), dtype=np.dtype(int))
-        for image_index, index_list in enumerate(indices):
-            result = []
-            if ground_truths[image_index] is not None:
-                if ground_truths[image_index] == index_list[0]:
-                    n_top1_accurate += 1
-                if ground_truths[image_index] in index_list:
-                    n_top5_accurate += 1
-                if (0 <= ground_truths[image_index] < n_labels) and (0 <= index_list[0] < n_labels):
-                    confusion_matrix[ground_truths[image_index], index_list[0]] += 1
-            for i in index_list:
-                # `i` is a category in labels and also an index into scores
-                # ignore prediction if we don't have a label for the corresponding class
-                # the user might have set the final fully-connected layer's num_output to
-                # too high a value
-                if i < len(labels):
-                    result.append((labels[i], round(100.0 * scores[image_index, i], 2)))
-            classifications.append(result)
-
-        # accuracy
-        if show_ground_truth:
-            top1_accuracy = round(100.0 * n_top1_accurate / n_ground_truth, 2)
-            top5_accuracy = round(100.0 * n_top5_accurate / n_ground_truth, 2)
-            per_class_accuracy = []
-            for x in xrange(n_labels):
-                n_examples = sum(confusion_matrix[x])
-                per_class_accuracy.append(
-                    round(100.0 * confusion_matrix[x, x] / n_examples, 2) if n_examples > 0 else None)
-        else:
-            top1_accuracy = None
-            top5_accuracy = None
-            per_class_accuracy = None
+        classifications = format_classifications(scores, indices, labels)
+        top1_accuracy, top5_accuracy, confusion_matrix, per_class_accuracy = \
+            classification_statistics(indices, ground_truths, n_labels)
+        show_ground_truth = top1_accuracy is not None
 
         # replace ground truth indices with labels
         ground_truths = [labels[x] if x is not None and (0 <= x < n_labels) else None for x in ground_truths]
@@ -663,7 +785,8 @@ def top_n():
         model=model_job,
         images=paths,
         epoch=epoch,
-        layers='none'
+        layers='none',
+        inputs='lazy',
     )
 
     # schedule tasks
@@ -675,37 +798,38 @@ def top_n():
     # retrieve inference data
     inputs, outputs, _ = inference_job.get_data()
 
-    # delete job
-    scheduler.delete_job(inference_job)
-
     results = None
-    if outputs is not None and len(outputs) > 0:
-        # convert to class probabilities for viewing
-        last_output_name, last_output_data = outputs.items()[-1]
-        scores = last_output_data
+    try:
+        if outputs is not None and len(outputs) > 0:
+            # convert to class probabilities for viewing
+            last_output_name, last_output_data = outputs.items()[-1]
+            scores = last_output_data
 
-        if scores is None:
-            raise RuntimeError('An error occurred while processing the images')
+            if scores is None:
+                raise RuntimeError('An error occurred while processing the images')
 
-        labels = model_job.train_task().get_labels()
-        images = inputs['data']
-        indices = (-scores).argsort(axis=0)[:top_n]
-        results = []
-        # Can't have more images per category than the number of images
-        images_per_category = min(top_n, len(images))
-        # Can't have more categories than the number of labels or the number of outputs
-        n_categories = min(indices.shape[1], len(labels))
-        for i in xrange(n_categories):
-            result_images = []
-            for j in xrange(images_per_category):
-                result_images.append(images[indices[j][i]])
-            results.append((
-                labels[i],
-                utils.image.embed_image_html(
-                    utils.image.vis_square(np.array(result_images),
-                                           colormap='white')
-                )
-            ))
+            labels = model_job.train_task().get_labels()
+            indices = top_k(scores, top_n, axis=0)
+            results = []
+            # Can't have more images per category than the number of images
+            images_per_category = min(top_n, len(scores))
+            # Can't have more categories than the number of labels or the number of outputs
+            n_categories = min(indices.shape[1], len(labels))
+            # only read the images which are shown
+            indices = indices[:images_per_category, :n_categories]
+            images = inference_job.get_input_data(indices.flatten())
+            images = images.reshape(indices.shape + images.shape[1:])
+            for i in xrange(n_categories):
+                results.append((
+                    labels[i],
+                    utils.image.embed_image_html(
+                        utils.image.vis_square(images[:, i],
+                                               colormap='white')
+                    )
+                ))
+    finally:
+        # delete job
+        scheduler.delete_job(inference_job)
 
     return flask.render_template('models/images/classification/top_n.html',
                                  model_job=model_job,
@@ -2,7 +2,6 @@
 from __future__ import absolute_import
 
 from collections import OrderedDict
-import copy
 import math
 import operator
 import os
@@ -22,6 +21,7 @@ from digits.config import config_value
 from digits.status import Status
 from digits.utils import subclass, override, constants
 from digits.utils.filesystem import tail
+from digits.utils.lru_cache import LRUCache
 
 # Must import after importing digit.config
 import caffe
@@ -38,6 +38,20 @@ CAFFE_SNAPSHOT_PREFIX = 'snapshot'
 CAFFE_DEPLOY_FILE = 'deploy.prototxt'
 CAFFE_PYTHON_LAYER_FILE = 'digits_python_layers.py'
 
+# Nets loaded for inference by all the tasks in this process,
+# keyed by (snapshot file, gpu) and capped by memory footprint
+net_cache = LRUCache(config_value('net_cache')['size'] << 20)
+
+
+def get_net_size(net):
+    """
+    Returns the memory footprint of a caffe.Net's blobs and parameters in bytes
+    """
+    count = sum(blob.count for blob in net.blobs.itervalues())
+    count += sum(blob.count for blobs in net.params.itervalues() for blob in blobs)
+    # single-precision floats
+    return 4 * count
+
 
 @subclass
 class DigitsTransformer(caffe.io.Transformer):
@@ -60,29 +74,84 @@ class DigitsTransformer(caffe.io.Transformer):
         See parent class for details
         """
         if not self.resize:
-            # update target input dimension such that no resize occurs
-            self.inputs[in_] = self.inputs[in_][:2] + data.shape[:2]
-            # do we have a mean?
-            if in_ in self.mean:
-                # resize mean if necessary
-                if self.mean[in_].size > 1:
-                    # we are doing mean image subtraction
-                    if self.mean[in_].size != data.size:
-                        # mean image size is different from data size
-                        # => we need to resize the mean image
-                        transpose = self.transpose.get(in_)
-                        if transpose is not None:
-                            # detranspose
-                            self.mean[in_] = self.mean[in_].transpose(
-                                np.argsort(transpose))
-                        self.mean[in_] = caffe.io.resize_image(
-                            self.mean[in_],
-                            data.shape[:2])
-                        if transpose is not None:
-                            # retranspose
-                            self.mean[in_] = self.mean[in_].transpose(transpose)
+            self._set_input_shape(in_, data.shape)
         return caffe.io.Transformer.preprocess(self, in_, data)
 
+    def preprocess_batch(self, in_, images, out):
+        """
+        Preprocess a batch of images, writing the result into out
+        Returns out
+
+        Equivalent to calling preprocess() on each image, but the transpose,
+        channel swap, scaling and mean subtraction are done for the whole
+        batch by a few NumPy operations
+
+        Arguments:
+        in_ -- the input name
+        images -- an np.ndarray of shape (N, H, W, C)
+        out -- the destination, e.g. net.blobs[in_].data (N, C, H, W)
+        """
+        if in_ not in self.inputs:
+            raise Exception('%s is not one of the net inputs: %s' % (in_, self.inputs))
+        if not self.resize:
+            self._set_input_shape(in_, images.shape[1:])
+        if tuple(images.shape[1:3]) != tuple(self.inputs[in_][2:]):
+            # resizing is done one image at a time
+            for index, image in enumerate(images):
+                out[index] = self.preprocess(in_, image)
+            return out
+
+        transpose = self.transpose.get(in_)
+        channel_swap = self.channel_swap.get(in_)
+        raw_scale = self.raw_scale.get(in_)
+        mean = self.mean.get(in_)
+        input_scale = self.input_scale.get(in_)
+
+        if transpose is not None:
+            images = images.transpose((0,) + tuple(axis + 1 for axis in transpose))
+        # the assignments convert to float directly into out
+        if channel_swap is not None:
+            for channel, source in enumerate(channel_swap):
+                out[:, channel] = images[:, source]
+        else:
+            out[...] = images
+        if raw_scale is not None:
+            out *= raw_scale
+        if mean is not None:
+            out -= mean
+        if input_scale is not None:
+            out *= input_scale
+        return out
+
+    def _set_input_shape(self, in_, shape):
+        """
+        Update the target input dimensions such that no resize occurs
+
+        Arguments:
+        in_ -- the input name
+        shape -- the shape of an image (H, W[, C])
+        """
+        self.inputs[in_] = self.inputs[in_][:2] + tuple(shape[:2])
+        # do we have a mean?
+        if in_ in self.mean:
+            # resize mean if necessary
+            if self.mean[in_].size > 1:
+                # we are doing mean image subtraction
+                if self.mean[in_].size != np.prod(shape):
+                    # mean image size is different from data size
+                    # => we need to resize the mean image
+                    transpose = self.transpose.get(in_)
+                    if transpose is not None:
+                        # detranspose
+                        self.mean[in_] = self.mean[in_].transpose(
+                            np.argsort(transpose))
+                    self.mean[in_] = caffe.io.resize_image(
+                        self.mean[in_],
+                        shape[:2])
+                    if transpose is not None:
+                        # retranspose
+                        self.mean[in_] = self.mean[in_].transpose(transpose)
+
 
 @subclass
 class Error(Exception):
@@ -133,6 +202,7 @@ class CaffeTrainTask(TrainTask):
         self.loaded_snapshot_epoch = None
         self.image_mean = None
         self.solver = None
+        self._transformers = {}
 
         self.solver_file = CAFFE_SOLVER_FILE
         self.model_file = CAFFE_ORIGINAL_FILE
@@ -151,10 +221,8 @@ class CaffeTrainTask(TrainTask):
         # Don't pickle these things
         if 'caffe_log' in state:
             del state['caffe_log']
-        if '_transformer' in state:
-            del state['_transformer']
-        if '_caffe_net' in state:
-            del state['_caffe_net']
+        if '_transformers' in state:
+            del state['_transformers']
 
         return state
 
@@ -206,6 +274,7 @@ class CaffeTrainTask(TrainTask):
 
         # These things don't get pickled
         self.image_mean = None
+        self._transformers = {}
 
     # Task overrides
 
@@ -1440,7 +1509,7 @@ class CaffeTrainTask(TrainTask):
                           gpu=None,
                           resize=True):
         """
-        Returns a list of OrderedDict, one for each image
+        Returns an OrderedDict of output name -> array with one row per image
 
         Arguments:
         images -- a list of np.arrays
@@ -1457,7 +1526,8 @@ class CaffeTrainTask(TrainTask):
             else:
                 caffe_images.append(image)
 
-        data_shape = tuple(self.get_transformer(resize).inputs['data'])[1:]
+        transformer = self.get_transformer(resize)
+        data_shape = tuple(transformer.inputs['data'])[1:]
 
         if self.batch_size:
             data_shape = (self.batch_size,) + data_shape
@@ -1466,27 +1536,29 @@ class CaffeTrainTask(TrainTask):
             data_shape = (constants.DEFAULT_BATCH_SIZE,) + data_shape
 
         outputs = None
-        for chunk in [caffe_images[x:x + data_shape[0]] for x in xrange(0, len(caffe_images), data_shape[0])]:
+        for start in xrange(0, len(caffe_images), data_shape[0]):
+            chunk = caffe_images[start:start + data_shape[0]]
             new_shape = (len(chunk),) + data_shape[1:]
             if net.blobs['data'].data.shape != new_shape:
                 net.blobs['data'].reshape(*new_shape)
-            for index, image in enumerate(chunk):
-                net.blobs['data'].data[index] = self.get_transformer(resize).preprocess(
-                    'data', image)
+            if len(set(image.shape for image in chunk)) == 1:
+                transformer.preprocess_batch('data', np.stack(chunk), net.blobs['data'].data)
+            else:
+                for index, image in enumerate(chunk):
+                    net.blobs['data'].data[index] = transformer.preprocess('data', image)
             o = net.forward()
 
-            # order output in prototxt order
-            output = OrderedDict()
-            for blob in net.blobs.keys():
-                if blob in o:
-                    output[blob] = o[blob]
-
             if outputs is None:
-                outputs = copy.deepcopy(output)
-            else:
-                for name, blob in output.iteritems():
-                    outputs[name] = np.vstack((outputs[name], blob))
-            print 'Processed %s/%s images' % (len(outputs[outputs.keys()[0]]), len(caffe_images))
+                # allocate the outputs for all images, in prototxt order
+                outputs = OrderedDict()
+                for blob in net.blobs.keys():
+                    if blob in o:
+                        shape = (len(caffe_images),) + o[blob].shape[1:]
+                        outputs[blob] = np.empty(shape, dtype=o[blob].dtype)
+
+            for name, output in outputs.iteritems():
+                output[start:start + len(chunk)] = o[name]
+            print 'Processed %s/%s images' % (start + len(chunk), len(caffe_images))
 
         return outputs
 
@@ -1499,6 +1571,8 @@ class CaffeTrainTask(TrainTask):
     def get_net(self, epoch=None, gpu=None):
         """
         Returns an instance of caffe.Net
+        Nets are kept in net_cache, so switching between snapshots doesn't
+        reload them every time
 
         Keyword Arguments:
         epoch -- which snapshot to load (default is -1 to load the most recently generated snapshot)
@@ -1508,13 +1582,21 @@ class CaffeTrainTask(TrainTask):
 
         file_to_load = self.get_snapshot(epoch)
 
-        # check if already loaded
-        if self.loaded_snapshot_file and self.loaded_snapshot_file == file_to_load \
-                and hasattr(self, '_caffe_net') and self._caffe_net is not None:
-            return self._caffe_net
-
         CaffeTrainTask.set_mode(gpu)
 
+        net = net_cache.get((file_to_load, gpu),
+                            lambda: self._load_net(file_to_load),
+                            get_net_size)
+
+        self.loaded_snapshot_epoch = epoch
+        self.loaded_snapshot_file = file_to_load
+
+        return net
+
+    def _load_net(self, file_to_load):
+        """
+        Returns a new instance of caffe.Net for this snapshot file
+        """
         # Add job_dir to PATH to pick up any python layers used by the model
         sys.path.append(self.job_dir)
 
@@ -1528,18 +1610,17 @@ class CaffeTrainTask(TrainTask):
                 pass
 
         # Load the model
-        self._caffe_net = caffe.Net(
-            self.path(self.deploy_file),
-            file_to_load,
-            caffe.TEST)
-
-        # Remove job_dir from PATH
-        sys.path.remove(self.job_dir)
-
-        self.loaded_snapshot_epoch = epoch
-        self.loaded_snapshot_file = file_to_load
+        try:
+            net = caffe.Net(
+                self.path(self.deploy_file),
+                file_to_load,
+                caffe.TEST)
+        finally:
+            # Remove job_dir from PATH
+            sys.path.remove(self.job_dir)
 
-        return self._caffe_net
+        self.logger.debug('Loaded %s (net cache: %s)' % (file_to_load, net_cache.stats()))
+        return net
 
     def get_transformer(self, resize=True):
         """
@@ -1548,8 +1629,8 @@ class CaffeTrainTask(TrainTask):
         - resize_shape: specify shape of network (or None for network default)
         """
         # check if already loaded
-        if hasattr(self, '_transformer') and self._transformer is not None:
-            return self._transformer
+        if resize in self._transformers:
+            return self._transformers[resize]
 
         data_shape = None
         channel_swap = None
@@ -1595,8 +1676,8 @@ class CaffeTrainTask(TrainTask):
 
         # t.set_raw_scale('data', 255) # [0,255] range instead of [0,1]
 
-        self._transformer = t
-        return self._transformer
+        self._transformers[resize] = t
+        return t
 
     @override
     def get_model_files(self):
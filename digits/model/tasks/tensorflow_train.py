@@ -804,7 +804,7 @@ class TensorflowTrainTask(TrainTask):
         # resize parameter is unused
         return self.infer_many_images(data, snapshot_epoch=snapshot_epoch, gpu=gpu)
 
-    def infer_many_images(self, images, snapshot_epoch=None, gpu=None):
+    def infer_many_images(self, images, snapshot_epoch=None, gpu=None, binary_output=True):
         """
         Returns (labels, results):
         labels -- an array of strings
@@ -820,19 +820,19 @@ class TensorflowTrainTask(TrainTask):
 
         Keyword arguments:
         snapshot_epoch -- which snapshot to use
+        binary_output -- get the predictions from a .npy file rather than from the log
         """
 
-        # create a temporary folder to store images and a temporary file
-        # to store a list of paths to the images
+        # create a temporary folder to store the images (in a single
+        # TFRecords file) and a list of the files
         temp_dir_path = tempfile.mkdtemp(suffix='.tfrecords')
         try:  # this try...finally clause is used to clean up the temp directory in any case
-            with open(os.path.join(temp_dir_path, 'list.txt'), 'w') as imglist_file:
+            writer = tf.python_io.TFRecordWriter(os.path.join(temp_dir_path, 'images.tfrecords'))
+            try:
                 for image in images:
                     if image.ndim < 3:
                         image = image[..., np.newaxis]
                     image = image.astype('float')
-                    temp_image_handle, temp_image_path = tempfile.mkstemp(dir=temp_dir_path, suffix='.tfrecords')
-                    writer = tf.python_io.TFRecordWriter(temp_image_path)
                     record = tf.train.Example(features=tf.train.Features(feature={
                         'height': _int64_feature(image.shape[0]),
                         'width': _int64_feature(image.shape[1]),
@@ -841,9 +841,10 @@ class TensorflowTrainTask(TrainTask):
                         'label': _int64_feature(0),
                         'encoding': _int64_feature(0)}))
                     writer.write(record.SerializeToString())
-                    writer.close()
-                    imglist_file.write("%s\n" % temp_image_path)
-                    os.close(temp_image_handle)
+            finally:
+                writer.close()
+            with open(os.path.join(temp_dir_path, 'list.txt'), 'w') as imglist_file:
+                imglist_file.write('images.tfrecords\n')
 
             file_to_load = self.get_snapshot(snapshot_epoch)
 
@@ -857,6 +858,10 @@ class TensorflowTrainTask(TrainTask):
                     '--weights=%s' % file_to_load,
                     ]
 
+            predictions_path = os.path.join(temp_dir_path, 'predictions.npy')
+            if binary_output:
+                args.append('--predictions_file=%s' % predictions_path)
+
             if hasattr(self.dataset, 'labels_file'):
                 args.append('--labels_list=%s' % self.dataset.path(self.dataset.labels_file))
 
@@ -934,6 +939,13 @@ class TensorflowTrainTask(TrainTask):
                 raise digits.inference.errors.InferenceError(error_message)
             else:
                 self.logger.info('%s classify many task completed.' % self.get_framework_id())
+
+            if binary_output:
+                if not os.path.exists(predictions_path):
+                    raise digits.inference.errors.InferenceError(
+                        '%s classify many task saved no predictions' % self.get_framework_id())
+                # copy, the file is about to be deleted
+                predictions = np.array(np.load(predictions_path, mmap_mode='r'))
         finally:
             shutil.rmtree(temp_dir_path)
 
@@ -9,3 +9,35 @@ def test_caffe_imports():
 
     import numpy  # noqa
     import google.protobuf  # noqa
+
+
+class TestPreprocessBatch():
+
+    def test_preprocess_batch(self):
+        for channel_swap in None, (2, 1, 0):
+            for mean in None, 'pixel', 'image':
+                for resize in True, False:
+                    yield self.check_preprocess_batch, channel_swap, mean, resize
+
+    def check_preprocess_batch(self, channel_swap, mean, resize):
+        test_utils.skipIfNotFramework('caffe')
+        import copy
+        import numpy as np
+        from .caffe_train import DigitsTransformer
+
+        t = DigitsTransformer(inputs={'data': (4, 3, 8, 10)}, resize=resize)
+        t.set_transpose('data', (2, 0, 1))
+        if channel_swap is not None:
+            t.set_channel_swap('data', channel_swap)
+        if mean == 'pixel':
+            t.set_mean('data', np.array([10.0, 20.0, 30.0]))
+        elif mean == 'image':
+            t.set_mean('data', np.random.rand(3, 8, 10) * 50)
+        t.set_input_scale('data', 0.5)
+
+        images = np.random.randint(0, 255, (4, 8, 10, 3)).astype(np.uint8)
+        reference = copy.deepcopy(t)
+        expected = np.array([reference.preprocess('data', image) for image in images])
+        out = np.empty(expected.shape, dtype=np.float32)
+        assert t.preprocess_batch('data', images, out) is out
+        assert np.allclose(out, expected, atol=1e-4)
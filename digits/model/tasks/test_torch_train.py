@@ -0,0 +1,39 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+
+from .torch_train import TorchTrainTask
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestWriteImagesHdf5():
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_write(self):
+        for shape in (4, 5, 3), (4, 5):
+            yield self.check_write, shape
+
+    def check_write(self, shape):
+        images = [np.random.randint(0, 256, shape).astype(np.uint8) for _ in xrange(3)]
+        path = os.path.join(self.folder, 'images.h5')
+        TorchTrainTask.write_images_hdf5(images, path)
+        with h5py.File(path, 'r') as db:
+            data = db['data'][...]
+        assert data.shape == (3, 4, 5, shape[2] if len(shape) == 3 else 1)
+        assert data.dtype == np.uint8
+        for image, expected in zip(data, images):
+            assert np.array_equal(image.reshape(expected.shape), expected)
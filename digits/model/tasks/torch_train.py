@@ -826,7 +826,19 @@ class TorchTrainTask(TrainTask):
         # resize parameter is unused
         return self.infer_many_images(data, snapshot_epoch=snapshot_epoch, gpu=gpu)
 
-    def infer_many_images(self, images, snapshot_epoch=None, gpu=None):
+    @staticmethod
+    def write_images_hdf5(images, path):
+        """
+        Write a list of images of the same shape to the "data" dataset of
+        an HDF5 file, as test.lua --testMany=yes reads them (NxHxWxC)
+        """
+        with h5py.File(path, 'w') as db:
+            dset = db.create_dataset('data', shape=(len(images),) + images[0].shape[:2] + (
+                images[0].shape[2] if images[0].ndim == 3 else 1,), dtype=np.uint8)
+            for index, image in enumerate(images):
+                dset[index] = image.reshape(dset.shape[1:])
+
+    def infer_many_images(self, images, snapshot_epoch=None, gpu=None, binary_output=True):
         """
         Returns (labels, results):
         labels -- an array of strings
@@ -842,26 +854,32 @@ class TorchTrainTask(TrainTask):
 
         Keyword arguments:
         snapshot_epoch -- which snapshot to use
+        binary_output -- get the predictions from an HDF5 file rather than from the log
         """
 
-        # create a temporary folder to store images and a temporary file
-        # to store a list of paths to the images
+        # create a temporary folder to store the images
         temp_dir_path = tempfile.mkdtemp()
         try:  # this try...finally clause is used to clean up the temp directory in any case
-            temp_imglist_handle, temp_imglist_path = tempfile.mkstemp(dir=temp_dir_path, suffix='.txt')
-            for image in images:
-                temp_image_handle, temp_image_path = tempfile.mkstemp(
-                    dir=temp_dir_path, suffix='.png')
-                image = PIL.Image.fromarray(image)
-                try:
-                    image.save(temp_image_path, format='png')
-                except KeyError:
-                    error_message = 'Unable to save file to "%s"' % temp_image_path
-                    self.logger.error(error_message)
-                    raise digits.inference.errors.InferenceError(error_message)
-                os.write(temp_imglist_handle, "%s\n" % temp_image_path)
-                os.close(temp_image_handle)
-            os.close(temp_imglist_handle)
+            if len(set((image.shape, image.dtype) for image in images)) == 1 and images[0].dtype == np.uint8:
+                # write all images to one HDF5 dataset
+                temp_imglist_path = os.path.join(temp_dir_path, 'images.h5')
+                self.write_images_hdf5(images, temp_imglist_path)
+            else:
+                # write PNG files and a list of paths to them
+                temp_imglist_handle, temp_imglist_path = tempfile.mkstemp(dir=temp_dir_path, suffix='.txt')
+                for image in images:
+                    temp_image_handle, temp_image_path = tempfile.mkstemp(
+                        dir=temp_dir_path, suffix='.png')
+                    image = PIL.Image.fromarray(image)
+                    try:
+                        image.save(temp_image_path, format='png')
+                    except KeyError:
+                        error_message = 'Unable to save file to "%s"' % temp_image_path
+                        self.logger.error(error_message)
+                        raise digits.inference.errors.InferenceError(error_message)
+                    os.write(temp_imglist_handle, "%s\n" % temp_image_path)
+                    os.close(temp_image_handle)
+                os.close(temp_imglist_handle)
 
             file_to_load = self.get_snapshot(snapshot_epoch)
 
@@ -878,6 +896,10 @@ class TorchTrainTask(TrainTask):
                     '--snapshot=%s' % file_to_load,
                     ]
 
+            predictions_path = os.path.join(temp_dir_path, 'predictions.h5')
+            if binary_output:
+                args.append('--predictionsFile=%s' % predictions_path)
+
             if hasattr(self.dataset, 'labels_file'):
                 args.append('--labels=%s' % self.dataset.path(self.dataset.labels_file))
 
@@ -967,6 +989,10 @@ class TorchTrainTask(TrainTask):
                 raise digits.inference.errors.InferenceError(error_message)
             else:
                 self.logger.info('%s classify many task completed.' % self.get_framework_id())
+
+            if binary_output and os.path.exists(predictions_path):
+                with h5py.File(predictions_path, 'r') as db:
+                    predictions = db['predictions'][...]
         finally:
             shutil.rmtree(temp_dir_path)
 
@@ -7,19 +7,33 @@ import time
 
 import flask
 import gevent
+import numpy as np
 import psutil
 
 from digits import device_query
 from digits.task import Task
 from digits.tools.k8s.k8s_coordinate import KubernetasCoord
 from digits.utils import subclass, override
+from digits.utils.metric_series import combine_min_max, MetricSeries, minmax_decimation
 
 # NOTE: Increment this every time the picked object changes
-PICKLE_VERSION = 2
+PICKLE_VERSION = 3
 
-# Used to store network outputs
+# Used to store network outputs (data is a MetricSeries)
 NetworkOutput = namedtuple('NetworkOutput', ['kind', 'data'])
 
+# Outputs are cut down to this many buckets for graphs
+GRAPH_BUCKETS = 100
+
+
+def graph_values(values, indices, missing):
+    """
+    Returns the values at these indices (where there are values) as a list,
+    with missing instead of NaN
+    """
+    values = values[indices[indices < len(values)]].tolist()
+    return [missing if x != x else x for x in values]
+
 
 @subclass
 class TrainTask(Task):
@@ -87,6 +101,7 @@ class TrainTask(Task):
         # data gets stored as dicts of lists (for graphing)
         self.train_outputs = OrderedDict()
         self.val_outputs = OrderedDict()
+        self._output_aggregates = {}
 
     def __getstate__(self):
         state = super(TrainTask, self).__getstate__()
@@ -98,6 +113,8 @@ class TrainTask(Task):
             del state['_labels']
         if '_hw_socketio_thread' in state:
             del state['_hw_socketio_thread']
+        if '_output_aggregates' in state:
+            del state['_output_aggregates']
         return state
 
     def __setstate__(self, state):
@@ -119,6 +136,11 @@ class TrainTask(Task):
                     state['val_outputs']['accuracy'] = NetworkOutput('Accuracy', [x[1] / 100 for x in va])
                 state['val_outputs']['loss'] = NetworkOutput('SoftmaxWithLoss', [x[1] for x in vl])
 
+        if state['pickver_task_train'] < 3:
+            for outputs in state['train_outputs'], state['val_outputs']:
+                for name, output in outputs.items():
+                    outputs[name] = NetworkOutput(output.kind, MetricSeries(output.data))
+
         if state['use_mean'] is True:
             state['use_mean'] = 'pixel'
         elif state['use_mean'] is False:
@@ -130,6 +152,7 @@ class TrainTask(Task):
         self.snapshots = []
         self.timeline_traces = []
         self.dataset = None
+        self._output_aggregates = {}
 
     def get_mpi_args(self, node_count, slots):
         if True:
@@ -274,7 +297,7 @@ class TrainTask(Task):
         """
         Save output to self.train_outputs
         """
-        from digits.webapp import socketio
+        from digits.webapp import scheduler, socketio
 
         if not self.save_output(self.train_outputs, *args):
             return
@@ -285,6 +308,8 @@ class TrainTask(Task):
 
         self.logger.debug('Training %s%% complete.' % round(100 * self.current_epoch / self.train_epochs, 2))
 
+        scheduler.on_train_outputs_update(self)
+
         # loss graph data
         data = self.combined_graph_data()
         if data:
@@ -364,12 +389,12 @@ class TrainTask(Task):
 
         # update d['epoch']
         if 'epoch' not in d:
-            d['epoch'] = NetworkOutput('Epoch', [self.current_epoch])
+            d['epoch'] = NetworkOutput('Epoch', MetricSeries([self.current_epoch]))
         elif d['epoch'].data[-1] != self.current_epoch:
             d['epoch'].data.append(self.current_epoch)
 
         if name not in d:
-            d[name] = NetworkOutput(kind, [])
+            d[name] = NetworkOutput(kind, MetricSeries())
         epoch_len = len(d['epoch'].data)
         name_len = len(d[name].data)
 
@@ -379,7 +404,7 @@ class TrainTask(Task):
         elif name_len == epoch_len:
             # already exists
             if isinstance(d[name].data[-1], list):
-                d[name].data[-1].append(value)
+                d[name].data[-1] = d[name].data[-1] + [value]
             else:
                 d[name].data[-1] = [d[name].data[-1], value]
         elif name_len == epoch_len - 1:
@@ -397,6 +422,34 @@ class TrainTask(Task):
                     return False
         return True
 
+    def output_aggregates(self):
+        """
+        Returns {(prefix, name): (last, min, max)} for each train ("train"
+        prefix) and val ("val" prefix) output which has data
+        The min and max leave out missing values
+
+        The min and max are kept from one call to the next and only
+        updated with the values which were added since
+        """
+        aggregates = {}
+        for prefix, outputs in (('train', self.train_outputs),
+                                ('val', self.val_outputs)):
+            for name, output in outputs.iteritems():
+                data = output.data
+                if not len(data):
+                    continue
+                # the last value can still be changed by save_output()
+                n, settled = self._output_aggregates.get((prefix, name), (0, (None, None)))
+                if n > len(data) - 1:
+                    n, settled = 0, (None, None)
+                if n < len(data) - 1:
+                    settled = combine_min_max(settled, data.min_max(n, len(data) - 1))
+                    n = len(data) - 1
+                    self._output_aggregates[(prefix, name)] = (n, settled)
+                min_value, max_value = combine_min_max(settled, data.min_max(n))
+                aggregates[(prefix, name)] = (data[-1], min_value, max_value)
+        return aggregates
+
     @override
     def after_run(self):
         if hasattr(self, '_hw_socketio_thread'):
@@ -524,9 +577,10 @@ class TrainTask(Task):
             return None
 
         # return 100-200 values or fewer
-        stride = max(len(self.train_outputs['epoch'].data) / 100, 1)
-        e = ['epoch'] + self.train_outputs['epoch'].data[::stride]
-        lr = ['lr'] + self.train_outputs['learning_rate'].data[::stride]
+        lr = self.train_outputs['learning_rate'].data.to_array()
+        indices = minmax_decimation(len(self.train_outputs['epoch'].data), [lr], GRAPH_BUCKETS)
+        e = ['epoch'] + self.train_outputs['epoch'].data.to_array()[indices].tolist()
+        lr = ['lr'] + graph_values(lr, indices, None)
 
         return {
             'columns': [e, lr],
@@ -583,58 +637,10 @@ class TrainTask(Task):
             'names': {},
         }
 
-        added_train_data = False
-        added_val_data = False
-
-        if self.train_outputs and 'epoch' in self.train_outputs:
-            if cull:
-                # max 200 data points
-                stride = max(len(self.train_outputs['epoch'].data) / 100, 1)
-            else:
-                # return all data
-                stride = 1
-            for name, output in self.train_outputs.iteritems():
-                if name not in ['epoch', 'learning_rate']:
-                    col_id = '%s-train' % name
-                    data['xs'][col_id] = 'train_epochs'
-                    data['names'][col_id] = '%s (train)' % name
-                    if 'accuracy' in output.kind.lower() or 'accuracy' in name.lower():
-                        data['columns'].append([col_id] + [
-                            (100 * x if x is not None else 'none')
-                            for x in output.data[::stride]])
-                        data['axes'][col_id] = 'y2'
-                    else:
-                        data['columns'].append([col_id] + [
-                            (x if x is not None else 'none')
-                            for x in output.data[::stride]])
-                    added_train_data = True
-        if added_train_data:
-            data['columns'].append(['train_epochs'] + self.train_outputs['epoch'].data[::stride])
-
-        if self.val_outputs and 'epoch' in self.val_outputs:
-            if cull:
-                # max 200 data points
-                stride = max(len(self.val_outputs['epoch'].data) / 100, 1)
-            else:
-                # return all data
-                stride = 1
-            for name, output in self.val_outputs.iteritems():
-                if name not in ['epoch']:
-                    col_id = '%s-val' % name
-                    data['xs'][col_id] = 'val_epochs'
-                    data['names'][col_id] = '%s (val)' % name
-                    if 'accuracy' in output.kind.lower() or 'accuracy' in name.lower():
-                        data['columns'].append([col_id] + [
-                            (100 * x if x is not None else 'none')
-                            for x in output.data[::stride]])
-                        data['axes'][col_id] = 'y2'
-                    else:
-                        data['columns'].append([col_id] + [
-                            (x if x is not None else 'none')
-                            for x in output.data[::stride]])
-                    added_val_data = True
-        if added_val_data:
-            data['columns'].append(['val_epochs'] + self.val_outputs['epoch'].data[::stride])
+        added_train_data = self.add_graph_columns(
+            data, self.train_outputs, 'train', ['epoch', 'learning_rate'], cull)
+        self.add_graph_columns(
+            data, self.val_outputs, 'val', ['epoch'], cull)
 
         if added_train_data:
             return data
@@ -643,6 +649,45 @@ class TrainTask(Task):
             # helps with ordering of columns in graph
             return None
 
+    def add_graph_columns(self, data, outputs, prefix, skipped, cull):
+        """
+        Add the columns of a dict of outputs to the data of combined_graph_data()
+        Returns True if any were added
+
+        Arguments:
+        data -- the graph data
+        outputs -- self.train_outputs or self.val_outputs
+        prefix -- "train" or "val"
+        skipped -- the names of the outputs which aren't shown
+        cull -- if True, only keep the minimum and maximum of each
+            output over GRAPH_BUCKETS buckets (max ~200 data points)
+        """
+        if not outputs or 'epoch' not in outputs:
+            return False
+        names = [name for name in outputs if name not in skipped]
+        if not names:
+            return False
+
+        epochs = outputs['epoch'].data
+        columns = [outputs[name].data.to_array() for name in names]
+        if cull:
+            indices = minmax_decimation(len(epochs), columns, GRAPH_BUCKETS)
+        else:
+            # return all data
+            indices = np.arange(len(epochs))
+
+        epochs_id = '%s_epochs' % prefix
+        for name, column in zip(names, columns):
+            col_id = '%s-%s' % (name, prefix)
+            data['xs'][col_id] = epochs_id
+            data['names'][col_id] = '%s (%s)' % (name, prefix)
+            if 'accuracy' in outputs[name].kind.lower() or 'accuracy' in name.lower():
+                column = 100 * column
+                data['axes'][col_id] = 'y2'
+            data['columns'].append([col_id] + graph_values(column, indices, 'none'))
+        data['columns'].append([epochs_id] + epochs.to_array()[indices].tolist())
+        return True
+
     # return id of framework used for training
     def get_framework_id(self):
         """
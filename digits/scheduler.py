@@ -1,7 +1,7 @@
 # Copyright (c) 2014-2017, NVIDIA CORPORATION.  All rights reserved.
 from __future__ import absolute_import
 
-from collections import OrderedDict
+from collections import deque, OrderedDict
 import os
 import shutil
 import signal
@@ -11,11 +11,15 @@ import traceback
 import gevent
 import gevent.event
 import gevent.queue
+import gevent.threadpool
+import numpy as np
 
 from . import utils
 from .config import config_value
 from .dataset import DatasetJob
+from .inference.worker import InferenceWorkerPool
 from .job import Job
+from .job_index import JobIndex, LazyJobDict
 from .log import logger
 from .model import ModelJob
 from .pretrained_model import PretrainedModelJob
@@ -28,6 +32,17 @@ deleting completed non-persistent jobs
 """
 NON_PERSISTENT_JOB_DELETE_TIMEOUT_SECONDS = 3600
 
+"""
+How often running jobs are saved and unclaimed jobs are deleted
+(the main thread otherwise only wakes up on status updates)
+"""
+SAVE_INTERVAL_SECONDS = 15
+
+"""
+How many recently started tasks the scheduling latency is measured over
+"""
+LATENCY_WINDOW = 1000
+
 
 class Resource(object):
     """
@@ -100,9 +115,17 @@ class Scheduler:
         gpu_list -- a comma-separated string which is a list of GPU id's
         verbose -- if True, print more errors
         """
-        self.jobs = OrderedDict()
+        self.jobs = LazyJobDict(self.load_jobs)
         self.verbose = verbose
 
+        job_loading = config_value('job_loading')
+        self.lazy_loading = job_loading['lazy']
+        self.loading_threads = job_loading['threads']
+        self.loading_pool = None
+        self.job_index = JobIndex(config_value('jobs_dir'), self.get_job)
+        # (job_id, exception) for each job which couldn't be loaded
+        self.failed_jobs = []
+
         # Keeps track of resource usage
         self.resources = {
             # TODO: break this into CPU cores, memory usage, IO usage, etc.
@@ -114,52 +137,60 @@ class Scheduler:
                      for index in gpu_list.split(',')] if gpu_list else [],
         }
 
+        # Keeps models loaded for the classify views
+        inference_workers = config_value('inference_workers')
+        self.inference_workers = InferenceWorkerPool(
+            enabled=inference_workers['enabled'],
+            idle_timeout=inference_workers['idle_timeout'],
+            memory_budget=inference_workers['memory_budget'] << 20,
+            gpu=inference_workers['gpu'],
+            max_batch_size=inference_workers['max_batch_size'],
+            max_batch_wait=inference_workers['max_batch_wait'] / 1000.0,
+            max_request_size=inference_workers['max_request_size'],
+        )
+
+        # Jobs which haven't reached a terminal status, the only ones the
+        # main thread looks at when it wakes up
+        self.active_jobs = OrderedDict()
+        # Non-persistent jobs which are done, deleted after a timeout
+        self.unclaimed_jobs = OrderedDict()
+        # Jobs waiting for their delayed start
+        self.starting_jobs = set()
+        # Set when the main thread has work to do, and when it was first set
+        self.wakeup = gevent.event.Event()
+        self.wakeup_time = None
+        self.tasks_started = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
         self.running = False
         self.shutdown = gevent.event.Event()
 
     def load_past_jobs(self):
         """
         Look in the jobs directory and load all valid jobs
+
+        With lazy loading, only the jobs which were saved since the job
+        index was last written are loaded now, the others are loaded
+        when they're first accessed
         """
-        loaded_jobs = []
-        failed_jobs = []
-        for dir_name in sorted(os.listdir(config_value('jobs_dir'))):
-            if os.path.isdir(os.path.join(config_value('jobs_dir'), dir_name)):
-                # Make sure it hasn't already been loaded
-                if dir_name in self.jobs:
-                    continue
-
-                try:
-                    job = Job.load(dir_name)
-                    # The server might have crashed
-                    if job.status.is_running():
-                        job.status = Status.ABORT
-                    for task in job.tasks:
-                        if task.status.is_running():
-                            task.status = Status.ABORT
-
-                    # We might have changed some attributes here or in __setstate__
-                    job.save()
-                    loaded_jobs.append(job)
-                except Exception as e:
-                    failed_jobs.append((dir_name, e))
+        jobs_dir = config_value('jobs_dir')
+        job_ids = [dir_name for dir_name in sorted(os.listdir(jobs_dir))
+                   # Make sure it hasn't already been loaded
+                   if dir_name not in self.jobs and os.path.isdir(os.path.join(jobs_dir, dir_name))]
 
-        # add DatasetJobs or PretrainedModelJobs
-        for job in loaded_jobs:
-            if isinstance(job, DatasetJob) or isinstance(job, PretrainedModelJob):
-                self.jobs[job.id()] = job
+        stale = self.job_index.refresh(job_ids, self.get_loading_pool().map(self.job_index.stat, job_ids))
+        for job_id in job_ids:
+            self.jobs.add_unloaded(job_id)
 
-        # add ModelJobs
-        for job in loaded_jobs:
-            if isinstance(job, ModelJob):
-                try:
-                    # load the DatasetJob
-                    job.load_dataset()
-                    self.jobs[job.id()] = job
-                except Exception as e:
-                    failed_jobs.append((dir_name, e))
+        n_failed = len(self.failed_jobs)
+        self.jobs.load(stale if self.lazy_loading else job_ids)
+        self.job_index.save()
+        failed_jobs = self.failed_jobs[n_failed:]
 
-        logger.info('Loaded %d jobs.' % len(self.jobs))
+        if self.lazy_loading:
+            logger.info('Indexed %d jobs, loaded %d.' % (len(self.jobs), len(self.jobs) - len(self.jobs.unloaded())))
+        else:
+            logger.info('Loaded %d jobs.' % len(self.jobs))
 
         if len(failed_jobs):
             logger.warning('Failed to load %d jobs.' % len(failed_jobs))
@@ -167,6 +198,91 @@ class Scheduler:
                 for job_id, e in failed_jobs:
                     logger.debug('%s - %s: %s' % (job_id, type(e).__name__, str(e)))
 
+    def load_jobs(self, job_ids):
+        """
+        Load jobs from the jobs directory into self.jobs
+        Called by self.jobs for the jobs which haven't been loaded yet
+
+        The save files and journals are read and the snapshots are detected
+        by a pool of threads, but the jobs are unpickled in this greenlet
+        """
+        pool = self.get_loading_pool()
+
+        def read(job_id):
+            try:
+                return Job.read(job_id), Job.read_journal(job_id)
+            except Exception as e:
+                return e
+
+        def detect_files(job):
+            try:
+                job.detect_files()
+            except Exception as e:
+                return e
+
+        loaded_jobs = []
+        for job_id, data in zip(job_ids, pool.map(read, job_ids)):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                loaded_jobs.append(Job.loads(job_id, *data))
+            except Exception as e:
+                self.job_load_failed(job_id, e)
+
+        jobs = []
+        for job, error in zip(loaded_jobs, pool.map(detect_files, loaded_jobs)):
+            if error is not None:
+                self.job_load_failed(job.id(), error)
+            # only keep DatasetJobs, PretrainedModelJobs and ModelJobs
+            elif isinstance(job, (DatasetJob, PretrainedModelJob, ModelJob)):
+                jobs.append(job)
+
+        # add all the jobs before ModelJobs look for their DatasetJob
+        for job in jobs:
+            self.jobs[job.id()] = job
+
+        for job in jobs:
+            try:
+                changed = False
+                # The server might have crashed
+                if job.status.is_running():
+                    job.status = Status.ABORT
+                    changed = True
+                for task in job.tasks:
+                    if task.status.is_running():
+                        task.status = Status.ABORT
+                        changed = True
+
+                if isinstance(job, ModelJob):
+                    # load the DatasetJob
+                    job.load_dataset()
+
+                if changed:
+                    job.save()
+                self.job_index.update(job)
+            except Exception as e:
+                self.jobs.pop(job.id(), None)
+                self.job_load_failed(job.id(), e)
+
+    def job_load_failed(self, job_id, error):
+        """
+        Record a job which couldn't be loaded
+        """
+        self.failed_jobs.append((job_id, error))
+        # don't list it
+        self.job_index.remove(job_id)
+        if self.running:
+            # loaded lazily, load_past_jobs() isn't there to report it
+            logger.warning('Failed to load job %s - %s: %s' % (job_id, type(error).__name__, error))
+
+    def get_loading_pool(self):
+        """
+        Returns the pool of threads used to load jobs
+        """
+        if self.loading_pool is None:
+            self.loading_pool = gevent.threadpool.ThreadPool(self.loading_threads)
+        return self.loading_pool
+
     def add_job(self, job):
         """
         Add a job to self.jobs
@@ -176,6 +292,9 @@ class Scheduler:
             return False
         else:
             self.jobs[job.id()] = job
+            self.job_index.update(job)
+            self.track_job(job)
+            self.wake_up()
 
             # Need to fix this properly
             # if True or flask._app_ctx_stack.top is not None:
@@ -197,6 +316,56 @@ class Scheduler:
                 time.sleep(utils.wait_time())
             return True
 
+    def track_job(self, job):
+        """
+        Add a job to active_jobs or unclaimed_jobs depending on its status
+        """
+        if job.status.is_running():
+            self.active_jobs[job.id()] = job
+        elif not job.is_persistent():
+            self.unclaimed_jobs[job.id()] = job
+
+    def wake_up(self):
+        """
+        Wake up the main thread to look at the active jobs
+        """
+        if self.wakeup_time is None:
+            self.wakeup_time = time.time()
+        self.wakeup.set()
+
+    def on_job_status_update(self, job):
+        """
+        Called by Job.on_status_update()
+        """
+        if job.id() in self.jobs:
+            self.job_index.update(job)
+            self.wake_up()
+
+    def on_train_outputs_update(self, task):
+        """
+        Called by TrainTask.save_train_output() (at most every few seconds)
+        Keeps the metrics and sparkline in the job index up to date
+        """
+        job = self.get_job(task.job_id)
+        if job is not None:
+            self.job_index.update(job)
+
+    def scheduling_stats(self):
+        """
+        Returns a dict of statistics over the recently started tasks:
+        tasks_started -- total number of tasks started
+        active_jobs -- number of jobs which haven't reached a terminal status
+        latency_p50, latency_p99 -- seconds from the status update which
+            made a task ready to run until the task was started
+        """
+        latencies = list(self.latencies)
+        return {
+            'tasks_started': self.tasks_started,
+            'active_jobs': len(self.active_jobs),
+            'latency_p50': float(np.percentile(latencies, 50)) if latencies else None,
+            'latency_p99': float(np.percentile(latencies, 99)) if latencies else None,
+        }
+
     def get_job(self, job_id):
         """
         Look through self.jobs to try to find the Job
@@ -273,7 +442,12 @@ class Scheduler:
                     ', '.join(['"%s"' % j for j in dependent_jobs]))
                 raise errors.DeleteError(error_message)
             self.jobs.pop(job_id, None)
+            self.active_jobs.pop(job_id, None)
+            self.unclaimed_jobs.pop(job_id, None)
+            self.job_index.remove(job_id)
             job.abort()
+            if isinstance(job, ModelJob):
+                self.inference_workers.stop_model(job_id)
             if os.path.exists(job.dir()):
                 shutil.rmtree(job.dir())
             logger.info('Job deleted.', job_id=job_id)
@@ -344,6 +518,8 @@ class Scheduler:
         Returns True if the shutdown was graceful
         """
         self.shutdown.set()
+        self.wakeup.set()
+        self.inference_workers.stop()
         wait_limit = 5
         start = time.time()
         while self.running:
@@ -354,104 +530,138 @@ class Scheduler:
 
     def main_thread(self):
         """
-        Monitors the jobs in current_jobs, updates their statuses,
+        Monitors the jobs in active_jobs, updates their statuses,
         and puts their tasks in queues to be processed by other threads
+
+        Sleeps until a job or task status update (or a resource release)
+        calls wake_up(), or until the next periodic save
         """
         signal.signal(signal.SIGTERM, self.sigterm_handler)
         try:
             last_saved = None
             while not self.shutdown.is_set():
-                # Iterate backwards so we can delete jobs
-                for job in self.jobs.values():
-                    if job.status == Status.INIT:
-                        def start_this_job(job):
-                            if isinstance(job, ModelJob):
-                                if job.dataset.status == Status.DONE:
-                                    job.status = Status.RUN
-                                elif job.dataset.status in [Status.ABORT, Status.ERROR]:
-                                    job.abort()
-                                else:
-                                    job.status = Status.WAIT
-                            else:
-                                job.status = Status.RUN
-                        if 'DIGITS_MODE_TEST' in os.environ:
-                            start_this_job(job)
-                        else:
-                            # Delay start by one second for initial page load
-                            gevent.spawn_later(1, start_this_job, job)
-
-                    if job.status == Status.WAIT:
-                        if isinstance(job, ModelJob):
-                            if job.dataset.status == Status.DONE:
-                                job.status = Status.RUN
-                            elif job.dataset.status in [Status.ABORT, Status.ERROR]:
-                                job.abort()
-                        else:
-                            job.status = Status.RUN
-
-                    if job.status == Status.RUN:
-                        alldone = True
-                        for task in job.tasks:
-                            if task.status in [Status.INIT, Status.WAIT]:
-                                alldone = False
-                                # try to start the task
-                                if task.ready_to_queue():
-                                    requested_resources = task.offer_resources(self.resources)
-                                    if requested_resources is None:
-                                        task.status = Status.WAIT
-                                    else:
-                                        if self.reserve_resources(task, requested_resources):
-                                            gevent.spawn(self.run_task,
-                                                         task, requested_resources)
-                                            task.status = Status.RUN
-                            elif task.status == Status.RUN:
-                                # job is not done
-                                alldone = False
-                            elif task.status in [Status.DONE, Status.ABORT]:
-                                # job is done
-                                pass
-                            elif task.status == Status.ERROR:
-                                # propagate error status up to job
-                                job.status = Status.ERROR
-                                alldone = False
-                                break
-                            else:
-                                logger.warning('Unrecognized task status: "%s"', task.status, job_id=job.id())
-                        if alldone:
-                            job.status = Status.DONE
-                            logger.info('Job complete.', job_id=job.id())
+                self.wakeup.clear()
+                woken_at = self.wakeup_time
+                self.wakeup_time = None
+
+                for job in self.active_jobs.values():
+                    self.update_job(job, woken_at)
+                    if not job.status.is_running():
+                        # terminal status, don't look at it again
+                        self.active_jobs.pop(job.id(), None)
+                        self.track_job(job)
+                        if job.is_persistent():
+                            # save all of it, and compact its journal
                             job.save()
-
-                # save running jobs every 15 seconds
-                if not last_saved or time.time() - last_saved > 15:
-                    for job in self.jobs.values():
-                        if job.status.is_running():
-                            if job.is_persistent():
-                                job.save()
-                        elif (not job.is_persistent() and
-                              (time.time() - job.status_history[-1][1] >
-                               NON_PERSISTENT_JOB_DELETE_TIMEOUT_SECONDS)):
+                            self.job_index.update(job)
+
+                # save what changed in running jobs every 15 seconds
+                if not last_saved or time.time() - last_saved > SAVE_INTERVAL_SECONDS:
+                    for job in self.active_jobs.values():
+                        if job.is_persistent():
+                            job.save_changes()
+                            self.job_index.update(job)
+                    for job in self.unclaimed_jobs.values():
+                        if (time.time() - job.status_history[-1][1] >
+                                NON_PERSISTENT_JOB_DELETE_TIMEOUT_SECONDS):
                             # job has been unclaimed for far too long => proceed to garbage collection
                             self.delete_job(job)
+                    self.job_index.save()
                     last_saved = time.time()
-                if 'DIGITS_MODE_TEST' not in os.environ:
-                    time.sleep(utils.wait_time())
-                else:
-                    time.sleep(0.05)
+
+                self.wakeup.wait(max(0, last_saved + SAVE_INTERVAL_SECONDS - time.time()))
         except KeyboardInterrupt:
             pass
 
         # Shutdown
-        for job in self.jobs.values():
+        # (the jobs which haven't been loaded can't have changed)
+        for job in self.jobs.loaded():
             job.abort()
             job.save()
+            self.job_index.update(job)
+        self.job_index.save()
         self.running = False
 
+    def update_job(self, job, woken_at=None):
+        """
+        Moves a job through its statuses and starts its tasks
+        when they are ready and resources are available
+
+        Arguments:
+        job -- an active job
+
+        Keyword arguments:
+        woken_at -- when the status update which woke up the main thread happened
+        """
+        if job.status == Status.INIT and job.id() not in self.starting_jobs:
+            def start_this_job(job):
+                self.starting_jobs.discard(job.id())
+                if isinstance(job, ModelJob):
+                    if job.dataset.status == Status.DONE:
+                        job.status = Status.RUN
+                    elif job.dataset.status in [Status.ABORT, Status.ERROR]:
+                        job.abort()
+                    else:
+                        job.status = Status.WAIT
+                else:
+                    job.status = Status.RUN
+            if 'DIGITS_MODE_TEST' in os.environ:
+                start_this_job(job)
+            else:
+                # Delay start by one second for initial page load
+                self.starting_jobs.add(job.id())
+                gevent.spawn_later(1, start_this_job, job)
+
+        if job.status == Status.WAIT:
+            if isinstance(job, ModelJob):
+                if job.dataset.status == Status.DONE:
+                    job.status = Status.RUN
+                elif job.dataset.status in [Status.ABORT, Status.ERROR]:
+                    job.abort()
+            else:
+                job.status = Status.RUN
+
+        if job.status == Status.RUN:
+            alldone = True
+            for task in job.tasks:
+                if task.status in [Status.INIT, Status.WAIT]:
+                    alldone = False
+                    # try to start the task
+                    if task.ready_to_queue():
+                        requested_resources = task.offer_resources(self.resources)
+                        if requested_resources is None:
+                            task.status = Status.WAIT
+                        else:
+                            if self.reserve_resources(task, requested_resources):
+                                gevent.spawn(self.run_task,
+                                             task, requested_resources)
+                                task.status = Status.RUN
+                                self.tasks_started += 1
+                                if woken_at is not None:
+                                    self.latencies.append(time.time() - woken_at)
+                elif task.status == Status.RUN:
+                    # job is not done
+                    alldone = False
+                elif task.status in [Status.DONE, Status.ABORT]:
+                    # job is done
+                    pass
+                elif task.status == Status.ERROR:
+                    # propagate error status up to job
+                    job.status = Status.ERROR
+                    alldone = False
+                    break
+                else:
+                    logger.warning('Unrecognized task status: "%s"', task.status, job_id=job.id())
+            if alldone:
+                job.status = Status.DONE
+                logger.info('Job complete.', job_id=job.id())
+
     def sigterm_handler(self, signal, frame):
         """
         Catch SIGTERM in addition to SIGINT
         """
         self.shutdown.set()
+        self.wakeup.set()
 
     def task_error(self, task, error):
         """
@@ -499,6 +709,8 @@ class Scheduler:
                         resource.deallocate(task)
                         self.emit_gpus_available()
         task.current_resources = None
+        # waiting tasks might be able to run now
+        self.wake_up()
 
     def run_task(self, task, resources):
         """
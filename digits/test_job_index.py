@@ -0,0 +1,134 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import time
+
+from .config import config_value
+from .job import Job
+from .job_index import JobIndex, LazyJobDict
+from .status import Status
+from digits import test_utils
+from digits.utils import subclass, override
+
+
+test_utils.skipIfNotFramework('none')
+
+
+@subclass
+class JobForTesting(Job):
+
+    @override
+    def job_type(self):
+        return 'Job For Testing'
+
+
+class TestLazyJobDict():
+
+    def setUp(self):
+        self.loads = []
+
+        def load(job_ids):
+            self.loads.append(list(job_ids))
+            for job_id in job_ids:
+                if job_id != 'bad':
+                    self.jobs[job_id] = job_id.upper()
+        self.jobs = LazyJobDict(load)
+        for job_id in 'a', 'b', 'bad', 'c':
+            self.jobs.add_unloaded(job_id)
+
+    def test_load_on_access(self):
+        assert len(self.jobs) == 4
+        assert self.jobs['b'] == 'B'
+        assert self.jobs.get('b') == 'B'
+        assert self.loads == [['b']]
+        assert self.jobs.is_loaded('b')
+        assert not self.jobs.is_loaded('a')
+
+    def test_failed_load(self):
+        assert self.jobs.get('bad') is None
+        assert 'bad' not in self.jobs
+        assert len(self.jobs) == 3
+
+    def test_values(self):
+        assert self.jobs.values() == ['A', 'B', 'C']
+        # all the unloaded jobs are loaded together
+        assert self.loads == [['a', 'b', 'bad', 'c']]
+        assert self.jobs.unloaded() == []
+        assert self.jobs.keys() == ['a', 'b', 'c']
+
+
+class TestJobIndex():
+
+    def setUp(self):
+        self.jobs = []
+        self.index_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for job in self.jobs:
+            shutil.rmtree(job.dir(), ignore_errors=True)
+        shutil.rmtree(self.index_dir)
+
+    def create_job(self, name, group='', done=True):
+        job = JobForTesting(name=name, username='digits-testsuite', group=group)
+        self.jobs.append(job)
+        if done:
+            job.status_history.append((Status(Status.DONE), time.time()))
+        job.save()
+        return job
+
+    def test_refresh(self):
+        job = self.create_job('testsuite-job')
+        index = JobIndex(config_value('jobs_dir'))
+        job_ids = [job.id()]
+        assert index.refresh(job_ids, [index.stat(job.id())]) == job_ids
+        index.update(job)
+        assert index.get(job.id())['name'] == 'testsuite-job'
+        assert index.save()
+
+        index = JobIndex(config_value('jobs_dir'))
+        assert index.refresh(job_ids, [index.stat(job.id())]) == []
+
+        # saved since it was indexed
+        os.utime(job.path(Job.SAVE_FILE), (0, 0))
+        assert index.refresh(job_ids, [index.stat(job.id())]) == job_ids
+
+        # deleted
+        index.refresh([], [])
+        assert index.get(job.id()) is None
+        assert index.save()
+
+    def test_refresh_running(self):
+        job = self.create_job('testsuite-job', done=False)
+        index = JobIndex(config_value('jobs_dir'))
+        index.update(job)
+        # it needs to be loaded to be aborted
+        assert index.refresh([job.id()], [index.stat(job.id())]) == [job.id()]
+
+    def test_list(self):
+        index = JobIndex(self.index_dir)
+        for name, group in ('testsuite-b', 'one'), ('testsuite-a', 'two'), ('testsuite-c', 'one'):
+            index.update(self.create_job(name, group))
+
+        total, entries = index.list(sort='name', descending=False, name='testsuite-')
+        assert total == 3
+        assert [e['name'] for e in entries] == ['testsuite-a', 'testsuite-b', 'testsuite-c']
+        assert entries[0]['summary']['status'] == 'Done'
+
+        total, entries = index.list(sort='name', name='TESTSUITE-', group='one', offset=1, limit=5)
+        assert total == 2
+        assert [e['name'] for e in entries] == ['testsuite-b']
+
+        # wildcards are matched literally
+        assert index.list(name='testsuite%')[0] == 0
+
+    def test_sort_column(self):
+        index = JobIndex(self.index_dir)
+        try:
+            index.list(sort='id; DROP TABLE jobs')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('invalid sort column accepted')
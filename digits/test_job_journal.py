@@ -0,0 +1,130 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import os
+import shutil
+import time
+
+from .job import Job
+from .model.tasks.train import NetworkOutput
+from .status import Status
+from .task import Task
+from digits import test_utils
+from digits.utils import subclass, override
+from digits.utils.metric_series import MetricSeries
+
+
+test_utils.skipIfNotFramework('none')
+
+
+@subclass
+class JobForTesting(Job):
+
+    @override
+    def job_type(self):
+        return 'Job For Testing'
+
+
+@subclass
+class TaskForTesting(Task):
+
+    def __init__(self, **kwargs):
+        super(TaskForTesting, self).__init__(**kwargs)
+        self.progress = 0
+        self.train_outputs = OrderedDict()
+
+    @override
+    def name(self):
+        return 'Task For Testing'
+
+
+class TestJournal():
+
+    def setUp(self):
+        self.job = JobForTesting(name='testsuite-job', username='digits-testsuite')
+        self.task = TaskForTesting(job_dir=self.job.dir())
+        self.job.tasks.append(self.task)
+        assert self.job.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.job.dir())
+
+    def add_output(self, name, value):
+        if name not in self.task.train_outputs:
+            self.task.train_outputs[name] = NetworkOutput(name.title(), MetricSeries())
+        self.task.train_outputs[name].data.append(value)
+
+    def test_replay(self):
+        save_file = self.job.path(Job.SAVE_FILE)
+        mtime = os.path.getmtime(save_file)
+        for i in xrange(3):
+            self.add_output('loss', float(i))
+            self.add_output('accuracy', 0.5)
+            self.task.progress = i / 3.0
+            self.task.status_history.append((Status(Status.RUN), time.time()))
+            assert self.job.save_changes()
+        self.job._name = 'renamed'
+
+        # the last value of an output can change after it's saved
+        self.task.train_outputs['accuracy'].data[-1] = [0.5, 0.6]
+        assert self.job.save_changes()
+
+        assert os.path.getmtime(save_file) == mtime, 'the save file was written'
+        assert os.path.exists(self.job.path(Job.JOURNAL_FILE))
+
+        job = Job.load(self.job.id())
+        task = job.tasks[0]
+        assert job.name() == 'renamed'
+        assert task.progress == self.task.progress
+        assert task.status_history == self.task.status_history
+        assert task.train_outputs.keys() == ['loss', 'accuracy']
+        assert task.train_outputs['loss'].data == [0.0, 1.0, 2.0]
+        assert task.train_outputs['accuracy'].data == [0.5, 0.5, [0.5, 0.6]]
+
+    def test_nothing_changed(self):
+        assert self.job.save_changes()
+        assert not os.path.exists(self.job.path(Job.JOURNAL_FILE))
+
+    def test_compaction(self):
+        self.job.MIN_JOURNAL_SIZE = 0
+        save_size = os.path.getsize(self.job.path(Job.SAVE_FILE))
+        while os.path.exists(self.job.path(Job.JOURNAL_FILE)) or not self.task.train_outputs:
+            self.add_output('loss', 1.0)
+            assert self.job.save_changes()
+            assert os.path.getsize(self.job.path(Job.SAVE_FILE)) == save_size or \
+                not os.path.exists(self.job.path(Job.JOURNAL_FILE))
+        job = Job.load(self.job.id())
+        assert job.tasks[0].train_outputs['loss'].data == self.task.train_outputs['loss'].data
+
+    def test_new_task(self):
+        self.job.tasks.append(TaskForTesting(job_dir=self.job.dir()))
+        assert self.job.save_changes()
+        assert not os.path.exists(self.job.path(Job.JOURNAL_FILE))
+        assert len(Job.load(self.job.id()).tasks) == 2
+
+    def test_old_journal(self):
+        self.add_output('loss', 1.0)
+        assert self.job.save_changes()
+        with open(self.job.path(Job.JOURNAL_FILE), 'rb') as infile:
+            journal = infile.read()
+
+        # the server died after writing the save file, before deleting the journal
+        self.task.train_outputs['loss'].data[:] = [2.0, 3.0]
+        assert self.job.save()
+        with open(self.job.path(Job.JOURNAL_FILE), 'wb') as outfile:
+            outfile.write(journal)
+        job = Job.load(self.job.id())
+        assert job.tasks[0].train_outputs['loss'].data == [2.0, 3.0]
+
+    def test_partial_record(self):
+        self.add_output('loss', 1.0)
+        assert self.job.save_changes()
+        self.add_output('loss', 2.0)
+        assert self.job.save_changes()
+
+        # the server died while writing the second record
+        with open(self.job.path(Job.JOURNAL_FILE), 'rb+') as journal:
+            journal.truncate(os.path.getsize(self.job.path(Job.JOURNAL_FILE)) - 5)
+        job = Job.load(self.job.id())
+        assert job.tasks[0].train_outputs['loss'].data == [1.0]
@@ -1,6 +1,9 @@
 # Copyright (c) 2014-2017, NVIDIA CORPORATION.  All rights reserved.
 from __future__ import absolute_import
 
+import shutil
+import time
+
 from . import scheduler
 from .config import config_value
 from .job import Job
@@ -31,6 +34,22 @@ class TestScheduler():
         s = self.get_scheduler()
         assert s.stop(), 'failed to stop'
 
+    def test_load_failed(self):
+        s = self.get_scheduler()
+        job = JobForTesting(name='testsuite-job', username='digits-testsuite')
+        try:
+            assert job.save()
+            s.job_index.update(job)
+            assert s.job_index.get(job.id()) is not None
+            with open(job.path(Job.SAVE_FILE), 'wb') as outfile:
+                outfile.write('corrupt')
+            s.load_jobs([job.id()])
+            assert job.id() not in s.jobs
+            assert s.job_index.get(job.id()) is None, 'the job is still listed'
+        finally:
+            s.job_index.close()
+            shutil.rmtree(job.dir())
+
 
 @subclass
 class JobForTesting(Job):
@@ -58,3 +77,16 @@ class TestSchedulerFlow():
             assert len(self.s.jobs) == 1, 'scheduler has %d jobs' % len(self.s.jobs)
             assert self.s.delete_job(job), 'failed to delete job'
             assert len(self.s.jobs) == 0, 'scheduler has %d jobs' % len(self.s.jobs)
+
+    def test_terminal_jobs_inactive(self):
+        with app.test_request_context():
+            job = JobForTesting(name='testsuite-job', username='digits-testsuite')
+            assert self.s.add_job(job), 'failed to add job'
+            # a job without tasks is done as soon as it runs
+            for _ in xrange(100):
+                if job.id() not in self.s.active_jobs:
+                    break
+                time.sleep(0.01)
+            assert not job.status.is_running(), 'job is still running'
+            assert job.id() not in self.s.active_jobs, 'job is still active'
+            assert self.s.delete_job(job), 'failed to delete job'
@@ -189,6 +189,13 @@ class TestViews(BaseViewsTest):
         rv = self.app.get('/foo')
         assert rv.status_code == 404, 'should return 404'
 
+    def test_scheduler_stats(self):
+        rv = self.app.get('/scheduler/stats.json')
+        assert rv.status_code == 200, 'page load failed with %s' % rv.status_code
+        stats = json.loads(rv.data)
+        for key in ['tasks_started', 'active_jobs', 'latency_p50', 'latency_p99']:
+            assert key in stats, 'missing %s' % key
+
     def test_autocomplete(self):
         for absolute_path in (True, False):
             yield self.check_autocomplete, absolute_path
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import PIL.Image
+
+# Add path for DIGITS package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import digits.config  # noqa
+from digits import log  # noqa
+from digits.tools import create_db  # noqa
+
+logger = logging.getLogger('digits.tools.benchmark_create_db')
+
+
+"""
+Measure where create_db spends its time waiting
+
+For each backend, reports how long the writer waited for the loaders
+(the loaders are the bottleneck) and how long the loaders waited for the
+writer (the database is the bottleneck)
+"""
+
+
+def create_images(folder, count, width, height):
+    """
+    Write `count` random JPEG images to `folder`
+    Returns the path to a labelled list of them
+    """
+    list_path = os.path.join(folder, 'list.txt')
+    with open(list_path, 'w') as outfile:
+        for i in xrange(count):
+            path = os.path.join(folder, '%d.jpg' % i)
+            data = np.random.randint(0, 255, (height, width, 3)).astype(np.uint8)
+            PIL.Image.fromarray(data).save(path, quality=90)
+            outfile.write('%s %d\n' % (path, i % 10))
+    return list_path
+
+
+def benchmark(backends, count, image_size, db_size, workers, shuffle):
+    folder = tempfile.mkdtemp()
+    try:
+        list_path = create_images(folder, count, image_size, image_size)
+        results = []
+        for backend in backends:
+            stats = create_db.create_db(
+                list_path,
+                os.path.join(folder, 'db_%s' % backend),
+                db_size, db_size, 3,
+                backend,
+                shuffle=shuffle,
+                workers=workers,
+                mean_files=[os.path.join(folder, 'mean_%s.npy' % backend)],
+                lmdb_map_size=1 << 30,
+                hdf5_dset_limit=2**31,
+            )
+            results.append((backend, stats))
+    finally:
+        shutil.rmtree(folder)
+
+    print '%-10s %10s %10s %14s %14s' % ('backend', 'seconds', 'images/s', 'writer stall', 'loader stall')
+    for backend, stats in results:
+        print '%-10s %10.2f %10.1f %13.2fs %13.2fs' % (
+            backend,
+            stats['seconds'],
+            stats['images_written'] / stats['seconds'],
+            stats['writer_stall'],
+            stats['loader_stall'],
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create-Db benchmark - DIGITS')
+
+    parser.add_argument('-n', '--count',
+                        type=int,
+                        default=2000,
+                        help='Number of images to generate')
+    parser.add_argument('--image_size',
+                        type=int,
+                        default=256,
+                        help='Size of the generated images')
+    parser.add_argument('--db_size',
+                        type=int,
+                        default=224,
+                        help='Size of the images in the database')
+    parser.add_argument('--workers',
+                        type=int,
+                        help='Number of worker processes (default: use threads)')
+    parser.add_argument('--no-shuffle',
+                        dest='shuffle',
+                        action='store_false',
+                        help='Preserve input order')
+    parser.add_argument('-b', '--backend',
+                        action='append',
+                        help='Backend(s) to benchmark (default: lmdb, hdf5 and tfrecords if enabled)')
+
+    args = vars(parser.parse_args())
+
+    backends = args['backend']
+    if not backends:
+        backends = ['lmdb', 'hdf5']
+        if create_db.tf is not None:
+            backends.append('tfrecords')
+
+    benchmark(backends, args['count'], args['image_size'], args['db_size'],
+              args['workers'], args['shuffle'])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python2
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add path for DIGITS package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import digits.config  # noqa
+from digits import log  # noqa
+from digits.tools import inference  # noqa
+
+logger = logging.getLogger('digits.tools.benchmark_inference_output')
+
+
+"""
+Compare the wall time of batch inference with a Torch or TensorFlow model
+when the predictions are parsed from the log and when they are read from
+a binary file
+"""
+
+
+def benchmark(input_list, jobs_dir, model_id, epoch, count, gpu):
+    model, dataset, epoch = inference.load_model(jobs_dir, model_id, epoch)
+    task = model.train_task()
+    if task.framework_id not in ['torch', 'tensorflow']:
+        raise ValueError('Only Torch and TensorFlow models are supported, not %s' % task.framework_id)
+
+    with open(input_list) as infile:
+        paths = infile.readlines()
+    _, images = inference.load_images(paths, dataset, True)
+    if not images:
+        raise ValueError('Unable to load any image from %s' % input_list)
+    # repeat the images to get the requested count
+    images = [images[i % len(images)] for i in xrange(count)]
+
+    results = {}
+    print '%-8s %12s %14s' % ('output', 'time (s)', 'images/s')
+    for binary_output in False, True:
+        start = time.time()
+        outputs = task.infer_many_images(images, snapshot_epoch=epoch, gpu=gpu, binary_output=binary_output)
+        elapsed = time.time() - start
+        name = 'binary' if binary_output else 'text'
+        results[name] = outputs['output']
+        print '%-8s %12.2f %14.1f' % (name, elapsed, count / elapsed)
+    print 'Largest difference between the predictions: %g' % np.abs(
+        np.asarray(results['binary'], dtype=np.float64) - np.asarray(results['text'], dtype=np.float64)).max()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inference-Output benchmark - DIGITS')
+
+    # Positional arguments
+
+    parser.add_argument(
+        'input_list',
+        help='An input file containing paths to images')
+    parser.add_argument(
+        'model',
+        help='Model ID')
+
+    # Optional arguments
+
+    parser.add_argument(
+        '-n',
+        '--count',
+        type=int,
+        default=10000,
+        help='Number of images to infer (the input images are repeated as needed)',
+    )
+
+    parser.add_argument(
+        '-e',
+        '--epoch',
+        default='-1',
+        help="Epoch (-1 for last)"
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs_dir',
+        default='none',
+        help='Jobs directory (default: from DIGITS config)',
+    )
+
+    parser.add_argument(
+        '-g',
+        '--gpu',
+        type=int,
+        default=None,
+        help='GPU to use (as in nvidia-smi output, default: None)',
+    )
+
+    args = vars(parser.parse_args())
+
+    benchmark(args['input_list'], args['jobs_dir'], args['model'], args['epoch'], args['count'], args['gpu'])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import PIL.Image
+import scipy.misc
+
+# Add path for DIGITS package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from digits.utils import image as image_utils  # noqa
+
+
+"""
+Measure the per-image latency of utils.image.resize_image()
+
+Compares scipy.misc.imresize() on decoded arrays (what resize_image()
+used to do) with resize_image() on arrays, on decoded PIL.Images and on
+JPEG files which haven't been decoded yet (decoded at a reduced scale)
+"""
+
+
+def time_per_image(fn, items, repeat):
+    """
+    Returns the best average time in ms of fn(item) over items
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for item in items:
+            fn(item)
+        elapsed = (time.time() - start) / len(items)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000
+
+
+def benchmark(count, image_size, size, resize_modes, repeat):
+    folder = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in xrange(count):
+            path = os.path.join(folder, '%d.jpg' % i)
+            data = np.random.randint(0, 255, (image_size * 3 / 4, image_size, 3)).astype(np.uint8)
+            PIL.Image.fromarray(data).save(path, quality=90)
+            paths.append(path)
+        images = [image_utils.load_image(p) for p in paths]
+        arrays = [np.array(image) for image in images]
+
+        print '%-10s %14s %14s %14s %14s %14s' % (
+            'mode', 'imresize (ms)', 'array (ms)', 'PIL (ms)', 'JPEG (ms)', 'batch (ms)')
+        for mode in resize_modes:
+            if mode == 'squash':
+                imresize = '%14.2f' % time_per_image(
+                    lambda a: scipy.misc.imresize(a, (size, size), interp='bilinear'),
+                    arrays, repeat)
+            else:
+                imresize = '%14s' % '-'
+            array = time_per_image(
+                lambda a: image_utils.resize_image(a, size, size, 3, mode), arrays, repeat)
+            pil = time_per_image(
+                lambda i: image_utils.resize_image(i, size, size, 3, mode), images, repeat)
+            # includes decoding, unlike the others
+            jpeg = time_per_image(
+                lambda p: image_utils.resize_image(PIL.Image.open(p), size, size, 3, mode), paths, repeat)
+            batch = time_per_image(
+                lambda l: image_utils.resize_images(l, size, size, 3, mode), [images], repeat) / count
+            print '%-10s %s %14.2f %14.2f %14.2f %14.2f' % (mode, imresize, array, pil, jpeg, batch)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resize-Image benchmark - DIGITS')
+
+    parser.add_argument('-n', '--count',
+                        type=int,
+                        default=50,
+                        help='Number of images to generate')
+    parser.add_argument('--image_size',
+                        type=int,
+                        default=1024,
+                        help='Width of the generated images (4:3 aspect ratio)')
+    parser.add_argument('--size',
+                        type=int,
+                        default=256,
+                        help='Size to resize to')
+    parser.add_argument('-r', '--resize_mode',
+                        action='append',
+                        help='Resize mode(s) to benchmark (default: all)')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=3,
+                        help='Number of timing runs (the best one is reported)')
+
+    args = vars(parser.parse_args())
+
+    benchmark(args['count'], args['image_size'], args['size'],
+              args['resize_mode'] or ['squash', 'crop', 'fill', 'half_crop'],
+              args['repeat'])
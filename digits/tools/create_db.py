@@ -2,9 +2,11 @@
 # Copyright (c) 2014-2017, NVIDIA CORPORATION.  All rights reserved.
 
 import argparse
-from collections import Counter
+import array
+from collections import Counter, deque
 import logging
 import math
+import multiprocessing
 import os
 import Queue
 import random
@@ -41,6 +43,9 @@ else:
 
 logger = logging.getLogger('digits.tools.create_db')
 
+# Commit LMDB transactions once they hold this many bytes
+DEFAULT_LMDB_TXN_SIZE = 32 << 20
+
 
 class Error(Exception):
     pass
@@ -209,6 +214,136 @@ class Hdf5Writer(DbWriter):
         return '%s.h5' % self.count()
 
 
+class LoadSummary(object):
+    """
+    Sent through the write queue by each loader once it has finished
+    (see ReorderQueue.put_sentinel), after all of its records
+    The writers also use it to add up the totals
+    """
+
+    def __init__(self, count=0, image_sum=None):
+        self.count = count
+        self.image_sum = image_sum
+
+    def add(self, other):
+        self.count += other.count
+        if other.count > 0 and other.image_sum is not None:
+            if self.image_sum is None:
+                self.image_sum = other.image_sum
+            else:
+                self.image_sum += other.image_sum
+
+
+class ReorderQueue(object):
+    """
+    A bounded queue which is fed (index, item) pairs and hands out items
+    Producers must put every index exactly once, with item=None for an index
+    which didn't produce anything (e.g. an image that failed to load)
+
+    If ordered, items are handed out in index order. A producer whose index is
+    maxsize or more ahead of the next index to hand out blocks until the
+    others catch up, so at most 2 * maxsize items are held at any time
+
+    The time spent blocked on either side is recorded in put_wait_time
+    (summed over all producers) and get_wait_time
+    """
+
+    def __init__(self, maxsize, ordered=True):
+        self.maxsize = maxsize
+        self.put_wait_time = 0.0
+        self.get_wait_time = 0.0
+        self._ordered = ordered
+        self._next_index = 0
+        self._pending = {}
+        self._ready = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        index, value = item
+        with self._cond:
+            if not self._can_put(index):
+                start = time.time()
+                while not self._can_put(index):
+                    self._cond.wait()
+                self.put_wait_time += time.time() - start
+            if self._ordered:
+                self._pending[index] = value
+                while self._next_index in self._pending:
+                    value = self._pending.pop(self._next_index)
+                    self._next_index += 1
+                    if value is not None:
+                        self._ready.append(value)
+            elif value is not None:
+                self._ready.append(value)
+            self._cond.notify_all()
+
+    def put_sentinel(self, value):
+        """
+        Marks the end of a producer's items
+        `value` is handed out after every item that producer has put
+        """
+        with self._cond:
+            self._ready.append(value)
+            self._cond.notify_all()
+
+    def wait_for_slot(self, index):
+        """
+        Blocks until `index` is within the reorder window
+        """
+        with self._cond:
+            while not self._in_window(index):
+                self._cond.wait()
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if block and timeout is None:
+                while not self._ready:
+                    self._cond.wait()
+            elif block:
+                end = time.time() + timeout
+                while not self._ready:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if not self._ready:
+                raise Queue.Empty
+            value = self._ready.popleft()
+            self._cond.notify_all()
+            return value
+
+    def get_many(self, max_items):
+        """
+        Blocks until at least one item is available
+        Returns a list of up to max_items items
+        """
+        with self._cond:
+            if not self._ready:
+                start = time.time()
+                while not self._ready:
+                    self._cond.wait()
+                self.get_wait_time += time.time() - start
+            items = []
+            while self._ready and len(items) < max_items:
+                items.append(self._ready.popleft())
+            self._cond.notify_all()
+            return items
+
+    def empty(self):
+        with self._cond:
+            return not self._ready
+
+    def qsize(self):
+        with self._cond:
+            return len(self._ready)
+
+    def _can_put(self, index):
+        return len(self._ready) < self.maxsize and self._in_window(index)
+
+    def _in_window(self, index):
+        return not self._ordered or index - self._next_index < self.maxsize
+
+
 def create_db(input_file, output_dir,
               image_width, image_height, image_channels,
               backend,
@@ -217,6 +352,9 @@ def create_db(input_file, output_dir,
               shuffle=True,
               mean_files=None,
               delete_files=False,
+              workers=None,
+              stream=False,
+              image_cache=None,
               **kwargs):
     """
     Create a database of images from a list of image paths
@@ -228,13 +366,25 @@ def create_db(input_file, output_dir,
     image_width -- image resize width
     image_height -- image resize height
     image_channels -- image channels
-    backend -- the DB format (lmdb/hdf5)
+    backend -- the DB format (lmdb/hdf5/tfrecords)
 
     Keyword arguments:
     resize_mode -- passed to utils.image.resize_image()
     shuffle -- if True, shuffle the images in the list before creating
     mean_files -- a list of mean files to save
     delete_files -- if True, delete raw images after creation of database
+    workers -- if set, load images with this many worker processes instead of threads
+        (ignored if gevent has patched threading, see _threading_is_patched())
+    stream -- if True, index the input file and read it while loading images
+        instead of reading it all into memory first
+    image_cache -- a utils.image_cache.ImageCache for the resized images
+
+    Returns a dict of statistics:
+    images_written -- number of images in the database
+    seconds -- time spent creating the database
+    writer_stall -- seconds the writer spent waiting for the loaders
+    loader_stall -- seconds the loaders spent waiting for the writer (summed)
+    cache_hit_rate -- fraction of images found in image_cache (None without a cache)
     """
     # Validate arguments
 
@@ -256,6 +406,11 @@ def create_db(input_file, output_dir,
         raise ValueError('invalid resize_mode')
     if image_folder is not None and not os.path.exists(image_folder):
         raise ValueError('image_folder does not exist')
+    if workers is not None and workers < 0:
+        raise ValueError('invalid number of workers')
+    if workers and _threading_is_patched():
+        logger.warning('gevent has patched threading, loading images with threads instead of workers')
+        workers = 0
     if mean_files:
         for mean_file in mean_files:
             if os.path.exists(mean_file):
@@ -269,44 +424,80 @@ def create_db(input_file, output_dir,
     compute_mean = bool(mean_files)
 
     # Load lines from input_file into a load_queue
+    # (or just index them and stream them in later)
 
-    load_queue = Queue.Queue()
-    image_count = _fill_load_queue(input_file, load_queue, shuffle)
+    if stream:
+        offsets = _index_input_file(input_file)
+        image_count = len(offsets)
+    else:
+        load_queue = Queue.Queue()
+        image_count = _fill_load_queue(input_file, load_queue, shuffle)
 
-    # Start some load threads
+    # Start some load threads (or processes)
 
     batch_size = _calculate_batch_size(image_count,
                                        bool(backend == 'hdf5'), kwargs.get('hdf5_dset_limit'),
                                        image_channels, image_height, image_width)
-    num_threads = _calculate_num_threads(batch_size, shuffle)
-    write_queue = Queue.Queue(2 * batch_size)
-    summary_queue = Queue.Queue()
-
-    for _ in xrange(num_threads):
-        p = threading.Thread(target=_load_thread,
-                             args=(load_queue, write_queue, summary_queue,
-                                   image_width, image_height, image_channels,
-                                   resize_mode, image_folder, compute_mean),
-                             kwargs={'backend': backend,
-                                     'encoding': kwargs.get('encoding', None)},
-                             )
-        p.daemon = True
-        p.start()
+    if stream:
+        load_queue = Queue.Queue(4 * batch_size)
+    # loaders work in parallel, the write queue restores input order if necessary
+    write_queue = ReorderQueue(2 * batch_size, ordered=not shuffle)
+    load_args = (image_width, image_height, image_channels,
+                 resize_mode, image_folder, compute_mean)
+    load_kwargs = {'backend': backend,
+                   'encoding': kwargs.get('encoding', None),
+                   'image_cache': image_cache}
+
+    if workers:
+        num_threads = workers
+        _start_load_processes(num_threads, load_queue, write_queue,
+                              load_args, load_kwargs)
+    else:
+        num_threads = _calculate_num_threads(batch_size)
+        for _ in xrange(num_threads):
+            p = threading.Thread(target=_load_thread,
+                                 args=(load_queue, write_queue) + load_args,
+                                 kwargs=load_kwargs,
+                                 )
+            p.daemon = True
+            p.start()
+
+    # One sentinel per consumer of load_queue marks the end of the input
+    if stream:
+        t = threading.Thread(target=_stream_load_queue,
+                             args=(input_file, offsets, load_queue, shuffle, num_threads))
+        t.daemon = True
+        t.start()
+    else:
+        for _ in xrange(num_threads):
+            load_queue.put(None)
 
     start = time.time()
 
     if backend == 'lmdb':
-        _create_lmdb(image_count, write_queue, batch_size, output_dir,
-                     summary_queue, num_threads,
-                     mean_files, **kwargs)
+        images_written = _create_lmdb(image_count, write_queue, batch_size, output_dir,
+                                      num_threads,
+                                      mean_files, **kwargs)
     elif backend == 'hdf5':
-        _create_hdf5(image_count, write_queue, batch_size, output_dir,
-                     image_width, image_height, image_channels,
-                     summary_queue, num_threads,
-                     mean_files, **kwargs)
+        images_written = _create_hdf5(image_count, write_queue, batch_size, output_dir,
+                                      image_width, image_height, image_channels,
+                                      num_threads,
+                                      mean_files, **kwargs)
+    elif backend == 'tfrecords':
+        images_written = _create_tfrecords(image_count, write_queue, batch_size, output_dir,
+                                           num_threads,
+                                           mean_files, **kwargs)
     else:
         raise ValueError('invalid backend')
 
+    elapsed = max(time.time() - start, 1e-3)
+    logger.info('Database created after %d seconds (%.1f images/s).' % (elapsed, images_written / elapsed))
+    logger.debug('Writer waited %.1f seconds for loaders, loaders waited %.1f seconds for writer.' % (
+        write_queue.get_wait_time, write_queue.put_wait_time))
+    if image_cache is not None:
+        logger.info('Image cache: %d hits, %d misses (%.1f%% hit rate).' % (
+            image_cache.hits, image_cache.misses, 100 * image_cache.hit_rate()))
+
     if delete_files:
         # delete files
         deleted_files = 0
@@ -321,11 +512,18 @@ def create_db(input_file, output_dir,
                 except ParseLineError:
                     pass
                 logger.info("Deleted " + str(deleted_files) + " files")
-        logger.info('Database created after %d seconds.' % (time.time() - start))
+
+    return {
+        'images_written': images_written,
+        'seconds': elapsed,
+        'writer_stall': write_queue.get_wait_time,
+        'loader_stall': write_queue.put_wait_time,
+        'cache_hit_rate': image_cache.hit_rate() if image_cache is not None else None,
+    }
 
 
 def _create_tfrecords(image_count, write_queue, batch_size, output_dir,
-                      summary_queue, num_threads,
+                      num_threads,
                       mean_files=None,
                       encoding=None,
                       lmdb_map_size=None,
@@ -340,10 +538,8 @@ def _create_tfrecords(image_count, write_queue, batch_size, output_dir,
                          "is not enabled.")
 
     wait_time = time.time()
-    threads_done = 0
-    images_loaded = 0
     images_written = 0
-    image_sum = None
+    summary = LoadSummary()
     compute_mean = bool(mean_files)
 
     os.makedirs(output_dir)
@@ -362,134 +558,122 @@ def _create_tfrecords(image_count, write_queue, batch_size, output_dir,
             outfile.write('%s\n' % (filename))
 
     shard_id = 0
-    while (threads_done < num_threads) or not write_queue.empty():
+    for batch in _write_queue_batches(write_queue, num_threads, batch_size, summary):
+        for record in batch:
+            writers[shard_id].write(record)
+            shard_id += 1
+            if shard_id >= num_shards:
+                shard_id = 0
+        images_written += len(batch)
 
         # Send update every 2 seconds
         if time.time() - wait_time > 2:
             logger.debug('Processed %d/%d' % (images_written, image_count))
             wait_time = time.time()
 
-        processed_something = False
-
-        if not summary_queue.empty():
-            result_count, result_sum = summary_queue.get()
-            images_loaded += result_count
-            # Update total_image_sum
-            if compute_mean and result_count > 0 and result_sum is not None:
-                if image_sum is None:
-                    image_sum = result_sum
-                else:
-                    image_sum += result_sum
-            threads_done += 1
-            processed_something = True
-
-        if not write_queue.empty():
-            writers[shard_id].write(write_queue.get())
-            shard_id += 1
-            if shard_id >= num_shards:
-                shard_id = 0
-            images_written += 1
-            processed_something = True
-
-        if not processed_something:
-            time.sleep(0.2)
-
-    if images_loaded == 0:
+    if summary.count == 0:
         raise LoadError('no images loaded from input file')
-    logger.debug('%s images loaded' % images_loaded)
+    logger.debug('%s images loaded' % summary.count)
 
     if images_written == 0:
         raise WriteError('no images written to database')
     logger.info('%s images written to database' % images_written)
 
     if compute_mean:
-        _save_means(image_sum, images_written, mean_files)
+        _save_means(summary.image_sum, images_written, mean_files)
 
     for writer in writers:
         writer.close()
 
+    return images_written
+
 
 def _create_lmdb(image_count, write_queue, batch_size, output_dir,
-                 summary_queue, num_threads,
+                 num_threads,
                  mean_files=None,
                  encoding=None,
                  lmdb_map_size=None,
+                 lmdb_txn_size=None,
+                 lmdb_writemap=False,
+                 lmdb_append=False,
                  **kwargs):
     """
     Create an LMDB
 
     Keyword arguments:
     encoding -- image encoding format
-    lmdb_map_size -- the initial LMDB map size
+    lmdb_map_size -- the initial LMDB map size (grows as needed)
+    lmdb_txn_size -- commit a transaction once it holds this many bytes
+    lmdb_writemap -- if True, write through a writeable memory map
+    lmdb_append -- if True, append keys to the end of the database
+        (our keys are monotonically increasing so this is always valid)
     """
     wait_time = time.time()
-    threads_done = 0
-    images_loaded = 0
     images_written = 0
-    image_sum = None
-    batch = []
+    bytes_written = 0
+    txn_count = 0
+    commit_time = 0.0
+    summary = LoadSummary()
     compute_mean = bool(mean_files)
+    if lmdb_txn_size is None:
+        lmdb_txn_size = DEFAULT_LMDB_TXN_SIZE
 
     db = lmdb.open(output_dir,
                    map_size=lmdb_map_size,
                    map_async=True,
+                   writemap=lmdb_writemap,
                    max_dbs=0)
 
-    while (threads_done < num_threads) or not write_queue.empty():
+    txn_batch = []
+    txn_bytes = 0
+    for batch in _write_queue_batches(write_queue, num_threads, batch_size, summary):
+        txn_batch.extend(batch)
+        txn_bytes += sum(len(value) for _, value in batch)
+
+        if txn_bytes >= lmdb_txn_size:
+            start = time.time()
+            _write_batch_lmdb(db, txn_batch, images_written, append=lmdb_append)
+            commit_time += time.time() - start
+            images_written += len(txn_batch)
+            bytes_written += txn_bytes
+            txn_count += 1
+            txn_batch = []
+            txn_bytes = 0
 
         # Send update every 2 seconds
         if time.time() - wait_time > 2:
-            logger.debug('Processed %d/%d' % (images_written, image_count))
+            logger.debug('Processed %d/%d' % (images_written + len(txn_batch), image_count))
             wait_time = time.time()
 
-        processed_something = False
-
-        if not summary_queue.empty():
-            result_count, result_sum = summary_queue.get()
-            images_loaded += result_count
-            # Update total_image_sum
-            if compute_mean and result_count > 0 and result_sum is not None:
-                if image_sum is None:
-                    image_sum = result_sum
-                else:
-                    image_sum += result_sum
-            threads_done += 1
-            processed_something = True
-
-        if not write_queue.empty():
-            datum = write_queue.get()
-            batch.append(datum)
-
-            if len(batch) == batch_size:
-                _write_batch_lmdb(db, batch, images_written)
-                images_written += len(batch)
-                batch = []
-            processed_something = True
-
-        if not processed_something:
-            time.sleep(0.2)
-
-    if len(batch) > 0:
-        _write_batch_lmdb(db, batch, images_written)
-        images_written += len(batch)
+    if len(txn_batch) > 0:
+        start = time.time()
+        _write_batch_lmdb(db, txn_batch, images_written, append=lmdb_append)
+        commit_time += time.time() - start
+        images_written += len(txn_batch)
+        bytes_written += txn_bytes
+        txn_count += 1
 
-    if images_loaded == 0:
+    if summary.count == 0:
         raise LoadError('no images loaded from input file')
-    logger.debug('%s images loaded' % images_loaded)
+    logger.debug('%s images loaded' % summary.count)
 
     if images_written == 0:
         raise WriteError('no images written to database')
     logger.info('%s images written to database' % images_written)
+    logger.info('Committed %.1f MB in %d transactions (%.1f MB/s)' % (
+        bytes_written / 1048576.0, txn_count, bytes_written / 1048576.0 / max(commit_time, 1e-3)))
 
     if compute_mean:
-        _save_means(image_sum, images_written, mean_files)
+        _save_means(summary.image_sum, images_written, mean_files)
 
     db.close()
 
+    return images_written
+
 
 def _create_hdf5(image_count, write_queue, batch_size, output_dir,
                  image_width, image_height, image_channels,
-                 summary_queue, num_threads,
+                 num_threads,
                  mean_files=None,
                  compression=None,
                  hdf5_dset_limit=None,
@@ -501,11 +685,8 @@ def _create_hdf5(image_count, write_queue, batch_size, output_dir,
     compression -- dataset compression format
     """
     wait_time = time.time()
-    threads_done = 0
-    images_loaded = 0
     images_written = 0
-    image_sum = None
-    batch = []
+    summary = LoadSummary()
     compute_mean = bool(mean_files)
 
     writer = Hdf5Writer(
@@ -517,60 +698,57 @@ def _create_hdf5(image_count, write_queue, batch_size, output_dir,
         compression=compression,
     )
 
-    while (threads_done < num_threads) or not write_queue.empty():
+    for batch in _write_queue_batches(write_queue, num_threads, batch_size, summary):
+        writer.write_batch(batch)
+        images_written += len(batch)
 
         # Send update every 2 seconds
         if time.time() - wait_time > 2:
             logger.debug('Processed %d/%d' % (images_written, image_count))
             wait_time = time.time()
 
-        processed_something = False
-
-        if not summary_queue.empty():
-            result_count, result_sum = summary_queue.get()
-            images_loaded += result_count
-            # Update total_image_sum
-            if compute_mean and result_count > 0 and result_sum is not None:
-                if image_sum is None:
-                    image_sum = result_sum
-                else:
-                    image_sum += result_sum
-            threads_done += 1
-            processed_something = True
-
-        if not write_queue.empty():
-            batch.append(write_queue.get())
-
-            if len(batch) == batch_size:
-                writer.write_batch(batch)
-                images_written += len(batch)
-                batch = []
-            processed_something = True
-
-        if not processed_something:
-            time.sleep(0.2)
-
-    if len(batch) > 0:
-        writer.write_batch(batch)
-        images_written += len(batch)
-
     assert images_written == writer.count()
 
-    if images_loaded == 0:
+    if summary.count == 0:
         raise LoadError('no images loaded from input file')
-    logger.debug('%s images loaded' % images_loaded)
+    logger.debug('%s images loaded' % summary.count)
 
     if images_written == 0:
         raise WriteError('no images written to database')
     logger.info('%s images written to database' % images_written)
 
     if compute_mean:
-        _save_means(image_sum, images_written, mean_files)
+        _save_means(summary.image_sum, images_written, mean_files)
+
+    return images_written
+
+
+def _write_queue_batches(write_queue, num_threads, batch_size, summary):
+    """
+    Yields lists of batch_size records from write_queue (the last one may be shorter)
+    Blocks while the queue is empty and drains whatever is queued in one go
+    Returns once all num_threads loaders have sent their LoadSummary,
+    which are added to `summary`
+    """
+    batch = []
+    threads_done = 0
+    while threads_done < num_threads:
+        for item in write_queue.get_many(batch_size):
+            if isinstance(item, LoadSummary):
+                summary.add(item)
+                threads_done += 1
+            else:
+                batch.append(item)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
 
 
 def _fill_load_queue(filename, queue, shuffle):
     """
-    Fill the queue with data from the input file
+    Fill the queue with (index, path, label) items from the input file
     Print the category distribution
     Returns the number of lines added to the queue
 
@@ -588,18 +766,18 @@ def _fill_load_queue(filename, queue, shuffle):
             for line in lines:
                 total_lines += 1
                 try:
-                    result = _parse_line(line, distribution)
+                    path, label = _parse_line(line, distribution)
+                    queue.put((valid_lines, path, label))
                     valid_lines += 1
-                    queue.put(result)
                 except ParseLineError:
                     pass
         else:
             for line in infile:  # more memory efficient
                 total_lines += 1
                 try:
-                    result = _parse_line(line, distribution)
+                    path, label = _parse_line(line, distribution)
+                    queue.put((valid_lines, path, label))
                     valid_lines += 1
-                    queue.put(result)
                 except ParseLineError:
                     pass
 
@@ -614,6 +792,68 @@ def _fill_load_queue(filename, queue, shuffle):
     return valid_lines
 
 
+def _index_input_file(filename):
+    """
+    First pass over the input file, without keeping any lines in memory
+    Print the category distribution
+    Returns a np.ndarray with the byte offset of each valid line
+    """
+    total_lines = 0
+    distribution = Counter()
+    offsets = array.array('l')
+
+    with open(filename, 'rb') as infile:
+        offset = 0
+        for line in infile:
+            total_lines += 1
+            try:
+                _parse_line(line, distribution)
+                offsets.append(offset)
+            except ParseLineError:
+                pass
+            offset += len(line)
+
+    logger.debug('%s total lines in file' % total_lines)
+    if len(offsets) == 0:
+        raise BadInputFileError('No valid lines in input file')
+    logger.info('%s valid lines in file' % len(offsets))
+
+    for key in sorted(distribution):
+        logger.debug('Category %s has %d images.' % (key, distribution[key]))
+
+    # one long (8 bytes on 64-bit Linux) per line, no copy
+    return np.frombuffer(offsets, dtype=np.int_)
+
+
+def _stream_load_queue(filename, offsets, queue, shuffle, num_consumers):
+    """
+    Second pass over the input file
+    Puts (index, path, label) items to the (bounded) queue in file order,
+    or in random order if shuffle, followed by one None per consumer
+    """
+    if shuffle:
+        offsets = offsets.copy()
+        np.random.shuffle(offsets)
+
+    unused = Counter()
+    try:
+        with open(filename, 'rb') as infile:
+            for index, offset in enumerate(offsets):
+                if shuffle:
+                    infile.seek(offset)
+                # else read on sequentially, skipping invalid lines
+                while True:
+                    try:
+                        path, label = _parse_line(infile.readline(), unused)
+                        break
+                    except ParseLineError:
+                        continue
+                queue.put((index, path, label))
+    finally:
+        for _ in xrange(num_consumers):
+            queue.put(None)
+
+
 def _parse_line(line, distribution):
     """
     Parse a line in the input file into (path, label)
@@ -646,26 +886,21 @@ def _calculate_batch_size(image_count, is_hdf5=False, hdf5_dset_limit=None,
         return min(100, image_count)
 
 
-def _calculate_num_threads(batch_size, shuffle):
+def _calculate_num_threads(batch_size):
     """
     Calculates an appropriate number of threads for creating this database
     """
-    if shuffle:
-        return min(10, int(round(math.sqrt(batch_size))))
-    else:
-        # XXX This is the only way to preserve order for now
-        # This obviously hurts performance considerably
-        return 1
+    return min(10, int(round(math.sqrt(batch_size))))
 
 
-def _load_thread(load_queue, write_queue, summary_queue,
+def _load_thread(load_queue, write_queue,
                  image_width, image_height, image_channels,
                  resize_mode, image_folder, compute_mean,
-                 backend=None, encoding=None):
+                 backend=None, encoding=None, image_cache=None):
     """
-    Consumes items in load_queue
-    Produces items to write_queue
-    Stores cumulative results in summary_queue
+    Consumes items in load_queue until it reads None
+    Produces (index, record) items to write_queue
+    Finishes with a LoadSummary sentinel holding cumulative results
     """
     images_added = 0
     if compute_mean:
@@ -673,43 +908,197 @@ def _load_thread(load_queue, write_queue, summary_queue,
     else:
         image_sum = None
 
-    while not load_queue.empty():
-        try:
-            path, label = load_queue.get(True, 0.05)
-        except Queue.Empty:
-            continue
+    try:
+        while True:
+            item = load_queue.get()
+            if item is None:
+                break
+            index, path, label = item
+
+            result = _load_entry(path, label,
+                                 image_width, image_height, image_channels,
+                                 resize_mode, image_folder,
+                                 backend=backend, encoding=encoding,
+                                 image_cache=image_cache)
+            if result is None:
+                # let the write queue know that nothing is coming for this index
+                write_queue.put((index, None))
+                continue
+            image, record = result
+
+            if compute_mean:
+                image_sum += image
+
+            write_queue.put((index, record))
+            images_added += 1
+    finally:
+        # always report back so that the writer doesn't wait forever
+        write_queue.put_sentinel(LoadSummary(images_added, image_sum))
+
+
+def _load_process(task_queue, result_queue,
+                  image_width, image_height, image_channels,
+                  resize_mode, image_folder, compute_mean,
+                  backend=None, encoding=None, image_cache=None):
+    """
+    Runs in a child process
+    Consumes (index, path, label) items in task_queue until it reads None
+    Produces ('record', (index, record)) items to result_queue
+    Finishes with a single ('summary', ((count, image_sum), (cache_hits, cache_misses))) item
+    """
+    images_added = 0
+    if compute_mean:
+        image_sum = _initial_image_sum(image_width, image_height, image_channels)
+    else:
+        image_sum = None
+
+    try:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                break
+            index, path, label = item
+
+            result = _load_entry(path, label,
+                                 image_width, image_height, image_channels,
+                                 resize_mode, image_folder,
+                                 backend=backend, encoding=encoding,
+                                 image_cache=image_cache)
+            if result is None:
+                result_queue.put(('record', (index, None)))
+                continue
+            image, record = result
+
+            if compute_mean:
+                image_sum += image
+
+            result_queue.put(('record', (index, record)))
+            images_added += 1
+    finally:
+        # always report back so that the writer doesn't wait forever
+        # (the cache counts of this process' copy of image_cache go along)
+        if image_cache is not None:
+            cache_stats = (image_cache.hits, image_cache.misses)
+        else:
+            cache_stats = (0, 0)
+        result_queue.put(('summary', ((images_added, image_sum), cache_stats)))
 
-        # prepend path with image_folder, if appropriate
-        if not utils.is_url(path) and image_folder and not os.path.isabs(path):
-            path = os.path.join(image_folder, path)
 
-        try:
-            image = utils.image.load_image(path)
-        except utils.errors.LoadImageError as e:
-            logger.warning('[%s %s] %s: %s' % (path, label, type(e).__name__, e))
-            continue
+def _threading_is_patched():
+    """
+    Returns True if gevent has monkey-patched threading in this process
+    (e.g. in the tests, once digits.webapp is imported)
+
+    The helper threads of _start_load_processes() would then block
+    forever on the multiprocessing queues
+    """
+    try:
+        import gevent.monkey
+    except ImportError:
+        return False
+    return gevent.monkey.is_module_patched('threading')
+
+
+def _start_load_processes(num_processes, load_queue, write_queue,
+                          load_args, load_kwargs):
+    """
+    Starts worker processes which load, resize and encode images
 
-        image = utils.image.resize_image(image,
-                                         image_height, image_width,
-                                         channels=image_channels,
-                                         resize_mode=resize_mode,
-                                         )
-
-        if compute_mean:
-            image_sum += image
-
-        if backend == 'lmdb':
-            datum = _array_to_datum(image, label, encoding)
-            write_queue.put(datum)
-        elif backend == 'tfrecords':
-            tf_example = _array_to_tf_feature(image, label, encoding)
-            write_queue.put(tf_example)
+    Two helper threads connect the workers to the regular queues:
+        - one feeds the items in load_queue to the workers
+        - one forwards results to write_queue
+    The writer sees exactly what _load_thread would have produced
+    """
+    image_cache = load_kwargs.get('image_cache')
+    task_queue = multiprocessing.Queue(4 * num_processes)
+    result_queue = multiprocessing.Queue(write_queue.maxsize or 0)
+
+    def feed():
+        while True:
+            item = load_queue.get()
+            if item is None:
+                break
+            # Don't hand out work beyond the reorder window, otherwise
+            # forward() could block on an item while the one the window
+            # is waiting for sits behind it in result_queue
+            write_queue.wait_for_slot(item[0])
+            task_queue.put(item)
+        for _ in xrange(num_processes):
+            task_queue.put(None)
+
+    def forward():
+        processes_done = 0
+        while processes_done < num_processes:
+            kind, value = result_queue.get()
+            if kind == 'record':
+                write_queue.put(value)
+            else:
+                # all records from this worker have been forwarded already
+                counts, cache_stats = value
+                if image_cache is not None:
+                    image_cache.merge_stats(*cache_stats)
+                write_queue.put_sentinel(LoadSummary(*counts))
+                processes_done += 1
+
+    for _ in xrange(num_processes):
+        p = multiprocessing.Process(target=_load_process,
+                                    args=(task_queue, result_queue) + load_args,
+                                    kwargs=load_kwargs,
+                                    )
+        p.daemon = True
+        p.start()
+
+    for target in feed, forward:
+        t = threading.Thread(target=target)
+        t.daemon = True
+        t.start()
+
+
+def _load_entry(path, label,
+                image_width, image_height, image_channels,
+                resize_mode, image_folder,
+                backend=None, encoding=None, image_cache=None):
+    """
+    Loads, resizes and encodes one image
+    Resized images are looked up in image_cache first, if given
+    Returns (image, record), or None if the image could not be loaded
+
+    The record is what the writer for this backend expects:
+        lmdb -- (label, serialized Datum)
+        tfrecords -- a serialized Example
+        hdf5 -- (image, label)
+    """
+    # prepend path with image_folder, if appropriate
+    if not utils.is_url(path) and image_folder and not os.path.isabs(path):
+        path = os.path.join(image_folder, path)
+
+    try:
+        if image_cache is not None:
+            image = image_cache.load(path,
+                                     image_height, image_width,
+                                     channels=image_channels,
+                                     resize_mode=resize_mode,
+                                     )
         else:
-            write_queue.put((image, label))
+            image = utils.image.load_image(path, size_hint=(image_height, image_width))
+            image = utils.image.resize_image(image,
+                                             image_height, image_width,
+                                             channels=image_channels,
+                                             resize_mode=resize_mode,
+                                             )
+    except utils.errors.LoadImageError as e:
+        logger.warning('[%s %s] %s: %s' % (path, label, type(e).__name__, e))
+        return None
 
-        images_added += 1
+    if backend == 'lmdb':
+        datum = _array_to_datum(image, label, encoding)
+        record = (label, datum.SerializeToString())
+    elif backend == 'tfrecords':
+        record = _array_to_tf_feature(image, label, encoding)
+    else:
+        record = (image, label)
 
-    summary_queue.put((images_added, image_sum))
+    return image, record
 
 
 def _initial_image_sum(width, height, channels):
@@ -807,30 +1196,50 @@ def _array_to_datum(image, label, encoding):
     return datum
 
 
-def _write_batch_lmdb(db, batch, image_count):
+def _write_batch_lmdb(db, batch, image_count, append=False):
     """
-    Write a batch to an LMDB database
+    Write a batch of (label, serialized Datum) items to an LMDB database
+    Grows the map beforehand if the batch might not fit
     """
+    _reserve_lmdb_space(db, sum(len(value) for _, value in batch))
     try:
         with db.begin(write=True) as lmdb_txn:
-            for i, datum in enumerate(batch):
-                key = '%08d_%d' % (image_count + i, datum.label)
-                lmdb_txn.put(key, datum.SerializeToString())
+            for i, (label, value) in enumerate(batch):
+                key = '%08d_%d' % (image_count + i, label)
+                lmdb_txn.put(key, value, append=append)
 
     except lmdb.MapFullError:
-        # double the map_size
-        curr_limit = db.info()['map_size']
-        new_limit = curr_limit * 2
-        try:
-            db.set_mapsize(new_limit)  # double it
-        except AttributeError as e:
-            version = tuple(int(x) for x in lmdb.__version__.split('.'))
-            if version < (0, 87):
-                raise Error('py-lmdb is out of date (%s vs 0.87)' % lmdb.__version__)
-            else:
-                raise e
-        # try again
-        _write_batch_lmdb(db, batch, image_count)
+        # our estimate was too low - double the map_size and try again
+        _set_lmdb_map_size(db, db.info()['map_size'] * 2)
+        _write_batch_lmdb(db, batch, image_count, append)
+
+
+def _reserve_lmdb_space(db, num_bytes):
+    """
+    Grows the LMDB map geometrically so that num_bytes more data fits
+    """
+    map_size = db.info()['map_size']
+    used = (db.info()['last_pgno'] + 1) * db.stat()['psize']
+    # leave room for keys, page overhead and copy-on-write pages
+    required = used + 2 * num_bytes
+    if required <= map_size:
+        return
+    new_size = map_size
+    while new_size < required:
+        new_size *= 2
+    _set_lmdb_map_size(db, new_size)
+
+
+def _set_lmdb_map_size(db, map_size):
+    try:
+        db.set_mapsize(map_size)
+    except AttributeError as e:
+        version = tuple(int(x) for x in lmdb.__version__.split('.'))
+        if version < (0, 87):
+            raise Error('py-lmdb is out of date (%s vs 0.87)' % lmdb.__version__)
+        else:
+            raise e
+    logger.debug('LMDB map size set to %d MB' % (map_size >> 20))
 
 
 def _save_means(image_sum, image_count, mean_files):
@@ -920,6 +1329,15 @@ if __name__ == '__main__':
     parser.add_argument('--lmdb_map_size',
                         type=int,
                         help='The initial map size for LMDB (in MB)')
+    parser.add_argument('--lmdb_txn_size',
+                        type=int,
+                        help='Commit LMDB transactions every N MB (default %d)' % (DEFAULT_LMDB_TXN_SIZE >> 20))
+    parser.add_argument('--lmdb_writemap',
+                        action='store_true',
+                        help='Write to LMDB through a writeable memory map')
+    parser.add_argument('--lmdb_append',
+                        action='store_true',
+                        help='Append to the end of the LMDB instead of searching for each key')
     parser.add_argument('--hdf5_dset_limit',
                         type=int,
                         default=2**31,
@@ -927,12 +1345,35 @@ if __name__ == '__main__':
     parser.add_argument('--delete_files',
                         action='store_true',
                         help='Specifies whether to keep files after creation of dataset')
+    parser.add_argument('--workers',
+                        type=int,
+                        help='Number of worker processes used to load images (default: use threads)')
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help='Index the input file instead of reading it into memory (for very large files)')
+    parser.add_argument('--image_cache_dir',
+                        help='Directory of a cache of resized images shared between builds')
+    parser.add_argument('--image_cache_size',
+                        type=int,
+                        help='Size cap for the image cache (in MB, default %d)' % (
+                            utils.image_cache.DEFAULT_MAX_SIZE >> 20))
 
     args = vars(parser.parse_args())
 
     if args['lmdb_map_size']:
         # convert from MB to B
         args['lmdb_map_size'] <<= 20
+    if args['lmdb_txn_size']:
+        # convert from MB to B
+        args['lmdb_txn_size'] <<= 20
+    if args['image_cache_size']:
+        # convert from MB to B
+        args['image_cache_size'] <<= 20
+
+    image_cache = None
+    if args['image_cache_dir']:
+        image_cache = utils.image_cache.ImageCache(args['image_cache_dir'],
+                                                   max_size=args['image_cache_size'])
 
     try:
         create_db(args['input_file'], args['output_dir'],
@@ -945,8 +1386,14 @@ if __name__ == '__main__':
                   encoding=args['encoding'],
                   compression=args['compression'],
                   lmdb_map_size=args['lmdb_map_size'],
+                  lmdb_txn_size=args['lmdb_txn_size'],
+                  lmdb_writemap=args['lmdb_writemap'],
+                  lmdb_append=args['lmdb_append'],
                   hdf5_dset_limit=args['hdf5_dset_limit'],
-                  delete_files=args['delete_files']
+                  delete_files=args['delete_files'],
+                  workers=args['workers'],
+                  stream=args['stream'],
+                  image_cache=image_cache,
                   )
     except Exception as e:
         logger.error('%s: %s' % (type(e).__name__, e.message))
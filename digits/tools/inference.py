@@ -5,10 +5,15 @@ import argparse
 import base64
 import h5py
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import PIL.Image
 import os
+import Queue
 import sys
+import threading
+import time
 try:
     from cStringIO import StringIO
 except ImportError:
@@ -27,24 +32,22 @@ import caffe_pb2  # noqa
 
 logger = logging.getLogger('digits.tools.inference')
 
+# Images are loaded and inferred this many at a time by default
+DEFAULT_CHUNK_SIZE = 1024
+# How many loaded chunks may wait for inference
+PREFETCH_CHUNKS = 2
+
 
 """
 Perform inference on a list of images using the specified model
 """
 
 
-def infer(input_list,
-          output_dir,
-          jobs_dir,
-          model_id,
-          epoch,
-          batch_size,
-          layers,
-          gpu,
-          input_is_db,
-          resize):
+def load_model(jobs_dir, model_id, epoch):
     """
-    Perform inference on a list of images using the specified model
+    Load a model job and its dataset job
+    Returns (model, dataset, epoch) where epoch is the snapshot epoch
+    that was found (-1 selects the last snapshot)
     """
     # job directory defaults to that defined in DIGITS config
     if jobs_dir == 'none':
@@ -78,6 +81,55 @@ def infer(input_list,
     if not snapshot_filename:
         raise InferenceError("Unable to find snapshot for epoch=%s" % repr(epoch))
 
+    return model, dataset, epoch
+
+
+def load_db(input_list):
+    """
+    Load all images from a database
+    Returns (input_ids, input_data)
+    """
+    input_ids = []       # keys of samples within the database
+    input_data = []      # sample data
+
+    reader = DbReader(input_list)
+    for key, value in reader.entries():
+        datum = caffe_pb2.Datum()
+        datum.ParseFromString(value)
+        if datum.encoded:
+            s = StringIO()
+            s.write(datum.data)
+            s.seek(0)
+            img = PIL.Image.open(s)
+            img = np.array(img)
+        else:
+            import caffe.io
+            arr = caffe.io.datum_to_array(datum)
+            # CHW -> HWC
+            arr = arr.transpose((1, 2, 0))
+            if arr.shape[2] == 1:
+                # HWC -> HW
+                arr = arr[:, :, 0]
+            elif arr.shape[2] == 3:
+                # BGR -> RGB
+                # XXX see issue #59
+                arr = arr[:, :, [2, 1, 0]]
+            img = arr
+        input_ids.append(key)
+        input_data.append(img)
+    return input_ids, input_data
+
+
+def load_images(paths, dataset, resize, image_cache=None, pool=None):
+    """
+    Load (and resize) images for the dataset's input dimensions
+    Images which can't be loaded are skipped
+    Returns (input_ids, input_data) where input_ids are indices into paths
+
+    Resized images are looked up in image_cache first, if given
+    (a utils.image_cache.ImageCache)
+    Images are loaded in parallel if pool (a ThreadPool) is given
+    """
     # retrieve image dimensions and resize mode
     image_dims = dataset.get_feature_dims()
     height = image_dims[0]
@@ -85,71 +137,110 @@ def infer(input_list,
     channels = image_dims[2]
     resize_mode = dataset.resize_mode if hasattr(dataset, 'resize_mode') else 'squash'
 
-    n_input_samples = 0  # number of samples we were able to load
+    def load(path):
+        return _load_input(path.strip(), height, width, channels, resize_mode, resize, image_cache)
+
+    images = pool.map(load, paths) if pool is not None else map(load, paths)
+
     input_ids = []       # indices of samples within file list
     input_data = []      # sample data
+    for idx, image in enumerate(images):
+        if image is not None:
+            input_ids.append(idx)
+            input_data.append(image)
+    if image_cache is not None:
+        logger.info('Image cache: %d hits, %d misses (%.1f%% hit rate)' % (
+            image_cache.hits, image_cache.misses, 100 * image_cache.hit_rate()))
+    return input_ids, input_data
 
-    if input_is_db:
-        # load images from database
-        reader = DbReader(input_list)
-        for key, value in reader.entries():
-            datum = caffe_pb2.Datum()
-            datum.ParseFromString(value)
-            if datum.encoded:
-                s = StringIO()
-                s.write(datum.data)
-                s.seek(0)
-                img = PIL.Image.open(s)
-                img = np.array(img)
-            else:
-                import caffe.io
-                arr = caffe.io.datum_to_array(datum)
-                # CHW -> HWC
-                arr = arr.transpose((1, 2, 0))
-                if arr.shape[2] == 1:
-                    # HWC -> HW
-                    arr = arr[:, :, 0]
-                elif arr.shape[2] == 3:
-                    # BGR -> RGB
-                    # XXX see issue #59
-                    arr = arr[:, :, [2, 1, 0]]
-                img = arr
-            input_ids.append(key)
-            input_data.append(img)
-            n_input_samples = n_input_samples + 1
-    else:
-        # load paths from file
-        paths = None
-        with open(input_list) as infile:
-            paths = infile.readlines()
-        # load and resize images
-        for idx, path in enumerate(paths):
-            path = path.strip()
+
+def _load_input(path, height, width, channels, resize_mode, resize, image_cache):
+    """
+    Load (and resize) one image
+    Returns None if the image can't be loaded
+    """
+    try:
+        if resize and image_cache is not None:
+            return image_cache.load(
+                path,
+                height,
+                width,
+                channels=channels,
+                resize_mode=resize_mode)
+        elif resize:
+            return utils.image.resize_image(
+                utils.image.load_image(path, size_hint=(height, width)),
+                height,
+                width,
+                channels=channels,
+                resize_mode=resize_mode)
+        else:
+            return utils.image.image_to_array(
+                utils.image.load_image(path),
+                channels=channels)
+    except utils.errors.LoadImageError as e:
+        print e
+        return None
+
+
+def prefetch_chunks(load_chunk, count, chunk_size, depth=PREFETCH_CHUNKS):
+    """
+    Yields (start, stop, input_ids, input_data, load_time) for consecutive
+    chunks of the inputs, calling load_chunk(start, stop) in a background
+    thread so that the next chunks load while the current one is processed
+    At most depth loaded chunks wait to be processed
+    """
+    chunks = Queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(item):
+        # give up if the consumer is gone
+        while not stopped.is_set():
             try:
-                image = utils.image.load_image(path.strip())
-                if resize:
-                    image = utils.image.resize_image(
-                        image,
-                        height,
-                        width,
-                        channels=channels,
-                        resize_mode=resize_mode)
-                else:
-                    image = utils.image.image_to_array(
-                        image,
-                        channels=channels)
-                input_ids.append(idx)
-                input_data.append(image)
-                n_input_samples = n_input_samples + 1
-            except utils.errors.LoadImageError as e:
-                print e
-
-    # perform inference
+                chunks.put(item, timeout=1)
+                return
+            except Queue.Full:
+                pass
+
+    def produce():
+        try:
+            for start in xrange(0, count, chunk_size):
+                load_start = time.time()
+                input_ids, input_data = load_chunk(start, start + chunk_size)
+                put((start, min(start + chunk_size, count), input_ids, input_data,
+                     time.time() - load_start))
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def run_inference(model, input_data, epoch, layers, gpu, resize, single):
+    """
+    Run the model on the loaded input data
+    Returns (outputs, visualizations)
+
+    single selects single image inference (needed for visualizations) over
+    batch inference. Some frameworks return their outputs in a different
+    format for each, so it must be chosen once for all the inputs of a job
+    rather than from the size of each chunk
+    """
     visualizations = None
 
-    if n_input_samples == 0:
-        raise InferenceError("Unable to load any image from file '%s'" % repr(input_list))
-    elif n_input_samples == 1:
+    if single and len(input_data) == 1:
         # single image inference
         outputs, visualizations = model.train_task().infer_one(
             input_data[0],
@@ -165,24 +256,173 @@ def infer(input_list,
             snapshot_epoch=epoch,
             gpu=gpu,
             resize=resize)
+    return outputs, visualizations
 
-    # write to hdf5 file
-    db_path = os.path.join(output_dir, 'inference.hdf5')
-    db = h5py.File(db_path, 'w')
 
+def append_dataset(group, name, data, compress=False):
+    """
+    Append data to a resizable dataset, creating it if needed
+    Returns the dataset
+
+    If compress is set, the dataset is gzip-compressed (in chunks, so that
+    a few rows can be read back without decompressing all of them)
+    """
+    data = np.asarray(data)
+    if name not in group:
+        return group.create_dataset(name, data=data, maxshape=(None,) + data.shape[1:],
+                                    compression='gzip' if compress else None)
+    dset = group[name]
+    dset.resize(len(dset) + len(data), axis=0)
+    dset[-len(data):] = data
+    return dset
+
+
+def write_chunk(db, input_ids, input_data, outputs, store_input_data='uncompressed'):
+    """
+    Append the results for a chunk of the inputs to an HDF5 file
+
+    store_input_data is "uncompressed", "compressed" or "none"
+    """
     # write input paths and images to database
-    db.create_dataset("input_ids", data=input_ids)
-    db.create_dataset("input_data", data=input_data)
+    append_dataset(db, "input_ids", input_ids)
+    if store_input_data != 'none':
+        append_dataset(db, "input_data", input_data, compress=store_input_data == 'compressed')
 
     # write outputs to database
-    db_outputs = db.create_group("outputs")
+    db_outputs = db.require_group("outputs")
     for output_id, output_name in enumerate(outputs.keys()):
-        output_data = outputs[output_name]
         output_key = base64.urlsafe_b64encode(str(output_name))
-        dset = db_outputs.create_dataset(output_key, data=output_data)
+        dset = append_dataset(db_outputs, output_key, outputs[output_name])
         # add ID attribute so outputs can be sorted in
         # the order they appear in here
         dset.attrs['id'] = output_id
+    db.flush()
+
+
+def write_chunk_results(output_dir, start, input_ids, outputs):
+    """
+    Save the results for a chunk of the inputs to a file of their own,
+    which can be read while the next chunks are inferred
+    Returns the path to the file
+    """
+    path = os.path.join(output_dir, 'chunk-%d.npz' % start)
+    arrays = {
+        'input_ids': np.asarray(input_ids),
+        'output_names': np.array([str(name) for name in outputs.keys()]),
+    }
+    for output_id, output_data in enumerate(outputs.values()):
+        arrays['output_%d' % output_id] = np.asarray(output_data)
+    np.savez(path, **arrays)
+    return path
+
+
+def infer(input_list,
+          output_dir,
+          jobs_dir,
+          model_id,
+          epoch,
+          batch_size,
+          layers,
+          gpu,
+          input_is_db,
+          resize,
+          image_cache=None,
+          chunk_size=DEFAULT_CHUNK_SIZE,
+          store_input_data='uncompressed',
+          workers=None,
+          chunk_results=False):
+    """
+    Perform inference on a list of images using the specified model
+
+    Resized images are looked up in image_cache first, if given
+    (a utils.image_cache.ImageCache)
+
+    Images are loaded and inferred chunk_size at a time (all at once if
+    None) and the results are appended to the HDF5 file after each chunk.
+    The next chunks are loaded by a pool of workers threads while the
+    current one is inferred
+
+    store_input_data is "uncompressed", "compressed" or "none" (only the
+    input ids are saved)
+
+    If chunk_results is set, the ids and outputs for each chunk are also
+    saved to a file of their own, named in the progress log
+    """
+    model, dataset, epoch = load_model(jobs_dir, model_id, epoch)
+
+    pool = None
+    if input_is_db:
+        # load images from database
+        input_ids, input_data = load_db(input_list)
+        count = len(input_ids)
+
+        def load_chunk(start, stop):
+            return input_ids[start:stop], input_data[start:stop]
+    else:
+        # load paths from file
+        paths = None
+        with open(input_list) as infile:
+            paths = infile.readlines()
+        count = len(paths)
+        if workers is None:
+            workers = min(4, multiprocessing.cpu_count())
+        if workers > 1:
+            pool = ThreadPool(workers)
+
+        def load_chunk(start, stop):
+            # load and resize images
+            ids, data = load_images(paths[start:stop], dataset, resize, image_cache=image_cache, pool=pool)
+            return [start + idx for idx in ids], data
+
+    if not chunk_size or layers != 'none':
+        # visualizations are only available for single image inference
+        chunk_size = max(count, 1)
+    # a job with several inputs uses batch inference for every chunk,
+    # even one which is left with a single image
+    single = count == 1 or layers != 'none'
+
+    db_path = os.path.join(output_dir, 'inference.hdf5')
+    db = h5py.File(db_path, 'w')
+
+    visualizations = None
+    processed = 0
+    # time spent in each stage
+    load_time = wait_time = infer_time = write_time = 0
+    wait_start = time.time()
+    try:
+        for start, stop, input_ids, input_data, chunk_load_time in prefetch_chunks(load_chunk, count, chunk_size):
+            load_time += chunk_load_time
+            wait_time += time.time() - wait_start
+            chunk_path = None
+            if len(input_data):
+                # perform inference
+                infer_start = time.time()
+                outputs, visualizations = run_inference(model, input_data, epoch, layers, gpu, resize, single)
+                infer_time += time.time() - infer_start
+                # write to hdf5 file
+                write_start = time.time()
+                write_chunk(db, input_ids, input_data, outputs, store_input_data=store_input_data)
+                if chunk_results:
+                    chunk_path = write_chunk_results(output_dir, start, input_ids, outputs)
+                write_time += time.time() - write_start
+                processed += len(input_data)
+            if chunk_path is not None:
+                logger.info('Processed %d/%d images, results in %s' % (stop, count, chunk_path))
+            elif chunk_size < count:
+                logger.info('Processed %d/%d images' % (stop, count))
+            wait_start = time.time()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    logger.info('Loading took %.1f seconds (%d threads), waiting for images %.1f seconds, '
+                'inference %.1f seconds, writing %.1f seconds' % (
+                    load_time, workers or 1, wait_time, infer_time, write_time))
+
+    if processed == 0:
+        db.close()
+        os.remove(db_path)
+        raise InferenceError("Unable to load any image from file '%s'" % repr(input_list))
 
     # write visualization data
     if visualizations is not None and len(visualizations) > 0:
@@ -277,8 +517,53 @@ if __name__ == '__main__':
 
     parser.set_defaults(resize=True)
 
+    parser.add_argument(
+        '--image_cache_dir',
+        help='Directory of a cache of resized images',
+    )
+
+    parser.add_argument(
+        '--image_cache_size',
+        type=int,
+        default=None,
+        help='Size cap for the image cache (in MB)',
+    )
+
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help='Load and infer this many images at a time (0 for all at once, default: %d)' % DEFAULT_CHUNK_SIZE,
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of threads loading images (default: up to 4)',
+    )
+
+    parser.add_argument(
+        '--input_data',
+        choices=['uncompressed', 'compressed', 'none'],
+        default='uncompressed',
+        help='How to save the input images with the outputs (default: uncompressed)',
+    )
+
+    parser.add_argument(
+        '--chunk_results',
+        action='store_true',
+        help='Also save the results for each chunk to a file of their own, named in the progress log',
+    )
+
     args = vars(parser.parse_args())
 
+    image_cache = None
+    if args['image_cache_dir']:
+        image_cache = utils.image_cache.ImageCache(
+            args['image_cache_dir'],
+            max_size=args['image_cache_size'] << 20 if args['image_cache_size'] else None)
+
     try:
         infer(
             args['input_list'],
@@ -290,7 +575,12 @@ if __name__ == '__main__':
             args['layers'],
             args['gpu'],
             args['db'],
-            args['resize']
+            args['resize'],
+            image_cache=image_cache,
+            chunk_size=args['chunk_size'],
+            store_input_data=args['input_data'],
+            workers=args['workers'],
+            chunk_results=args['chunk_results'],
         )
     except Exception as e:
         logger.error('%s: %s' % (type(e).__name__, e.message))
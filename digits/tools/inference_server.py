@@ -0,0 +1,129 @@
+#!/usr/bin/env python2
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+
+# Add path for DIGITS package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import digits.config  # noqa
+from digits import log  # noqa
+from digits.inference.errors import InferenceError  # noqa
+from digits.inference.worker import send_message, recv_message  # noqa
+from digits.tools import inference  # noqa
+
+logger = logging.getLogger('digits.tools.inference_server')
+
+
+"""
+Keep a model snapshot loaded and serve inference requests over a unix socket
+
+Each connection carries one request {'images': [paths], 'resize': bool,
+'input_data': bool} and gets one response {'inputs': {'ids'}, 'outputs': OrderedDict}
+or {'error': message} (see digits.inference.worker). The loaded images are
+only sent back, in inputs['data'], if input_data is set
+"""
+
+
+def serve(socket_path, jobs_dir, model_id, epoch, gpu):
+    model, dataset, epoch = inference.load_model(jobs_dir, model_id, epoch)
+
+    # load the network before accepting requests
+    model.train_task().get_net(epoch, gpu=gpu)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0600)
+    server.listen(16)
+    logger.info('Serving model %s (epoch %s) on %s' % (model_id, epoch, socket_path))
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request = recv_message(conn)
+                start = time.time()
+                response = handle(request, model, dataset, epoch, gpu)
+                send_message(conn, response)
+                logger.debug('Served %d images in %.3f seconds' % (len(request['images']), time.time() - start))
+            except (socket.error, EOFError) as e:
+                logger.warning('Connection error: %s' % e)
+            finally:
+                conn.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def handle(request, model, dataset, epoch, gpu):
+    """
+    Returns the response to one request
+    """
+    try:
+        resize = request.get('resize', True)
+        input_ids, input_data = inference.load_images(request['images'], dataset, resize)
+        if len(input_data) == 0:
+            raise InferenceError('Unable to load any image')
+        # always batch inference, so a request's outputs don't depend on its size
+        outputs, _ = inference.run_inference(model, input_data, epoch, 'none', gpu, resize, False)
+    except Exception as e:
+        logger.error('%s: %s' % (type(e).__name__, e))
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+    inputs = {'ids': input_ids}
+    if request.get('input_data', False):
+        inputs['data'] = input_data
+    return {
+        'inputs': inputs,
+        'outputs': outputs,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inference server - DIGITS')
+
+    # Positional arguments
+
+    parser.add_argument(
+        'model',
+        help='Model ID')
+    parser.add_argument(
+        'socket',
+        help='Path of the unix socket to listen on')
+
+    # Optional arguments
+
+    parser.add_argument(
+        '-e',
+        '--epoch',
+        default='-1',
+        help="Epoch (-1 for last)"
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs_dir',
+        default='none',
+        help='Jobs directory (default: from DIGITS config)',
+    )
+
+    parser.add_argument(
+        '-g',
+        '--gpu',
+        type=int,
+        default=None,
+        help='GPU to use (as in nvidia-smi output, default: None)',
+    )
+
+    args = vars(parser.parse_args())
+
+    try:
+        serve(args['socket'], args['jobs_dir'], args['model'], args['epoch'], args['gpu'])
+    except Exception as e:
+        logger.error('%s: %s' % (type(e).__name__, e.message))
+        raise
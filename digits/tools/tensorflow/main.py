@@ -62,6 +62,8 @@ tf.app.flags.DEFINE_integer(
     'croplen', 0, """Crop (x and y). A zero value means no cropping will be applied""")
 tf.app.flags.DEFINE_integer('epoch', 1, """Number of epochs to train, -1 for unbounded""")
 tf.app.flags.DEFINE_string('inference_db', '', """Directory with inference file source""")
+tf.app.flags.DEFINE_string(
+    'predictions_file', '', """NumPy file to save the inference predictions to, instead of logging them""")
 tf.app.flags.DEFINE_integer(
     'validation_interval', 1, """Number of train epochs to complete, to perform one validation""")
 tf.app.flags.DEFINE_string('labels_list', '', """Text file listing label definitions""")
@@ -346,6 +348,9 @@ def Inference(sess, model):
                     activation_ops.append(node_op_name)
                     continue
 
+    # memory-mapped .npy file, in image order
+    predictions = None
+
     try:
         while not model.queue_coord.should_stop():
             keys, preds, [w], [a] = sess.run([model.dataloader.batch_k,
@@ -356,15 +361,28 @@ def Inference(sess, model):
             if FLAGS.visualize_inf:
                 save_weight_visualization(weight_vars, activation_ops, w, a)
 
+            if FLAGS.predictions_file and predictions is None:
+                predictions = np.lib.format.open_memmap(
+                    FLAGS.predictions_file, mode='w+', dtype=preds.dtype,
+                    shape=(model.dataloader.get_total(),) + preds.shape[1:])
+
             # @TODO(tzaman): error on no output?
             for i in range(len(keys)):
                 #    for j in range(len(preds)):
                 # We're allowing multiple predictions per image here. DIGITS doesnt support that iirc
-                logging.info('Predictions for image ' + str(model.dataloader.get_key_index(keys[i])) +
-                             ': ' + json.dumps(preds[i].tolist()))
+                if predictions is not None:
+                    predictions[model.dataloader.get_key_index(keys[i])] = preds[i]
+                else:
+                    logging.info('Predictions for image ' + str(model.dataloader.get_key_index(keys[i])) +
+                                 ': ' + json.dumps(preds[i].tolist()))
     except tf.errors.OutOfRangeError:
         print('Done: tf.errors.OutOfRangeError')
 
+    if predictions is not None:
+        predictions.flush()
+        del predictions
+        logging.info('Saved predictions to %s' % FLAGS.predictions_file)
+
 
 def Validation(sess, model, current_epoch):
     """
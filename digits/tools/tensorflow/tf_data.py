@@ -221,7 +221,9 @@ class LoaderFactory(object):
             logging.info("Found %s images in db %s ", self.get_total(), self.db_path)
 
     def get_key_index(self, key):
-        return self.keys.index(key)
+        if getattr(self, '_key_index', None) is None:
+            self._key_index = dict((k, i) for i, k in enumerate(self.keys))
+        return self._key_index[key]
 
     def set_augmentation(self, mean_loader, aug_dict={}):
         with tf.device('/cpu:0'):
@@ -648,6 +650,8 @@ class TFRecordsLoader(LoaderFactory):
         self.shard_paths = []
         list_db_files = os.path.join(self.db_path, 'list.txt')
         self.total = 0
+        # TFRecordReader keys are "<shard path>:<byte offset of the record>"
+        self.keys = []
         if os.path.exists(list_db_files):
             files = [os.path.join(self.db_path, f) for f in open(list_db_files, 'r').read().splitlines()]
         else:
@@ -655,12 +659,15 @@ class TFRecordsLoader(LoaderFactory):
         for shard_path in files:
             # Account for the relative path format in list.txt
             record_iter = tf.python_io.tf_record_iterator(shard_path)
+            offset = 0
             for r in record_iter:
+                self.keys.append('%s:%d' % (shard_path, offset))
+                # length, length CRC, data, data CRC
+                offset += 8 + 4 + len(r) + 4
                 self.total += 1
             if not self.total:
                 raise ValueError('Database or shard contains no records (%s)' % (self.db_path))
             self.shard_paths.append(shard_path)
-        self.keys = ['%s:0' % p for p in self.shard_paths]
 
         # Use last record read to extract some preliminary data that is sometimes needed or useful
         example_proto = tf.train.Example()
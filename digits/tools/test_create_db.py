@@ -2,16 +2,20 @@
 
 from collections import Counter
 import os.path
+import random
 import shutil
 import tempfile
+import threading
 import Queue
 
+import lmdb
+import mock
 import nose.tools
 import numpy as np
 import PIL.Image
 
 from . import create_db
-from digits import test_utils
+from digits import test_utils, utils
 
 
 test_utils.skipIfNotFramework('none')
@@ -86,6 +90,33 @@ class TestFillLoadQueue(BaseTest):
             self.empty_file[1], queue, shuffle)
 
 
+class TestStreamLoadQueue(BaseTest):
+
+    def test_valid_file(self):
+        for shuffle in True, False:
+            yield self.check_valid_file, shuffle
+
+    def check_valid_file(self, shuffle):
+        offsets = create_db._index_input_file(self.good_file[1])
+        assert len(offsets) == self.image_count, 'lines not indexed'
+
+        queue = Queue.Queue()
+        create_db._stream_load_queue(self.good_file[1], offsets, queue, shuffle, 2)
+        items = [queue.get() for _ in xrange(queue.qsize())]
+        assert items[-2:] == [None, None], 'missing sentinels'
+        assert [item[0] for item in items[:-2]] == range(self.image_count)
+        labels = [item[2] for item in items[:-2]]
+        if not shuffle:
+            assert labels == sorted(labels), 'input order not preserved'
+        assert sorted(labels) == sorted(i for i in xrange(3) for _ in xrange(6))
+
+    def test_empty_file(self):
+        nose.tools.assert_raises(
+            create_db.BadInputFileError,
+            create_db._index_input_file,
+            self.empty_file[1])
+
+
 class TestParseLine():
 
     def test_good_lines(self):
@@ -138,20 +169,72 @@ class TestCalculateBatchSize():
 class TestCalculateNumThreads():
 
     def test(self):
-        for batch_size, shuffle, num in [
-                (1000, True, 10),
-                (1000, False, 1),
-                (100, True, 10),
-                (100, False, 1),
-                (50, True, 7),
-                (4, True, 2),
-                (1, True, 1),
+        for batch_size, num in [
+                (1000, 10),
+                (100, 10),
+                (50, 7),
+                (4, 2),
+                (1, 1),
         ]:
-            yield self.check, batch_size, shuffle, num
-
-    def check(self, batch_size, shuffle, num):
-        assert create_db._calculate_num_threads(
-            batch_size, shuffle) == num
+            yield self.check, batch_size, num
+
+    def check(self, batch_size, num):
+        assert create_db._calculate_num_threads(batch_size) == num
+
+
+class TestReorderQueue():
+
+    def test_ordered(self):
+        q = create_db.ReorderQueue(10)
+        for index in 2, 0, 3, 1, 4:
+            q.put((index, None if index == 3 else 'item%d' % index))
+        items = []
+        while not q.empty():
+            items.append(q.get())
+        assert items == ['item0', 'item1', 'item2', 'item4'], items
+
+    def test_unordered(self):
+        q = create_db.ReorderQueue(10, ordered=False)
+        for index in 2, 0, 1:
+            q.put((index, 'item%d' % index))
+        assert q.qsize() == 3
+        assert q.get() == 'item2'
+
+    def test_empty(self):
+        q = create_db.ReorderQueue(10)
+        q.put((1, 'item1'))
+        assert q.empty(), 'item handed out before its predecessor'
+        nose.tools.assert_raises(Queue.Empty, q.get, True, 0.01)
+
+    def test_get_many(self):
+        q = create_db.ReorderQueue(10)
+        for index in xrange(5):
+            q.put((index, index))
+        assert q.get_many(3) == [0, 1, 2]
+        assert q.get_many(3) == [3, 4]
+
+    def test_sentinel(self):
+        q = create_db.ReorderQueue(10)
+        q.put((1, 'item1'))
+        q.put_sentinel('done')
+        q.put((0, 'item0'))
+        assert q.get_many(10) == ['done', 'item0', 'item1']
+
+    def test_threads(self):
+        q = create_db.ReorderQueue(4)
+        indices = range(100)
+        random.shuffle(indices)
+
+        def produce(mine):
+            for index in sorted(mine):
+                q.put((index, index))
+        producers = [threading.Thread(target=produce, args=(indices[i::3],)) for i in xrange(3)]
+        for p in producers:
+            p.start()
+        items = [q.get(True, 5) for _ in xrange(100)]
+        for p in producers:
+            p.join()
+        assert items == range(100)
 
 
 class TestInitialImageSum():
@@ -224,6 +307,44 @@ class BaseCreationTest(BaseTest):
         create_db.create_db(self.good_file[1], os.path.join(self.empty_dir, 'db'),
                             10, 10, 1, self.BACKEND, shuffle=False)
 
+    def test_stream(self):
+        for shuffle in True, False:
+            for workers in None, 2:
+                yield self.check_stream, shuffle, workers
+
+    def check_stream(self, shuffle, workers):
+        create_db.create_db(self.good_file[1], os.path.join(self.empty_dir, 'db'),
+                            10, 10, 3, self.BACKEND, shuffle=shuffle, workers=workers, stream=True)
+
+    def test_workers(self):
+        for shuffle in True, False:
+            yield self.check_workers, shuffle
+
+    def check_workers(self, shuffle):
+        create_db.create_db(self.good_file[1], os.path.join(self.empty_dir, 'db'),
+                            10, 10, 3, self.BACKEND, shuffle=shuffle, workers=2)
+
+    def test_workers_with_patched_threading(self):
+        with mock.patch.object(create_db, '_threading_is_patched', return_value=True), \
+                mock.patch.object(create_db, '_start_load_processes') as start:
+            stats = create_db.create_db(self.good_file[1], os.path.join(self.empty_dir, 'db'),
+                                        10, 10, 3, self.BACKEND, workers=2)
+        assert not start.called, 'worker processes were started'
+        assert stats['images_written'] > 0
+
+    def test_image_cache(self):
+        for workers in None, 2:
+            yield self.check_image_cache, workers
+
+    def check_image_cache(self, workers):
+        cache = utils.image_cache.ImageCache(os.path.join(self.empty_dir, 'cache'))
+        for i in xrange(2):
+            stats = create_db.create_db(self.good_file[1], os.path.join(self.empty_dir, 'db'),
+                                        10, 10, 3, self.BACKEND, workers=workers, image_cache=cache)
+        # both images were cached by the first run
+        assert stats['cache_hit_rate'] >= 0.5, stats['cache_hit_rate']
+        shutil.rmtree(cache.cache_dir)
+
     def test_means(self):
         mean_files = []
         for suffix in 'jpg', 'npy', 'png', 'binaryproto':
@@ -235,6 +356,35 @@ class BaseCreationTest(BaseTest):
 class TestLmdbCreation(BaseCreationTest):
     BACKEND = 'lmdb'
 
+    def test_no_shuffle_order(self):
+        for workers in None, 2:
+            yield self.check_no_shuffle_order, workers
+
+    def test_map_growth(self):
+        for append in True, False:
+            yield self.check_map_growth, append
+
+    def check_map_growth(self, append):
+        # start with a tiny map and many small transactions
+        db_dir = os.path.join(self.empty_dir, 'db')
+        create_db.create_db(self.good_file[1], db_dir,
+                            64, 64, 3, 'lmdb',
+                            lmdb_map_size=1 << 16, lmdb_txn_size=1 << 14,
+                            lmdb_append=append, lmdb_writemap=append)
+        db = lmdb.open(db_dir, readonly=True)
+        assert db.stat()['entries'] == self.image_count
+        db.close()
+
+    def check_no_shuffle_order(self, workers):
+        db_dir = os.path.join(self.empty_dir, 'db')
+        create_db.create_db(self.good_file[1], db_dir,
+                            10, 10, 1, 'lmdb', shuffle=False, workers=workers)
+        db = lmdb.open(db_dir, readonly=True)
+        with db.begin() as txn:
+            labels = [int(key.split('_')[1]) for key, _ in txn.cursor()]
+        db.close()
+        assert labels == sorted(labels), 'input order not preserved: %s' % labels
+
 
 class TestHdf5Creation(BaseCreationTest):
     BACKEND = 'hdf5'
@@ -0,0 +1,239 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+from collections import OrderedDict
+import base64
+import os
+import shutil
+import tempfile
+
+import h5py
+import mock
+from multiprocessing.pool import ThreadPool
+import nose.tools
+import numpy as np
+import PIL.Image
+
+from . import inference
+from digits import test_utils
+from digits.inference.errors import InferenceError
+from digits.inference.tasks import InferenceTask
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestChunks():
+    """
+    Runs infer() with the model replaced by a fake one
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.count = 10
+        self.input_list = os.path.join(self.folder, 'list.txt')
+        with open(self.input_list, 'w') as f:
+            for i in xrange(self.count):
+                # odd images can't be loaded
+                f.write('%d\n' % i)
+
+        def load_images(paths, dataset, resize, image_cache=None, pool=None):
+            ids = [idx for idx, path in enumerate(paths) if int(path) % 2 == 0]
+            return ids, [np.full((2, 2), int(paths[idx]), dtype=np.uint8) for idx in ids]
+
+        def run_inference(model, input_data, epoch, layers, gpu, resize, single):
+            values = np.array([image[0, 0] for image in input_data], dtype=np.float32)
+            return OrderedDict([('a', values[:, np.newaxis]), ('b', -values)]), None
+
+        self.patchers = [
+            mock.patch.object(inference, 'load_model', return_value=(None, None, 1)),
+            mock.patch.object(inference, 'load_images', side_effect=load_images),
+            mock.patch.object(inference, 'run_inference', side_effect=run_inference),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.folder)
+
+    def infer(self, chunk_size, store_input_data='uncompressed'):
+        inference.infer(self.input_list, self.folder, 'none', 'model', -1, 1,
+                        'none', None, False, True, chunk_size=chunk_size,
+                        store_input_data=store_input_data)
+        with h5py.File(os.path.join(self.folder, 'inference.hdf5'), 'r') as db:
+            outputs = sorted((dset.attrs['id'], base64.urlsafe_b64decode(str(key)), dset[...])
+                             for key, dset in db['outputs'].items())
+            input_data = db['input_data'][...] if 'input_data' in db else None
+            return db['input_ids'][...], input_data, outputs
+
+    def test_chunks(self):
+        for chunk_size in 1, 3, 4, 10, 100:
+            yield self.check_chunks, chunk_size
+
+    def check_chunks(self, chunk_size):
+        expected = self.infer(None)
+        assert list(expected[0]) == range(0, self.count, 2)
+        input_ids, input_data, outputs = self.infer(chunk_size)
+        assert np.array_equal(input_ids, expected[0])
+        assert np.array_equal(input_data, expected[1])
+        assert [o[:2] for o in outputs] == [(0, 'a'), (1, 'b')]
+        for output, expected_output in zip(outputs, expected[2]):
+            assert np.array_equal(output[2], expected_output[2])
+
+    def test_no_input_data(self):
+        input_ids, input_data, outputs = self.infer(3, store_input_data='none')
+        assert list(input_ids) == range(0, self.count, 2)
+        assert input_data is None
+        assert len(outputs) == 2
+
+    def test_compressed_input_data(self):
+        expected = self.infer(None)[1]
+        input_data = self.infer(3, store_input_data='compressed')[1]
+        assert np.array_equal(input_data, expected)
+
+        task = InferenceTask.__new__(InferenceTask)
+        task.inference_data_filename = os.path.join(self.folder, 'inference.hdf5')
+        with h5py.File(task.inference_data_filename, 'r') as db:
+            assert db['input_data'].compression == 'gzip'
+        indices = [4, 0, 4, 2]
+        assert np.array_equal(task.get_input_data(indices), expected[indices])
+
+    def test_chunk_results(self):
+        with mock.patch.object(inference.logger, 'info') as info:
+            inference.infer(self.input_list, self.folder, 'none', 'model', -1, 1,
+                            'none', None, False, True, chunk_size=4, chunk_results=True)
+        expected = self.infer(None)
+
+        # pass the log to the task, like the tool's output
+        task = InferenceTask.__new__(InferenceTask)
+        task.inference_log = mock.Mock()
+        task.emit_progress_update = mock.Mock()
+        task.chunk_result_files = []
+        for call in info.call_args_list:
+            task.process_output('2017-01-01 00:00:00 [INFO ] %s' % call[0][0])
+        assert task.progress == 1
+        assert len(task.chunk_result_files) == 3
+
+        chunks = task.get_chunk_results()
+        assert [list(inputs['ids']) for inputs, _ in chunks] == [[0, 2], [4, 6], [8]]
+        assert [outputs.keys() for _, outputs in chunks] == [['a', 'b']] * 3
+        for output_id in 0, 1:
+            assert np.array_equal(np.concatenate([outputs.values()[output_id] for _, outputs in chunks]),
+                                  expected[2][output_id][2])
+        assert len(task.get_chunk_results(2)) == 1
+
+    def test_no_images(self):
+        with open(self.input_list, 'w') as f:
+            f.write('1\n3\n')
+        nose.tools.assert_raises(InferenceError, self.infer, 1)
+        assert not os.path.exists(os.path.join(self.folder, 'inference.hdf5'))
+
+
+class TestSingleOrBatch():
+    """
+    Runs infer() with a fake train task, to check which kind of inference
+    is used for each chunk
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.input_list = os.path.join(self.folder, 'list.txt')
+        self.task = mock.Mock()
+        # like Torch and TensorFlow, single image inference returns (label, confidence) strings
+        self.task.infer_one.return_value = (
+            OrderedDict([('a', np.array([['label', '1.0']]))]), [])
+        self.task.infer_many.side_effect = lambda input_data, **kwargs: OrderedDict(
+            [('a', np.array([[float(image[0, 0])] for image in input_data]))])
+        model = mock.Mock()
+        model.train_task.return_value = self.task
+
+        def load_images(paths, dataset, resize, image_cache=None, pool=None):
+            return range(len(paths)), [np.full((2, 2), int(path), dtype=np.uint8) for path in paths]
+
+        self.patchers = [
+            mock.patch.object(inference, 'load_model', return_value=(model, None, 1)),
+            mock.patch.object(inference, 'load_images', side_effect=load_images),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.folder)
+
+    def infer(self, count, chunk_size, layers='none'):
+        with open(self.input_list, 'w') as f:
+            for i in xrange(count):
+                f.write('%d\n' % i)
+        inference.infer(self.input_list, self.folder, 'none', 'model', -1, 1,
+                        layers, None, False, True, chunk_size=chunk_size)
+        with h5py.File(os.path.join(self.folder, 'inference.hdf5'), 'r') as db:
+            return db['outputs'].values()[0][...]
+
+    def test_last_chunk_of_one(self):
+        outputs = self.infer(5, 2)
+        assert not self.task.infer_one.called
+        assert self.task.infer_many.call_count == 3
+        assert outputs.tolist() == [[0.0], [1.0], [2.0], [3.0], [4.0]]
+
+    def test_chunks_of_one(self):
+        outputs = self.infer(3, 1)
+        assert not self.task.infer_one.called
+        assert outputs.tolist() == [[0.0], [1.0], [2.0]]
+
+    def test_one_image(self):
+        self.infer(1, 2)
+        assert not self.task.infer_many.called
+        assert self.task.infer_one.call_count == 1
+
+
+class TestLoadImages():
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        for i in xrange(6):
+            path = os.path.join(self.folder, '%d.png' % i)
+            PIL.Image.fromarray(np.full((12, 16, 3), 40 * i, dtype=np.uint8)).save(path)
+            self.paths.append(path + '\n')
+        self.paths.insert(2, os.path.join(self.folder, 'missing.png'))
+        self.dataset = mock.Mock()
+        self.dataset.get_feature_dims.return_value = (6, 8, 3)
+        self.dataset.resize_mode = 'squash'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_pool(self):
+        expected_ids, expected_data = inference.load_images(self.paths, self.dataset, True)
+        assert expected_ids == [0, 1, 3, 4, 5, 6]
+        assert expected_data[0].shape == (6, 8, 3)
+        pool = ThreadPool(3)
+        try:
+            input_ids, input_data = inference.load_images(self.paths, self.dataset, True, pool=pool)
+        finally:
+            pool.terminate()
+        assert input_ids == expected_ids
+        for image, expected in zip(input_data, expected_data):
+            assert np.array_equal(image, expected)
+
+
+class TestPrefetchChunks():
+
+    def test_order(self):
+        def load_chunk(start, stop):
+            return range(start, min(stop, 10)), None
+        chunks = list(inference.prefetch_chunks(load_chunk, 10, 4, depth=1))
+        assert [c[:3] for c in chunks] == [(0, 4, [0, 1, 2, 3]), (4, 8, [4, 5, 6, 7]), (8, 10, [8, 9])]
+        assert all(c[4] >= 0 for c in chunks)
+
+    def test_error(self):
+        def load_chunk(start, stop):
+            if start > 0:
+                raise ValueError('bad chunk')
+            return [], []
+        chunks = inference.prefetch_chunks(load_chunk, 10, 5)
+        assert next(chunks)[0] == 0
+        nose.tools.assert_raises(ValueError, next, chunks)
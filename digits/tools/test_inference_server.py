@@ -0,0 +1,51 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+
+from collections import OrderedDict
+
+import mock
+import numpy as np
+
+from . import inference_server
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestHandle():
+
+    def setUp(self):
+        def load_images(paths, dataset, resize, image_cache=None, pool=None):
+            ids = [idx for idx, path in enumerate(paths) if path != 'bad']
+            return ids, [np.zeros((2, 2)) for idx in ids]
+
+        def run_inference(model, input_data, epoch, layers, gpu, resize, single):
+            assert not single
+            return OrderedDict([('out', np.ones((len(input_data), 3)))]), None
+
+        self.patchers = [
+            mock.patch.object(inference_server.inference, 'load_images', side_effect=load_images),
+            mock.patch.object(inference_server.inference, 'run_inference', side_effect=run_inference),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def handle(self, request):
+        return inference_server.handle(request, None, None, 1, None)
+
+    def test_ids_only(self):
+        response = self.handle({'images': ['a', 'bad', 'b']})
+        assert response['inputs'] == {'ids': [0, 2]}
+        assert response['outputs']['out'].shape == (2, 3)
+
+    def test_input_data(self):
+        response = self.handle({'images': ['a'], 'input_data': True})
+        assert response['inputs']['ids'] == [0]
+        assert len(response['inputs']['data']) == 1
+
+    def test_error(self):
+        assert 'error' in self.handle({'images': ['bad']})
@@ -31,13 +31,14 @@ opt = lapp[[
 -y,--ccn2 (default no) should be 'yes' if ccn2 is used in network. Default : false
 -s,--save (default .) save directory
 
---testMany (default no) If this option is 'yes', then the "image" input parameter should specify the text-file containing a list of image files to be tested
+--testMany (default no) If this option is 'yes', then the "image" input parameter should specify the text-file containing a list of image files to be tested, or an HDF5 file (.h5) whose "data" dataset holds the images (NxHxWxC, 8-bit)
 --testUntil (default -1) specifies how many images in the "image" file to be tested. This parameter is only valid when testMany is set to "yes"
 --subtractMean (default 'image') Select mean subtraction method. Possible values are 'image', 'pixel' or 'none'.
 --labels (default '') file contains label definitions
 --snapshot (string) Path to snapshot to load
 --networkDirectory (default '') directory in which network exists
 --allPredictions (default no) If 'yes', displays all the predictions of an image instead of formatted topN results
+--predictionsFile (default '') If set along with allPredictions, saves the predictions to the "predictions" dataset of this HDF5 file instead of displaying them (unless the network has several outputs)
 --visualization (default no) Create HDF5 database with layers weights and activations. Depends on --testMany~=yes
 --crop (default no) If this option is 'yes', all the images are cropped into square image. And croplength is provided as --croplen parameter
 --croplen (default 0) crop length. This is required parameter when crop option is provided
@@ -230,6 +231,12 @@ end
 -- tensor of inputs batch size * channels * height * width
 local inputs
 
+-- predictions to save to opt.predictionsFile, one per image
+local savedPredictions = nil
+if opt.allPredictions == 'yes' and opt.predictionsFile ~= '' then
+    savedPredictions = {}
+end
+
 -- predict batch and display the topN predictions for the images in batch
 local function predictBatch(inputs, model)
     if opt.type == 'float' then
@@ -270,22 +277,78 @@ local function predictBatch(inputs, model)
                 -- output format : LABEL_ID (LABEL_NAME) CONFIDENCE
                 logmessage.display(0,'For image ' .. index .. ', predicted class ' .. tostring(j) .. ': ' .. classes[j] .. ' (' .. class_labels[classes[j]] .. ') ' .. prediction[j])
             end
+        elseif savedPredictions and torch.isTensor(prediction) then
+            table.insert(savedPredictions, prediction:float():clone())
         else
+            -- several outputs can't be saved as one dataset
+            savedPredictions = nil
             allPredictions = utils.dataToJson(prediction)
             logmessage.display(0,'Predictions for image ' .. index .. ': ' .. allPredictions)
         end
     end
 end
 
+-- save the predictions of all images to opt.predictionsFile
+local function savePredictions()
+    local size = savedPredictions[1]:size():totable()
+    table.insert(size, 1, #savedPredictions)
+    local data = torch.FloatTensor(torch.LongStorage(size))
+    for i, prediction in ipairs(savedPredictions) do
+        data[i]:copy(prediction)
+    end
+    local db = hdf5.open(opt.predictionsFile, 'w')
+    db:write('/predictions', data)
+    db:close()
+    logmessage.display(0,'Saved predictions to ' .. opt.predictionsFile)
+end
+
+-- returns an iterator over the images in the "data" dataset of an HDF5 file
+local function hdf5Images(filename)
+    local db = hdf5.open(filename, 'r')
+    local dset = db:read('/data')
+    local dims = dset:dataspaceSize()
+    local i = 0
+    return function()
+        i = i + 1
+        if i > dims[1] then
+            db:close()
+            return nil
+        end
+        -- HxWxC -> CxHxW, with pixel values between 0-255 like loadImage()
+        local im = dset:partial({i, i}, {1, dims[2]}, {1, dims[3]}, {1, dims[4]})[1]
+        return im:permute(3, 1, 2):type('torch.FloatTensor'):contiguous()
+    end
+end
+
+-- returns an iterator over the images in a list of image paths
+local function listImages(file)
+    local lines = file:lines()
+    return function()
+        local line = lines()
+        if line == nil then
+            return nil
+        end
+        local im = loadImage(line:match( "^%s*(.-)%s*$" ))
+        assert(im ~= nil, "Failed to load image")
+        return im
+    end
+end
+
 if opt.testMany == 'yes' then
     local network
     local model
-    local file = io.open(opt.image)
-    if file then
-        for line in file:lines() do
+    local images
+    if opt.image:match('%.h5$') and paths.filep(opt.image) then
+        images = hdf5Images(opt.image)
+    else
+        local file = io.open(opt.image)
+        if file then
+            images = listImages(file)
+        end
+    end
+    if images then
+        for im in images do
             counter = counter + 1
-            local image_path = line:match( "^%s*(.-)%s*$" )
-            local im = loadImage(image_path)
             local inputShape = getInputTensorShape(im, opt.croplen)
             if not network then
                 -- load model now - we need to wait after we have read at least one image to be able to
@@ -322,6 +385,9 @@ if opt.testMany == 'yes' then
                 predictBatch(inputs:narrow(1,1,counter), model)
             end
         end
+        if savedPredictions and #savedPredictions > 0 then
+            savePredictions()
+        end
     else
         logmessage.display(2,'Image file not found : ' .. opt.image)
     end
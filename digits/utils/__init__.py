@@ -164,4 +164,4 @@ def parse_version(*args):
 
 # Import the other utility functions
 
-from . import constants, image, time_filters, errors, forms, routing, auth  # noqa
+from . import constants, image, image_cache, time_filters, errors, forms, routing, auth  # noqa
@@ -13,7 +13,6 @@ except ImportError:
 
 import numpy as np
 import PIL.Image
-import scipy.misc
 
 from . import is_url, HTTP_TIMEOUT, errors
 
@@ -37,13 +36,18 @@ from . import is_url, HTTP_TIMEOUT, errors
 SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.pgm')
 
 
-def load_image(path):
+def load_image(path, size_hint=None):
     """
     Reads a file from `path` and returns a PIL.Image with mode 'L' or 'RGB'
     Raises LoadImageError
 
     Arguments:
     path -- path to the image, can be a filesystem path or a URL
+
+    Keyword arguments:
+    size_hint -- (height, width) the image is going to be resized to
+        JPEG images at least twice as large are decoded at 1/2, 1/4 or 1/8
+        scale instead of full size (never smaller than size_hint)
     """
     image = None
     if is_url(path):
@@ -54,6 +58,8 @@ def load_image(path):
             r.raise_for_status()
             stream = StringIO(r.content)
             image = PIL.Image.open(stream)
+            if size_hint is not None:
+                _draft_jpeg(image, *size_hint)
         except requests.exceptions.RequestException as e:
             raise errors.LoadImageError, e.message
         except IOError as e:
@@ -61,6 +67,8 @@ def load_image(path):
     elif os.path.exists(path):
         try:
             image = PIL.Image.open(path)
+            if size_hint is not None:
+                _draft_jpeg(image, *size_hint)
             image.load()
         except IOError as e:
             raise errors.LoadImageError, 'IOError: Trying to load "%s": %s' % (path, e.message)
@@ -90,6 +98,16 @@ def load_image(path):
         raise errors.LoadImageError, 'Image mode "%s" not supported' % image.mode
 
 
+def _draft_jpeg(image, height, width):
+    """
+    Configures a JPEG image which hasn't been decoded yet to be decoded
+    at the smallest scale which is still at least (height, width)
+    Does nothing for other images
+    """
+    if image.format == 'JPEG' and image.im is None:
+        image.draft(image.mode, (width, height))
+
+
 def upscale(image, ratio):
     """
     return upscaled image array
@@ -100,15 +118,30 @@ def upscale(image, ratio):
     """
     if not isinstance(image, np.ndarray):
         raise ValueError('Expected ndarray')
+    return upscale_images(image[np.newaxis], ratio)[0]
+
+
+def upscale_images(images, ratio):
+    """
+    return an array of images upscaled with nearest neighbour interpolation
+
+    Every pixel is looked up in one go with index arrays, which are
+    computed once for the whole batch
+
+    Arguments:
+    images -- a (N,H,W,C) numpy.ndarray
+    ratio -- scaling factor (>1)
+    """
+    if not isinstance(images, np.ndarray):
+        raise ValueError('Expected ndarray')
     if ratio < 1:
         raise ValueError('Ratio must be greater than 1 (ratio=%f)' % ratio)
-    width = int(math.floor(image.shape[1] * ratio))
-    height = int(math.floor(image.shape[0] * ratio))
-    channels = image.shape[2]
-    out = np.ndarray((height, width, channels), dtype=np.uint8)
-    for x, y in np.ndindex((width, height)):
-        out[y, x] = image[int(math.floor(y / ratio)), int(math.floor(x / ratio))]
-    return out
+    width = int(math.floor(images.shape[2] * ratio))
+    height = int(math.floor(images.shape[1] * ratio))
+    # source row/column of each output pixel
+    rows = np.floor(np.arange(height) / ratio).astype(np.intp)
+    cols = np.floor(np.arange(width) / ratio).astype(np.intp)
+    return images[:, rows[:, np.newaxis], cols].astype(np.uint8, copy=False)
 
 
 def image_to_array(image,
@@ -127,23 +160,7 @@ def image_to_array(image,
         raise ValueError('unsupported number of channels: %s' % channels)
 
     if isinstance(image, PIL.Image.Image):
-        # Convert image mode (channels)
-        if channels is None:
-            image_mode = image.mode
-            if image_mode not in ['L', 'RGB', 'RGBA']:
-                raise ValueError('unknown image mode "%s"' % image_mode)
-        elif channels == 1:
-            # 8-bit pixels, black and white
-            image_mode = 'L'
-        elif channels == 3:
-            # 3x8-bit pixels, true color
-            image_mode = 'RGB'
-        elif channels == 4:
-            # 4x8-bit pixels, true color with alpha
-            image_mode = 'RGBA'
-        if image.mode != image_mode:
-            image = image.convert(image_mode)
-        image = np.array(image)
+        image = np.array(_convert_pil_image(image, channels))
     elif isinstance(image, np.ndarray):
         if image.dtype != np.uint8:
             image = image.astype(np.uint8)
@@ -185,6 +202,46 @@ def image_to_array(image,
     return image
 
 
+def _convert_pil_image(image, channels=None):
+    """
+    Returns a PIL.Image converted to the mode for this number of channels
+    """
+    if channels is None:
+        image_mode = image.mode
+        if image_mode not in ['L', 'RGB', 'RGBA']:
+            raise ValueError('unknown image mode "%s"' % image_mode)
+    elif channels == 1:
+        # 8-bit pixels, black and white
+        image_mode = 'L'
+    elif channels == 3:
+        # 3x8-bit pixels, true color
+        image_mode = 'RGB'
+    elif channels == 4:
+        # 4x8-bit pixels, true color with alpha
+        image_mode = 'RGBA'
+    if image.mode != image_mode:
+        image = image.convert(image_mode)
+    return image
+
+
+def _resample(image, height, width):
+    """
+    Returns an image resized to (height, width) with bilinear
+    interpolation as a np.array
+
+    This is what scipy.misc.imresize() does for uint8 images, without
+    converting a PIL.Image to an array and back first
+
+    Arguments:
+    image -- a PIL.Image or a uint8 numpy.ndarray
+    """
+    if isinstance(image, np.ndarray):
+        image = PIL.Image.fromarray(image)
+    if image.size != (width, height):
+        image = image.resize((width, height), PIL.Image.BILINEAR)
+    return np.array(image)
+
+
 def resize_image(image, height, width,
                  channels=None,
                  resize_mode=None,
@@ -192,6 +249,10 @@ def resize_image(image, height, width,
     """
     Resizes an image and returns it as a np.array
 
+    A PIL.Image is resized directly. If it hasn't been decoded yet (as
+    returned by PIL.Image.open), JPEG images are decoded at a reduced
+    scale when they are much larger than the target size
+
     Arguments:
     image -- a PIL.Image or numpy.ndarray
     height -- height of new image
@@ -207,88 +268,119 @@ def resize_image(image, height, width,
     if resize_mode not in ['crop', 'squash', 'fill', 'half_crop']:
         raise ValueError('resize_mode "%s" not supported' % resize_mode)
 
-    # convert to array
-    image = image_to_array(image, channels)
+    if isinstance(image, PIL.Image.Image):
+        image_width, image_height = image.size
+    else:
+        # convert to a supported array
+        image = image_to_array(image, channels)
+        image_height, image_width = image.shape[:2]
 
     # No need to resize
-    if image.shape[0] == height and image.shape[1] == width:
-        return image
-
-    # Resize
-    interp = 'bilinear'
+    if image_height == height and image_width == width:
+        return image_to_array(image, channels)
 
-    width_ratio = float(image.shape[1]) / width
-    height_ratio = float(image.shape[0]) / height
+    # Calculate the size to resize to
+    width_ratio = float(image_width) / width
+    height_ratio = float(image_height) / height
     if resize_mode == 'squash' or width_ratio == height_ratio:
-        return scipy.misc.imresize(image, (height, width), interp=interp)
+        resize_height = height
+        resize_width = width
     elif resize_mode == 'crop':
         # resize to smallest of ratios (relatively larger image), keeping aspect ratio
         if width_ratio > height_ratio:
             resize_height = height
-            resize_width = int(round(image.shape[1] / height_ratio))
+            resize_width = int(round(image_width / height_ratio))
         else:
             resize_width = width
-            resize_height = int(round(image.shape[0] / width_ratio))
-        image = scipy.misc.imresize(image, (resize_height, resize_width), interp=interp)
+            resize_height = int(round(image_height / width_ratio))
+    elif resize_mode == 'fill':
+        # resize to biggest of ratios (relatively smaller image), keeping aspect ratio
+        if width_ratio > height_ratio:
+            resize_width = width
+            resize_height = int(round(image_height / width_ratio))
+            if (height - resize_height) % 2 == 1:
+                resize_height += 1
+        else:
+            resize_height = height
+            resize_width = int(round(image_width / height_ratio))
+            if (width - resize_width) % 2 == 1:
+                resize_width += 1
+    else:
+        # half_crop: resize to average ratio keeping aspect ratio
+        new_ratio = (width_ratio + height_ratio) / 2.0
+        resize_width = int(round(image_width / new_ratio))
+        resize_height = int(round(image_height / new_ratio))
+        if width_ratio > height_ratio and (height - resize_height) % 2 == 1:
+            resize_height += 1
+        elif width_ratio < height_ratio and (width - resize_width) % 2 == 1:
+            resize_width += 1
+
+    # Resize
+    if isinstance(image, PIL.Image.Image):
+        _draft_jpeg(image, resize_height, resize_width)
+        image = _convert_pil_image(image, channels)
+    image = _resample(image, resize_height, resize_width)
 
-        # chop off ends of dimension that is still too long
+    if resize_mode == 'squash' or width_ratio == height_ratio:
+        return image
+
+    # chop off ends of dimension that is still too long
+    if resize_mode in ['crop', 'half_crop']:
         if width_ratio > height_ratio:
             start = int(round((resize_width - width) / 2.0))
-            return image[:, start:start + width]
+            image = image[:, start:start + width]
         else:
             start = int(round((resize_height - height) / 2.0))
-            return image[start:start + height, :]
+            image = image[start:start + height, :]
+        if resize_mode == 'crop':
+            return image
+
+    # fill ends of dimension that is too short with random noise
+    out = np.empty((height, width) + image.shape[2:], dtype=np.uint8)
+    if width_ratio > height_ratio:
+        padding = (height - resize_height) / 2
+        out[:padding] = np.random.randint(0, 255, out[:padding].shape)
+        out[padding:height - padding] = image
+        out[height - padding:] = np.random.randint(0, 255, out[height - padding:].shape)
     else:
-        if resize_mode == 'fill':
-            # resize to biggest of ratios (relatively smaller image), keeping aspect ratio
-            if width_ratio > height_ratio:
-                resize_width = width
-                resize_height = int(round(image.shape[0] / width_ratio))
-                if (height - resize_height) % 2 == 1:
-                    resize_height += 1
-            else:
-                resize_height = height
-                resize_width = int(round(image.shape[1] / height_ratio))
-                if (width - resize_width) % 2 == 1:
-                    resize_width += 1
-            image = scipy.misc.imresize(image, (resize_height, resize_width), interp=interp)
-        elif resize_mode == 'half_crop':
-            # resize to average ratio keeping aspect ratio
-            new_ratio = (width_ratio + height_ratio) / 2.0
-            resize_width = int(round(image.shape[1] / new_ratio))
-            resize_height = int(round(image.shape[0] / new_ratio))
-            if width_ratio > height_ratio and (height - resize_height) % 2 == 1:
-                resize_height += 1
-            elif width_ratio < height_ratio and (width - resize_width) % 2 == 1:
-                resize_width += 1
-            image = scipy.misc.imresize(image, (resize_height, resize_width), interp=interp)
-            # chop off ends of dimension that is still too long
-            if width_ratio > height_ratio:
-                start = int(round((resize_width - width) / 2.0))
-                image = image[:, start:start + width]
-            else:
-                start = int(round((resize_height - height) / 2.0))
-                image = image[start:start + height, :]
-        else:
-            raise Exception('unrecognized resize_mode "%s"' % resize_mode)
+        padding = (width - resize_width) / 2
+        out[:, :padding] = np.random.randint(0, 255, out[:, :padding].shape)
+        out[:, padding:width - padding] = image
+        out[:, width - padding:] = np.random.randint(0, 255, out[:, width - padding:].shape)
+    return out
 
-        # fill ends of dimension that is too short with random noise
-        if width_ratio > height_ratio:
-            padding = (height - resize_height) / 2
-            noise_size = (padding, width)
-            if channels > 1:
-                noise_size += (channels,)
-            noise = np.random.randint(0, 255, noise_size).astype('uint8')
-            image = np.concatenate((noise, image, noise), axis=0)
-        else:
-            padding = (width - resize_width) / 2
-            noise_size = (height, padding)
-            if channels > 1:
-                noise_size += (channels,)
-            noise = np.random.randint(0, 255, noise_size).astype('uint8')
-            image = np.concatenate((noise, image, noise), axis=1)
 
-        return image
+def resize_images(images, height, width, channels,
+                  resize_mode=None,
+                  out=None,
+                  ):
+    """
+    Resizes a list of images into one (N, height, width, channels) np.array
+    Each image is resized as with resize_image() and copied straight into
+    its slot, so no intermediate list of arrays is kept around
+
+    Arguments:
+    images -- a list of PIL.Images or numpy.ndarrays
+    height -- height of new images
+    width -- width of new images
+    channels -- channels of new images
+
+    Keyword Arguments:
+    resize_mode -- can be crop, squash, fill or half_crop
+    out -- a preallocated uint8 array to write into
+    """
+    shape = (len(images), height, width, channels)
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+    elif out.shape != shape or out.dtype != np.uint8:
+        raise ValueError('out should be a uint8 array of shape %s' % (shape,))
+
+    for i, image in enumerate(images):
+        image = resize_image(image, height, width,
+                             channels=channels,
+                             resize_mode=resize_mode)
+        out[i] = image.reshape((height, width, channels))
+    return out
 
 
 def embed_image_html(image):
@@ -0,0 +1,220 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from . import image as image_utils
+from . import is_url
+
+# Default size cap for the cache (in bytes)
+DEFAULT_MAX_SIZE = 10 << 30
+
+# Eviction removes entries until the cache is this fraction of its size cap,
+# so that a full cache doesn't have to evict on every insertion
+EVICTION_LOW_WATER = 0.9
+
+
+class ImageCache(object):
+    """
+    An on-disk cache of decoded and resized images
+
+    Entries are keyed by (path, mtime, file size, height, width, channels,
+    resize_mode), so an image is decoded again if its file changes or if it
+    is requested with different dimensions. Each entry is stored in its own
+    .npy file and is memory-mapped when read
+
+    Once the cache grows past max_size, the least recently used entries
+    are evicted (entries are touched on every hit). Several processes can
+    share a cache directory since entries are written atomically
+
+    Note that images resized with resize_mode='fill' keep the random noise
+    they were first created with
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        Arguments:
+        cache_dir -- where to store the cache (created if necessary)
+
+        Keyword arguments:
+        max_size -- size cap in bytes (defaults to DEFAULT_MAX_SIZE)
+        """
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        if max_size <= 0:
+            raise ValueError('invalid cache size')
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # total size of the entries (scanned the first time it's needed)
+        self._size = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def load(self, path, height, width, channels=None, resize_mode=None):
+        """
+        Returns utils.image.resize_image(utils.image.load_image(path), ...)
+        from the cache, or computes and caches it
+        Raises LoadImageError
+        """
+        key = self.key(path, height, width, channels, resize_mode)
+        if key is not None:
+            image = self.get(key)
+            if image is not None:
+                return image
+
+        image = image_utils.resize_image(image_utils.load_image(path, size_hint=(height, width)),
+                                         height, width,
+                                         channels=channels,
+                                         resize_mode=resize_mode,
+                                         )
+        if key is not None:
+            self.put(key, image)
+        return image
+
+    def key(self, path, height, width, channels=None, resize_mode=None):
+        """
+        Returns the cache key for this image, or None if it can't be cached
+        (URLs and missing files)
+        """
+        if is_url(path):
+            return None
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if resize_mode is None:
+            resize_mode = 'squash'
+        fields = (path, stat.st_mtime, stat.st_size, height, width, channels, resize_mode)
+        return hashlib.sha1(repr(fields)).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached array for this key, or None
+        """
+        filename = self._filename(key)
+        try:
+            image = np.asarray(np.load(filename, mmap_mode='r'))
+            # mark as recently used
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            if os.path.exists(filename):
+                # entry is corrupt (e.g. interrupted copy), drop it
+                self._remove(filename)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return image
+
+    def put(self, key, image):
+        """
+        Stores an array in the cache
+        """
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        # write to a temporary file first so that readers never see partial entries
+        tmp_filename = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.current_thread().ident)
+        with open(tmp_filename, 'wb') as outfile:
+            np.save(outfile, np.ascontiguousarray(image, dtype=np.uint8))
+        entry_size = os.path.getsize(tmp_filename)
+        os.rename(tmp_filename, filename)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += entry_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def hit_rate(self):
+        """
+        Returns the fraction of lookups which were hits
+        """
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def merge_stats(self, hits, misses):
+        """
+        Adds hits and misses from a copy of this cache (e.g. in another process)
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def size(self):
+        """
+        Returns the total size of the entries in bytes
+        """
+        return self._scan()[1]
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def _scan(self):
+        """
+        Returns ([(mtime, size, filename), ...], total size) for all entries
+        """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith('.npy'):
+                    continue
+                filename = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        """
+        Removes the least recently used entries
+        Must be called with the lock held
+        """
+        entries, total = self._scan()
+        entries.sort()
+        target = self.max_size * EVICTION_LOW_WATER
+        for _, size, filename in entries:
+            if total <= target:
+                break
+            self._remove(filename)
+            total -= size
+        self._size = total
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            # removed by another process
+            pass
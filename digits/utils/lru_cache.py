@@ -0,0 +1,109 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """
+    An in-memory cache of objects which evicts the least recently used
+    entries once their total size passes max_size
+
+    The size of each entry is computed by a function passed to get() when
+    the entry is loaded. The most recently loaded entry is always kept,
+    even if it is bigger than max_size on its own
+    """
+
+    def __init__(self, max_size):
+        """
+        Arguments:
+        max_size -- size cap, in the units returned by the size functions
+        """
+        if max_size <= 0:
+            raise ValueError('invalid cache size')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, size), least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, load, size_of):
+        """
+        Returns the cached value for this key, or calls load() and caches
+        its return value
+
+        Arguments:
+        key -- a hashable key
+        load -- called with no arguments on a miss
+        size_of -- called with the loaded value, returns its size
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                entry = self._entries.pop(key)
+                self._entries[key] = entry
+                return entry[0]
+
+            self.misses += 1
+            # the lock is held while loading so that concurrent misses
+            # don't load the same entry twice
+            value = load()
+            size = size_of(value)
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_size and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+            return value
+
+    def remove(self, key):
+        """
+        Removes an entry from the cache, if present
+        """
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Removes all entries (the hit/miss counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def size(self):
+        """
+        Returns the total size of the entries
+        """
+        with self._lock:
+            return self._size
+
+    def stats(self):
+        """
+        Returns a dict of hit/miss/eviction counters and the current size
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size,
+            }
@@ -0,0 +1,164 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import array
+
+import numpy as np
+
+NAN = float('nan')
+
+
+class MetricSeries(object):
+    """
+    A list-like series of the values of a training output, one per epoch
+    (see TrainTask.save_output), stored in an array of doubles
+
+    None is stored as NaN. An epoch which got several values keeps them in
+    a list, like a plain list would, and the array holds their mean
+    """
+
+    def __init__(self, values=()):
+        self._values = array.array('d')
+        # index -> list of values, for the epochs which got several
+        self._multiple = {}
+        self.extend(values)
+
+    def __getstate__(self):
+        return {
+            'values': self._values.tostring(),
+            'multiple': self._multiple,
+        }
+
+    def __setstate__(self, state):
+        self._values = array.array('d')
+        self._values.fromstring(state['values'])
+        self._multiple = state['multiple']
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        value = self._values[index]
+        if self._multiple:
+            if index < 0:
+                index += len(self)
+            if index in self._multiple:
+                return self._multiple[index]
+        return None if value != value else value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1 or stop < len(self):
+                raise ValueError('Only the end of a MetricSeries can be replaced')
+            self.truncate(start)
+            self.extend(value)
+            return
+        if index < 0:
+            index += len(self)
+        if isinstance(value, list):
+            self._multiple[index] = value
+            numbers = [x for x in value if x is not None]
+            self._values[index] = float(sum(numbers)) / len(numbers) if numbers else NAN
+        else:
+            self._multiple.pop(index, None)
+            self._values[index] = NAN if value is None else value
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'MetricSeries(%r)' % list(self)
+
+    def append(self, value):
+        if isinstance(value, list):
+            self._values.append(NAN)
+            self[len(self) - 1] = value
+        else:
+            self._values.append(NAN if value is None else value)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def truncate(self, length):
+        """
+        Drop the values after the first length ones
+        """
+        del self._values[length:]
+        for index in [index for index in self._multiple if index >= length]:
+            del self._multiple[index]
+
+    def min_max(self, start=0, stop=None):
+        """
+        Returns (min, max) of the values in [start:stop] (the mean for the
+        epochs which got several), or (None, None) if they're all missing
+        """
+        values = np.frombuffer(self._values, dtype=np.float64)[start:stop] if len(self) else np.empty(0)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None, None
+        return float(values.min()), float(values.max())
+
+    def to_array(self):
+        """
+        Returns a copy of the values as a np.ndarray of float64 (None is NaN)
+        """
+        return np.frombuffer(self._values, dtype=np.float64).copy() if len(self) else np.empty(0)
+
+
+def combine_min_max(a, b):
+    """
+    Returns the (min, max) of two (min, max) pairs from MetricSeries.min_max()
+    """
+    if a[0] is None:
+        return b
+    if b[0] is None:
+        return a
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+def minmax_decimation(length, series, max_buckets):
+    """
+    Returns the indices of the points to draw, so that no more than about
+    2 * max_buckets points are drawn for each series
+
+    The points are split into max_buckets buckets, and the minimum and
+    maximum of each series are kept in each bucket (as well as the first
+    and last points), so spikes aren't lost like with a stride. The series
+    share the indices, since they share their x values
+
+    Arguments:
+    length -- the number of points
+    series -- a list of np.ndarrays of float64 (NaN for missing values)
+    max_buckets -- the number of buckets
+    """
+    if length <= 2 * max_buckets:
+        return np.arange(length)
+    bucket_size = -(-length // max_buckets)
+    n_buckets = -(-length // bucket_size)
+    keep = np.zeros(length, dtype=bool)
+    keep[[0, -1]] = True
+    rows = np.arange(n_buckets) * bucket_size
+    for values in series:
+        padded = np.full(n_buckets * bucket_size, np.nan)
+        n = min(len(values), length)
+        padded[:n] = values[:n]
+        padded = padded.reshape(n_buckets, bucket_size)
+        missing = np.isnan(padded)
+        for find, fill in (np.argmin, np.inf), (np.argmax, -np.inf):
+            indices = rows + find(np.where(missing, fill, padded), axis=1)
+            keep[indices[indices < length]] = True
+    return np.flatnonzero(keep)
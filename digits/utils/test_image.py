@@ -1,6 +1,7 @@
 # Copyright (c) 2014-2017, NVIDIA CORPORATION.  All rights reserved.
 from __future__ import absolute_import
 
+import math
 import os
 import tempfile
 
@@ -14,6 +15,7 @@ import mock
 from nose.tools import assert_raises
 import numpy as np
 import PIL.Image
+import scipy.misc
 
 from . import errors
 from . import image as image_utils
@@ -100,6 +102,31 @@ class TestLoadImage():
         img = image_utils.load_image('http://some-url')
         assert img is not None
 
+    def test_size_hint(self):
+        for args in [
+                # file extension, size hint (height, width), loaded size (width, height)
+                ('jpg', None, (400, 300)),
+                ('jpg', (300, 400), (400, 300)),
+                ('jpg', (150, 200), (200, 150)),
+                ('jpg', (100, 100), (200, 150)),
+                ('jpg', (30, 40), (50, 38)),
+                ('jpg', (1, 1), (50, 38)),
+                ('png', (30, 40), (400, 300)),
+        ]:
+            yield self.check_size_hint, args
+
+    def check_size_hint(self, args):
+        suffix, size_hint, size = args
+        orig = PIL.Image.new('RGB', (400, 300), (127, 127, 127))
+        tmp = tempfile.mkstemp(suffix='.' + suffix)
+        try:
+            os.close(tmp[0])
+            orig.save(tmp[1])
+            new = image_utils.load_image(tmp[1], size_hint=size_hint)
+        finally:
+            os.remove(tmp[1])
+        assert new.size == size, 'Image size should be %s, not %s\nargs - %s' % (size, new.size, args)
+
     def test_corrupted_file(self):
         image = PIL.Image.fromarray(np.zeros((10, 10, 3), dtype=np.uint8))
 
@@ -194,3 +221,100 @@ class TestResizeImage():
         resize_mode=%s
         image_type=%s
         shape=%s""" % args
+
+    def test_matches_imresize(self):
+        for t in ['gray', 'color']:
+            for h, w in [(5, 5), (15, 7), (20, 30)]:
+                yield self.check_matches_imresize, t, h, w
+
+    def check_matches_imresize(self, t, h, w):
+        if t == 'gray':
+            i = self.np_gray
+        else:
+            i = self.np_color
+        expected = scipy.misc.imresize(i, (h, w), interp='bilinear')
+        assert np.array_equal(image_utils.resize_image(i, h, w), expected)
+        assert np.array_equal(image_utils.resize_image(PIL.Image.fromarray(i), h, w), expected)
+
+    def test_fill_autodetect_channels(self):
+        for m in ['fill', 'half_crop']:
+            yield self.check_fill_autodetect_channels, m
+
+    def check_fill_autodetect_channels(self, m):
+        r = image_utils.resize_image(self.np_color, 6, 12, resize_mode=m)
+        assert r.shape == (6, 12, 3), r.shape
+
+    def test_undecoded_jpeg(self):
+        f = tempfile.mkstemp(suffix='.jpg')
+        try:
+            os.close(f[0])
+            PIL.Image.fromarray(np.random.randint(0, 255, (300, 400, 3)).astype('uint8')).save(f[1])
+            for m in ['squash', 'crop', 'fill', 'half_crop']:
+                r = image_utils.resize_image(PIL.Image.open(f[1]), 30, 35, 3, m)
+                assert r.shape == (30, 35, 3), r.shape
+        finally:
+            os.remove(f[1])
+
+
+class TestUpscale():
+
+    def reference_upscale(self, image, ratio):
+        # the original pixel-by-pixel implementation
+        width = int(math.floor(image.shape[1] * ratio))
+        height = int(math.floor(image.shape[0] * ratio))
+        out = np.ndarray((height, width, image.shape[2]), dtype=np.uint8)
+        for x, y in np.ndindex((width, height)):
+            out[y, x] = image[int(math.floor(y / ratio)), int(math.floor(x / ratio))]
+        return out
+
+    def test_identical(self):
+        for shape in [(1, 1, 3), (7, 5, 3), (10, 33, 3), (4, 4, 1)]:
+            for ratio in [1, 1.5, 2, 100 / 7.0, 33.3]:
+                yield self.check_identical, shape, ratio
+
+    def check_identical(self, shape, ratio):
+        image = np.random.randint(0, 255, shape).astype('uint8')
+        expected = self.reference_upscale(image, ratio)
+        r = image_utils.upscale(image, ratio)
+        assert r.dtype == np.uint8
+        assert r.shape == expected.shape, '%s != %s' % (r.shape, expected.shape)
+        assert np.array_equal(r, expected)
+
+    def test_batch(self):
+        images = np.random.randint(0, 255, (3, 6, 9, 3)).astype('uint8')
+        r = image_utils.upscale_images(images, 2.5)
+        assert r.shape == (3, 15, 22, 3), r.shape
+        for i in xrange(3):
+            assert np.array_equal(r[i], self.reference_upscale(images[i], 2.5))
+
+    def test_bad_ratio(self):
+        assert_raises(ValueError, image_utils.upscale, np.zeros((2, 2, 3), dtype='uint8'), 0.5)
+
+
+class TestResizeImages():
+
+    def test_shape(self):
+        images = [
+            np.random.randint(0, 255, (10, 12)).astype('uint8'),
+            PIL.Image.fromarray(np.random.randint(0, 255, (7, 5, 3)).astype('uint8')),
+        ]
+        for c in [1, 3]:
+            r = image_utils.resize_images(images, 6, 8, c, 'crop')
+            assert r.shape == (2, 6, 8, c), r.shape
+            for i, image in enumerate(images):
+                expected = image_utils.resize_image(image, 6, 8, c, 'crop')
+                assert np.array_equal(r[i], expected.reshape((6, 8, c)))
+
+    def test_out(self):
+        out = np.zeros((1, 4, 4, 3), dtype=np.uint8)
+        r = image_utils.resize_images([np.ones((8, 8, 3), dtype=np.uint8)], 4, 4, 3, out=out)
+        assert r is out
+        assert (out == 1).all()
+
+    def test_bad_out(self):
+        assert_raises(
+            ValueError,
+            image_utils.resize_images,
+            [np.ones((8, 8, 3), dtype=np.uint8)], 4, 4, 3,
+            out=np.zeros((1, 4, 4, 1), dtype=np.uint8),
+        )
@@ -0,0 +1,92 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import time
+
+from nose.tools import assert_raises
+import numpy as np
+import PIL.Image
+
+from . import errors
+from . import image as image_utils
+from . import image_cache
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestImageCache():
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = image_cache.ImageCache(os.path.join(self.dir, 'cache'))
+        self.image_path = os.path.join(self.dir, 'image.png')
+        self.array = np.random.randint(0, 255, (20, 30, 3)).astype(np.uint8)
+        PIL.Image.fromarray(self.array).save(self.image_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_bad_size(self):
+        assert_raises(ValueError, image_cache.ImageCache, self.dir, max_size=0)
+
+    def test_miss_then_hit(self):
+        for resize_mode in 'squash', 'crop', 'half_crop':
+            yield self.check_miss_then_hit, resize_mode
+
+    def check_miss_then_hit(self, resize_mode):
+        expected = image_utils.resize_image(image_utils.load_image(self.image_path),
+                                            10, 12, channels=3, resize_mode=resize_mode)
+        first = self.cache.load(self.image_path, 10, 12, channels=3, resize_mode=resize_mode)
+        second = self.cache.load(self.image_path, 10, 12, channels=3, resize_mode=resize_mode)
+        assert np.array_equal(first, expected)
+        assert np.array_equal(second, expected)
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+        assert self.cache.hit_rate() == 0.5
+
+    def test_key(self):
+        key = self.cache.key(self.image_path, 10, 10, 3, None)
+        assert key == self.cache.key(self.image_path, 10, 10, 3, 'squash')
+        assert key != self.cache.key(self.image_path, 10, 10, 3, 'crop')
+        assert key != self.cache.key(self.image_path, 10, 10, 1, None)
+        assert key != self.cache.key(self.image_path, 10, 12, 3, None)
+
+        # a modified file gets a different key
+        PIL.Image.fromarray(self.array[:10]).save(self.image_path)
+        os.utime(self.image_path, (0, 0))
+        assert key != self.cache.key(self.image_path, 10, 10, 3, None)
+
+    def test_uncacheable(self):
+        assert self.cache.key('http://not-a-url', 10, 10) is None
+        assert self.cache.key('/tmp/not-a-file', 10, 10) is None
+        assert_raises(errors.LoadImageError, self.cache.load, '/tmp/not-a-file', 10, 10)
+
+    def test_corrupt_entry(self):
+        key = self.cache.key(self.image_path, 10, 10, 3)
+        self.cache.put(key, np.zeros((10, 10, 3), np.uint8))
+        with open(self.cache._filename(key), 'wb') as outfile:
+            outfile.write('garbage')
+        assert self.cache.get(key) is None
+        assert not os.path.exists(self.cache._filename(key))
+
+    def test_eviction(self):
+        entry = np.zeros((32, 32, 3), np.uint8)
+        # room for about 3 entries
+        cache = image_cache.ImageCache(os.path.join(self.dir, 'small'),
+                                       max_size=int(3.5 * entry.nbytes))
+        keys = ['%040x' % i for i in xrange(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, entry)
+            os.utime(cache._filename(key), (i, i))
+        # use the oldest entry again
+        assert cache.get(keys[0]) is not None
+        time.sleep(0.01)
+
+        cache.put('%040x' % 3, entry)
+        assert cache.size() <= cache.max_size
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
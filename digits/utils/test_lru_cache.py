@@ -0,0 +1,61 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+from nose.tools import assert_raises
+
+from . import lru_cache
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestLRUCache():
+
+    def setUp(self):
+        self.cache = lru_cache.LRUCache(10)
+        self.loads = []
+
+    def get(self, key, size):
+        def load():
+            self.loads.append(key)
+            return key.upper()
+        return self.cache.get(key, load, lambda value: size)
+
+    def test_bad_size(self):
+        assert_raises(ValueError, lru_cache.LRUCache, 0)
+
+    def test_miss_then_hit(self):
+        assert self.get('a', 3) == 'A'
+        assert self.get('a', 3) == 'A'
+        assert self.loads == ['a']
+        stats = self.cache.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+        assert stats['size'] == 3
+
+    def test_evict_least_recently_used(self):
+        self.get('a', 4)
+        self.get('b', 4)
+        # touch 'a' so that 'b' is evicted first
+        self.get('a', 4)
+        self.get('c', 4)
+        assert 'a' in self.cache
+        assert 'b' not in self.cache
+        assert 'c' in self.cache
+        assert self.cache.size() == 8
+        assert self.cache.stats()['evictions'] == 1
+
+    def test_keep_oversized_entry(self):
+        self.get('a', 4)
+        self.get('b', 20)
+        assert len(self.cache) == 1
+        assert 'b' in self.cache
+        self.get('b', 20)
+        assert self.loads == ['a', 'b']
+
+    def test_remove(self):
+        self.get('a', 4)
+        self.cache.remove('a')
+        self.cache.remove('missing')
+        assert len(self.cache) == 0
+        assert self.cache.size() == 0
@@ -0,0 +1,71 @@
+# Copyright (c) 2017, NVIDIA CORPORATION.  All rights reserved.
+from __future__ import absolute_import
+
+import pickle
+
+from nose.tools import assert_raises
+import numpy as np
+
+from . import metric_series
+from digits import test_utils
+
+
+test_utils.skipIfNotFramework('none')
+
+
+class TestMetricSeries():
+
+    def test_like_a_list(self):
+        series = metric_series.MetricSeries([1.0, None])
+        series.append(0.5)
+        series[-1] = [series[-1], 1.5]
+        assert series == [1.0, None, [0.5, 1.5]]
+        assert series[1:] == [None, [0.5, 1.5]]
+        assert len(series) == 3
+        values = series.to_array()
+        assert values[[0, 2]].tolist() == [1.0, 1.0] and np.isnan(values[1])
+
+        series[1] = 2.0
+        assert list(series) == [1.0, 2.0, [0.5, 1.5]]
+
+    def test_replace_end(self):
+        series = metric_series.MetricSeries([1.0, 2.0, [3.0, 4.0]])
+        series[1:] = [5.0]
+        assert series == [1.0, 5.0]
+        assert_raises(ValueError, series.__setitem__, slice(0, 1), [0.0])
+
+    def test_min_max(self):
+        series = metric_series.MetricSeries([3.0, None, [1.0, 2.0], 5.0])
+        assert series.min_max() == (1.5, 5.0)
+        assert series.min_max(1, 2) == (None, None)
+        assert metric_series.combine_min_max((None, None), (1.0, 2.0)) == (1.0, 2.0)
+        assert metric_series.combine_min_max((0.0, 1.0), (1.0, 2.0)) == (0.0, 2.0)
+
+    def test_pickle(self):
+        series = metric_series.MetricSeries([1.0, None, [2.0, 3.0]])
+        for protocol in 0, pickle.HIGHEST_PROTOCOL:
+            assert pickle.loads(pickle.dumps(series, protocol)) == series
+
+
+class TestMinMaxDecimation():
+
+    def test_short(self):
+        indices = metric_series.minmax_decimation(10, [np.zeros(10)], 5)
+        assert indices.tolist() == range(10)
+
+    def test_keeps_extremes(self):
+        values = np.zeros(1000)
+        values[123] = 10
+        values[456] = -10
+        values[789] = np.nan
+        indices = metric_series.minmax_decimation(1000, [values], 10)
+        assert len(indices) <= 2 * 10 + 2
+        assert 123 in indices and 456 in indices
+        assert indices[0] == 0 and indices[-1] == 999
+
+    def test_shared_indices(self):
+        # a shorter series (its last values haven't arrived) and an empty one
+        indices = metric_series.minmax_decimation(
+            1000, [np.arange(1000.0), -np.arange(900.0), np.empty(0)], 10)
+        assert indices.max() == 999
+        assert len(indices) <= 2 * 2 * 10 + 2
@@ -15,7 +15,7 @@ import werkzeug.exceptions
 from .config import config_value
 from .webapp import app, socketio, scheduler
 import digits
-from digits import dataset, extensions, model, utils, pretrained_model
+from digits import dataset, extensions, job_index, model, utils, pretrained_model
 from digits.log import logger
 from digits.utils.routing import request_wants_json
 
@@ -35,12 +35,12 @@ def home(tab=2):
             models: [{id, name, status},...]
         }
     """
-    running_datasets = get_job_list(dataset.DatasetJob, True)
-    completed_datasets = get_job_list(dataset.DatasetJob, False)
-    running_models = get_job_list(model.ModelJob, True)
-    completed_models = get_job_list(model.ModelJob, False)
-
     if request_wants_json():
+        running_datasets = get_job_list(dataset.DatasetJob, True)
+        completed_datasets = get_job_list(dataset.DatasetJob, False)
+        running_models = get_job_list(model.ModelJob, True)
+        completed_models = get_job_list(model.ModelJob, False)
+
         data = {
             'version': digits.__version__,
             'jobs_dir': config_value('jobs_dir'),
@@ -127,11 +127,7 @@ def home(tab=2):
             'home.html',
             tab=tab,
             new_dataset_options=new_dataset_options,
-            running_datasets=running_datasets,
-            completed_datasets=completed_datasets,
             new_model_options=new_model_options,
-            running_models=running_models,
-            completed_models=completed_models,
             load_model_options=load_model_options,
             total_gpu_count=len(scheduler.resources['gpus']),
             remaining_gpu_count=sum(r.remaining()
@@ -140,82 +136,12 @@ def home(tab=2):
 
 
 def json_dict(job, model_output_fields):
-    d = {
-        'id': job.id(),
-        'name': job.name(),
-        'group': job.group,
-        'status': job.status_of_tasks().name,
-        'status_css': job.status_of_tasks().css,
-        'submitted': job.status_history[0][1],
-        'elapsed': job.runtime_of_tasks(),
-    }
-
-    if 'train_db_task' in dir(job):
-        d.update({
-            'backend': job.train_db_task().backend,
-        })
-
-    if 'train_task' in dir(job):
-        d.update({
-            'framework': job.train_task().get_framework_id(),
-        })
-
-        for prefix, outputs in (('train', job.train_task().train_outputs),
-                                ('val', job.train_task().val_outputs)):
-            for key in outputs.keys():
-                data = outputs[key].data
-                if len(data) > 0:
-                    key = '%s (%s) ' % (key, prefix)
-                    model_output_fields.add(key + 'last')
-                    model_output_fields.add(key + 'min')
-                    model_output_fields.add(key + 'max')
-                    d.update({key + 'last': data[-1]})
-                    d.update({key + 'min': min(data)})
-                    d.update({key + 'max': max(data)})
-
-        if (job.train_task().combined_graph_data() and
-                'columns' in job.train_task().combined_graph_data()):
-            d.update({
-                'sparkline': job.train_task().combined_graph_data()['columns'][0][1:],
-            })
-
-    if 'get_progress' in dir(job):
-        d.update({
-            'progress': int(round(100 * job.get_progress())),
-        })
-
-    if hasattr(job, 'dataset_id'):
-        d.update({
-            'dataset_id': job.dataset_id,
-        })
-
-    if hasattr(job, 'extension_id'):
-        d.update({
-            'extension': job.extension_id,
-        })
-    else:
-        if hasattr(job, 'dataset_id'):
-            ds = scheduler.get_job(job.dataset_id)
-            if ds and hasattr(ds, 'extension_id'):
-                d.update({
-                    'extension': ds.extension_id,
-                })
-
-    if isinstance(job, dataset.DatasetJob):
-        d.update({'type': 'dataset'})
-
-    if isinstance(job, model.ModelJob):
-        d.update({'type': 'model'})
-
-    if isinstance(job, pretrained_model.PretrainedModelJob):
-        model_output_fields.add("has_labels")
-        model_output_fields.add("username")
-        d.update({
-            'type': 'pretrained_model',
-            'framework': job.framework,
-            'username': job.username,
-            'has_labels': job.has_labels_file()
-        })
+    """
+    Returns the row of a job in the job listings,
+    and adds its metric columns to model_output_fields
+    """
+    d, output_fields = job_index.summarize(job, scheduler.get_job)
+    model_output_fields.update(output_fields)
     return d
 
 
@@ -224,28 +150,92 @@ def completed_jobs():
     """
     Returns JSON
         {
+            running: [{id, name, group, status, status_css, submitted, elapsed, badge}],
             datasets: [{id, name, group, status, status_css, submitted, elapsed, badge}],
             models:   [{id, name, group, status, status_css, submitted, elapsed, badge}],
+            pretrained_models: [{id, name, group, status, status_css, submitted, elapsed, badge}],
+            model_output_fields: [field],
+            totals: {running, datasets, models, pretrained_models},
         }
-    """
-    completed_datasets = get_job_list(dataset.DatasetJob, False)
-    completed_models = get_job_list(model.ModelJob, False)
-    running_datasets = get_job_list(dataset.DatasetJob, True)
-    running_models = get_job_list(model.ModelJob, True)
-    pretrained_models = get_job_list(pretrained_model.PretrainedModelJob, False)
+
+    The jobs come from the job index. The optional arguments apply to each list:
+        sort -- name, submitted (default), updated, status, group, username or type
+        order -- desc (default) or asc
+        offset, limit -- for pagination, totals has the number of jobs before it
+        status, group, username -- only jobs with this value
+        name -- only jobs whose name contains this
+    """
+    sort = flask.request.args.get('sort', 'submitted')
+    if sort not in job_index.JobIndex.SORT_COLUMNS:
+        raise werkzeug.exceptions.BadRequest('Invalid sort "%s"' % sort)
+    order = flask.request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise werkzeug.exceptions.BadRequest('Invalid order "%s"' % order)
+    try:
+        offset = flask.request.args.get('offset', 0, type=int)
+        limit = flask.request.args.get('limit', None, type=int)
+    except ValueError:
+        raise werkzeug.exceptions.BadRequest('Invalid offset or limit')
+    filters = dict((key, flask.request.args[key])
+                   for key in ('status', 'group', 'username', 'name')
+                   if key in flask.request.args)
+
+    def list_jobs(kinds, running):
+        # merge the kinds (running datasets and models are listed together)
+        total = 0
+        entries = []
+        for kind in kinds:
+            n, e = scheduler.job_index.list(
+                kind=kind,
+                running=running,
+                sort=sort,
+                descending=(order == 'desc'),
+                limit=None if limit is None else offset + limit,
+                **filters)
+            total += n
+            entries += e
+        if len(kinds) > 1:
+            entries.sort(key=lambda entry: (entry[sort], entry['id']), reverse=(order == 'desc'))
+        entries = entries[offset:] if limit is None else entries[offset:offset + limit]
+
+        rows = []
+        for entry in entries:
+            if running:
+                # elapsed time and progress change all the time
+                job = scheduler.get_job(entry['id'])
+                if job is None:
+                    continue
+                row, output_fields = job_index.summarize(job, scheduler.get_job)
+            else:
+                row, output_fields = entry['summary'], entry['output_fields']
+            model_output_fields.update(output_fields)
+            rows.append(row)
+        return total, rows
 
     model_output_fields = set()
-    data = {
-        'running': [json_dict(j, model_output_fields) for j in running_datasets + running_models],
-        'datasets': [json_dict(j, model_output_fields) for j in completed_datasets],
-        'models': [json_dict(j, model_output_fields) for j in completed_models],
-        'pretrained_models': [json_dict(j, model_output_fields) for j in pretrained_models],
-        'model_output_fields': sorted(list(model_output_fields)),
-    }
+    data = {'totals': {}}
+    for key, kinds, running in (
+            ('running', ['dataset', 'model'], True),
+            ('datasets', ['dataset'], False),
+            ('models', ['model'], False),
+            ('pretrained_models', ['pretrained_model'], False)):
+        data['totals'][key], data[key] = list_jobs(kinds, running)
+    data['model_output_fields'] = sorted(list(model_output_fields))
 
     return flask.jsonify(data)
 
 
+@blueprint.route('/scheduler/stats.json', methods=['GET'])
+def scheduler_stats():
+    """
+    Return statistics about the scheduling of tasks
+
+    Returns JSON:
+        {tasks_started, active_jobs, latency_p50, latency_p99}
+    """
+    return flask.jsonify(scheduler.scheduling_stats())
+
+
 @blueprint.route('/jobs/<job_id>/table_data.json', methods=['GET'])
 def job_table_data(job_id):
     """
@@ -297,6 +287,7 @@ def group():
                 job.form_data['form.group_name.data'] = job.group
 
             job.emit_attribute_changed('group', job.group)
+            scheduler.job_index.update(job)
 
         except Exception as e:
             error.append(e)
@@ -421,6 +412,8 @@ def edit_job(job_id):
         job._notes = notes
         logger.info('Updated notes.', job_id=job.id())
 
+    scheduler.job_index.update(job)
+
     return '%s updated.' % job.job_type()
 
 